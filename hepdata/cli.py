@@ -35,9 +35,9 @@ from hepdata.modules.converter.tasks import convert_and_store
 from hepdata.modules.records.utils.common import record_exists
 from hepdata.modules.submission.models import HEPSubmission
 from .factory import create_app
-from hepdata.config import CFG_PUB_TYPE
+from hepdata.config import CFG_PUB_TYPE, CFG_REINDEX_CHECKPOINT_FILE
 from hepdata.ext.elasticsearch.api import reindex_all, get_records_matching_field
-from hepdata.modules.records.utils.submission import unload_submission
+from hepdata.modules.records.utils.submission import unload_submissions
 from hepdata.modules.records.migrator.api import load_files, update_submissions, get_all_ids_in_current_system, \
     add_or_update_records_since_date, update_analyses
 
@@ -86,7 +86,13 @@ def populate(inspireids, recreate_index, tweet, convert):
               type=bool,
               help='This option will automatically find the inspire ids in the current '
                    'hepdata but not in this version and migrate them.')
-def migrate(start, end, date=None, missing_only=False):
+@click.option('--pipeline', '-p', default=False, type=bool,
+              help='Whether to migrate records concurrently in this process rather than through celery.')
+@click.option('--workers', '-w', default=4, type=int,
+              help='Number of concurrent downloads from the legacy site and from INSPIRE when using the pipeline.')
+@click.option('--retry-failed', '-r', default=True, type=bool,
+              help='Whether the pipeline retries records which failed to migrate previously.')
+def migrate(start, end, date=None, missing_only=False, pipeline=False, workers=4, retry_failed=True):
     """
     Migrates all content from HEPData
     :return:
@@ -103,7 +109,11 @@ def migrate(start, end, date=None, missing_only=False):
         print("Sliced, going to load {} records.".format(len(inspire_ids)))
         print(inspire_ids)
 
-    load_files(inspire_ids)
+    if pipeline:
+        from hepdata.modules.records.migrator.pipeline import migrate_files
+        migrate_files(inspire_ids, network_workers=workers, retry_failed=retry_failed)
+    else:
+        load_files(inspire_ids)
 
 
 @cli.command()
@@ -185,8 +195,18 @@ def get_missing_records():
               help='End recid for the index operation.')
 @click.option('--batch', '-b', type=int, default=50,
               help='Number of records to index at a time.')
-def reindex(recreate, start, end, batch):
-    reindex_all(recreate=recreate, start=start, end=end, batch=batch)
+@click.option('--workers', '-w', type=int, default=4,
+              help='Number of batches to index concurrently.')
+@click.option('--resume', '-r', type=bool, default=False,
+              help='Whether or not to continue an interrupted reindex from its checkpoint.')
+def reindex(recreate, start, end, batch, workers, resume):
+    """
+    Indexes all the records. Progress is saved as batches complete, so an
+    interrupted reindex can be continued by running it again with --resume True.
+    """
+    reindex_all(recreate=recreate, start=start, end=end, batch=batch,
+                workers=workers, resume=resume,
+                checkpoint_file=CFG_REINDEX_CHECKPOINT_FILE)
 
 
 @cli.command()
@@ -238,9 +258,9 @@ def unload(recids):
     do_unload(processed_record_ids)
 
 
-def do_unload(records_to_unload):
-    for record_id in records_to_unload:
-        unload_submission(record_id)
+def do_unload(records_to_unload, batch=100):
+    for start in range(0, len(records_to_unload), batch):
+        unload_submissions(records_to_unload[start:start + batch])
 
 
 @cli.command()
@@ -286,8 +306,11 @@ def submissions():
 
 @submissions.command(name="reindex")
 @with_appcontext
-def reindex():
+@click.option('--batch', '-b', type=int, default=500,
+              help='Number of submissions indexed per bulk request.')
+def reindex(batch):
     """Reindexes HEPSubmissions and adds to the submission index"""
 
     admin_idx = AdminIndexer()
-    admin_idx.reindex(recreate=True)
+    indexed = admin_idx.reindex(recreate=True, batch=batch)
+    print('Indexed {0} submissions.'.format(indexed))
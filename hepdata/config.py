@@ -76,6 +76,10 @@ CELERYBEAT_SCHEDULE = {
         'task': 'invenio_trends.tasks.update_trends',
         'schedule': timedelta(hours=24)
     },
+    'flush-access-statistics': {
+        'task': 'hepdata.modules.stats.tasks.flush_access_statistics',
+        'schedule': timedelta(minutes=1)
+    },
 }
 
 # Cache
@@ -83,6 +87,24 @@ CACHE_KEY_PREFIX = "cache::"
 CACHE_REDIS_URL = "redis://localhost:6379/0"
 CACHE_TYPE = "redis"
 
+# Number of seconds search results are cached for. The cache is kept in
+# the CACHE_REDIS_URL instance, or in each process if Redis is unavailable.
+SEARCH_CACHE_TIMEOUT = 300
+
+# Number of seconds the pages of finalised records rendered for anonymous
+# users are cached for. The cache is dropped whenever a record is finalised.
+RECORD_CACHE_TIMEOUT = 600
+
+# INSPIRE records are fetched from INSPIRE_RECORD_URL, waiting up to
+# INSPIRE_TIMEOUT seconds. Responses are reused for INSPIRE_CACHE_TTL seconds,
+# then revalidated, and kept for up to INSPIRE_CACHE_MAX_AGE seconds. Without
+# Redis, each process holds at most INSPIRE_CACHE_SIZE responses in memory.
+INSPIRE_RECORD_URL = 'http://inspirehep.net/record/{0}/export/xm'
+INSPIRE_TIMEOUT = 30
+INSPIRE_CACHE_TTL = 24 * 3600
+INSPIRE_CACHE_MAX_AGE = 30 * 24 * 3600
+INSPIRE_CACHE_SIZE = 1024
+
 # Session
 SESSION_REDIS = "redis://localhost:6379/0"
 
@@ -142,6 +164,45 @@ CFG_SUPPORTED_FORMATS = ['yaml', 'root', 'csv', 'yoda']
 CFG_TMPDIR = tempfile.gettempdir()
 CFG_DATADIR = tempfile.gettempdir()
 
+# Maximum number of compiled data tables held in memory by each web worker.
+CFG_TABLE_CACHE_SIZE = 64
+
+# Progress of `hepdata reindex`, so an interrupted reindex can be resumed.
+CFG_REINDEX_CHECKPOINT_FILE = os.path.join(CFG_TMPDIR, 'hepdata_reindex_checkpoint.json')
+
+# Outcome of each record migrated by `hepdata migrate --pipeline`,
+# so an interrupted migration can be resumed.
+CFG_MIGRATION_LEDGER_FILE = os.path.join(CFG_TMPDIR, 'hepdata_migration_ledger.json')
+
+# ETag, Last-Modified date and content hash of each record loaded from the
+# legacy site, so that updates skip records which have not changed.
+# Downloads wait up to CFG_MIGRATION_DOWNLOAD_TIMEOUT seconds and are
+# retried CFG_MIGRATION_DOWNLOAD_RETRIES times.
+CFG_MIGRATION_MANIFEST_FILE = os.path.join(CFG_DATADIR, 'hepdata_migration_manifest.json')
+CFG_MIGRATION_DOWNLOAD_TIMEOUT = 60
+CFG_MIGRATION_DOWNLOAD_RETRIES = 3
+
+# Legacy YAML files larger than CFG_YAML_SPLIT_BOUNDED_SIZE bytes are split
+# writing CFG_YAML_SPLIT_CHUNK_SIZE values of a table at a time.
+CFG_YAML_SPLIT_BOUNDED_SIZE = 50 * 1024 ** 2
+CFG_YAML_SPLIT_CHUNK_SIZE = 5000
+
+# Converted submissions and tables, keyed on the content they were converted
+# from. The least recently used files are removed above CFG_CONVERSION_CACHE_SIZE bytes.
+CFG_CONVERSION_CACHE_DIR = os.path.join(CFG_DATADIR, 'converted')
+CFG_CONVERSION_CACHE_SIZE = 5 * 1024 ** 3
+
+# Parsed versions of the data files, written when they are uploaded so the
+# YAML files do not need to be parsed again to be displayed.
+CFG_PARSED_DATA_DIR = os.path.join(CFG_DATADIR, 'parsed')
+
+# Number of processes validating the data files of an upload concurrently.
+CFG_VALIDATION_PROCESSES = 4
+
+# Record accesses are buffered and written to the database at most every
+# STATS_FLUSH_INTERVAL seconds by each process (and every minute by celery beat).
+STATS_FLUSH_INTERVAL = 60
+
 MAIL_SERVER = 'mail.smtp2go.com'
 MAIL_PORT = 2525
 MAIL_DEFAULT_SENDER = 'submissions@hepdata.net'
@@ -23,18 +23,62 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 import logging
+import os
 
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
 from elasticsearch_dsl import DocType, String, Date, Integer, Nested, InnerObjectWrapper, Q, Index, Search
 from elasticsearch_dsl.connections import connections
 from flask import current_app
+from invenio_db import db
+from sqlalchemy import func
 
-from hepdata.modules.records.utils.common import get_record_by_id, get_record_contents
-from hepdata.modules.submission.models import HEPSubmission, DataSubmission
+from hepdata.config import CFG_PUB_TYPE
+from hepdata.ext.elasticsearch.api import fetch_records
+from hepdata.modules.permissions.models import SubmissionParticipant
+from hepdata.modules.records.utils.common import get_record_by_id, get_record_contents, get_records_by_ids
+from hepdata.modules.submission.models import HEPSubmission, DataSubmission, submission_participant_link
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+_client = None
+
+
+def get_admin_client():
+    """
+    Returns the Elasticsearch client of this process, creating it on first
+    use. Clients hold a pool of connections, so one is shared by every
+    AdminIndexer rather than each creating its own. A forked worker
+    creates its own client rather than using its parent's connections.
+    :return: Elasticsearch instance
+    """
+    global _client
+    if _client is None or _client[0] != os.getpid():
+        _client = (os.getpid(), Elasticsearch(hosts=current_app.config['SEARCH_ELASTIC_HOSTS']))
+    return _client[1]
+
+
+def get_submission_document(submission, record_information, data_count, participants):
+    """
+    :param submission: HEPSubmission
+    :param record_information: the publication record
+    :param data_count: number of data tables of this version of the submission
+    :param participants: list of SubmissionParticipant
+    :return: dict of the fields of the submission's entry in the index
+    """
+    return dict(title=record_information['title'],
+                collaboration=','.join(record_information.get('collaborations', [])),
+                recid=submission.publication_recid,
+                inspire_id=submission.inspire_id,
+                status=submission.overall_status,
+                data_count=data_count,
+                creation_date=submission.created,
+                last_updated=submission.last_updated,
+                version=submission.version,
+                participants=[{'full_name': participant.full_name, 'role': participant.role}
+                              for participant in participants])
+
 
 class ESSubmissionParticipant(InnerObjectWrapper):
     pass
@@ -83,8 +127,7 @@ class ESSubmission(DocType):
 
 class AdminIndexer:
     def __init__(self, *args, **kwargs):
-        self.client = Elasticsearch(
-            hosts=current_app.config['SEARCH_ELASTIC_HOSTS']) if 'client' not in kwargs else kwargs.get('client')
+        self.client = kwargs['client'] if 'client' in kwargs else get_admin_client()
 
         self.index = kwargs.get('index', current_app.config['SUBMISSION_INDEX'])
 
@@ -144,42 +187,110 @@ class AdminIndexer:
 
         return delete_count, True
 
-    def index_submission(self, submission):
-        participants = []
+    def delete_submissions(self, recids):
+        """
+        Deletes the entries of several submissions with a bulk request.
+        Submissions are indexed under their publication recid.
+        :param recids: publication recids
+        :return: number of entries deleted
+        """
+        actions = ({
+            '_op_type': 'delete',
+            '_index': self.index,
+            '_type': ESSubmission._doc_type.name,
+            '_id': recid
+        } for recid in recids)
 
-        for sub_participant in submission.participants:
-            participants.append({'full_name': sub_participant.full_name, 'role': sub_participant.role})
+        deleted, errors = bulk(self.client, actions, raise_on_error=False)
+        for error in errors:
+            if error.get('delete', {}).get('status') != 404:
+                log.error(error)
 
+        return deleted
+
+    def index_submission(self, submission):
         record_information = get_record_contents(submission.publication_recid)
 
         data_count = DataSubmission.query.filter(DataSubmission.publication_recid == submission.publication_recid,
                                                  DataSubmission.version == submission.version).count()
 
         if record_information:
-            collaboration = ','.join(record_information.get('collaborations', []))
-
             self.add_to_index(_id=submission.publication_recid,
-                              title=record_information['title'],
-                              collaboration=collaboration,
-                              recid=submission.publication_recid,
-                              inspire_id=submission.inspire_id,
-                              status=submission.overall_status,
-                              data_count=data_count,
-                              creation_date=submission.created,
-                              last_updated=submission.last_updated,
-                              version=submission.version,
-                              participants=participants)
+                              **get_submission_document(submission, record_information, data_count,
+                                                        submission.participants))
 
     def reindex(self, *args, **kwargs):
-
+        """
+        Indexes every HEPSubmission with bulk requests. Submissions are read
+        batch by batch; the data table counts are computed up front with one
+        GROUP BY, and the participants and publication records of each batch
+        are fetched with one query and one multi-get.
+        :param recreate: whether to recreate the index first
+        :param batch: number of submissions per batch
+        """
         recreate = kwargs.get('recreate', False)
+        batch = kwargs.get('batch', 500)
         if recreate:
             self.recreate_index()
 
-        submissions = HEPSubmission.query.all()
+        data_counts = dict(((recid, version), count) for recid, version, count in db.session.query(
+            DataSubmission.publication_recid, DataSubmission.version, func.count(DataSubmission.id)).group_by(
+            DataSubmission.publication_recid, DataSubmission.version))
+
+        indexed = 0
+        submissions = []
+        for submission in HEPSubmission.query.order_by(HEPSubmission.id).yield_per(batch):
+            submissions.append(submission)
+            if len(submissions) == batch:
+                indexed += self.index_submissions(submissions, data_counts)
+                submissions = []
+        if submissions:
+            indexed += self.index_submissions(submissions, data_counts)
 
+        return indexed
+
+    def index_submissions(self, submissions, data_counts):
+        """
+        Indexes a batch of submissions with a single bulk request.
+        :param submissions: list of HEPSubmission
+        :param data_counts: dict of (publication recid, version) to number of data tables
+        :return: number of submissions indexed
+        """
+        participants = dict((submission.id, []) for submission in submissions)
+        for submission_id, participant in db.session.query(
+                submission_participant_link.c.rec_id, SubmissionParticipant).join(
+                SubmissionParticipant, SubmissionParticipant.id == submission_participant_link.c.participant_id).filter(
+                submission_participant_link.c.rec_id.in_(list(participants.keys()))):
+            participants[submission_id].append(participant)
+
+        # as get_record_contents, falling back to the database for records missing from the index.
+        recids = list(set(submission.publication_recid for submission in submissions))
+        records = fetch_records(recids, CFG_PUB_TYPE)
+        missing = [recid for recid in recids if recid not in records]
+        for record in get_records_by_ids(missing):
+            records[int(record['recid'])] = record
+
+        actions = []
         for submission in submissions:
-            self.index_submission(submission)
+            record_information = records.get(submission.publication_recid)
+            if not record_information:
+                continue
+
+            actions.append({
+                '_index': self.index,
+                '_type': ESSubmission._doc_type.name,
+                '_id': submission.publication_recid,
+                '_source': get_submission_document(
+                    submission, record_information,
+                    data_counts.get((submission.publication_recid, submission.version), 0),
+                    participants[submission.id])
+            })
+
+        indexed, errors = bulk(self.client, actions, raise_on_error=False)
+        for error in errors:
+            log.error(error)
+
+        return indexed
 
     def recreate_index(self):
         """ Delete and then create a given index and set a default mapping.
@@ -40,16 +40,23 @@ def parse_aggregations(aggregations):
         elif agg_name == 'collaboration':
             buckets = agg_res['buckets']
             facets.append(parse_collaboration_aggregations(buckets))
+            facets[-1]['has_more'] = has_more_buckets(agg_res)
         elif agg_name == 'dates':
             buckets = agg_res['buckets']
             facets.append(parse_date_aggregations(buckets))
         else:
             buckets = agg_res.get('buckets')
             facets.append(parse_other_facets(buckets, agg_name))
+            facets[-1]['has_more'] = has_more_buckets(agg_res)
 
     return [f for f in facets if f.get('vals')]
 
 
+def has_more_buckets(aggregation):
+    """ Whether a bounded terms aggregation left out some of its buckets. """
+    return aggregation.get('sum_other_doc_count', 0) > 0
+
+
 def parse_author_aggregations(buckets):
     for author_hit in buckets:
         author_hit['url_params'] = {'author': author_hit['key']}
@@ -17,31 +17,37 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 from __future__ import print_function
 
-from collections import defaultdict
+from itertools import chain
 
 from dateutil.parser import parse
 from flask import current_app
 from elasticsearch.exceptions import NotFoundError, RequestError
+from elasticsearch.helpers import bulk, scan
 from invenio_pidstore.models import RecordIdentifier
 from sqlalchemy import func
 
 from hepdata.ext.elasticsearch.document_enhancers import enhance_data_document, enhance_publication_document
-from .utils import prepare_author_for_indexing
+from .utils import prepare_author_for_indexing, collect_data_keywords
 from hepdata.config import CFG_PUB_TYPE, CFG_DATA_TYPE
 from query_builder import QueryBuilder, get_query_by_type, get_authors_query, HEPDataQueryParser
-from process_results import map_result, merge_results
+from process_results import map_result, merge_results, get_inner_hits
+from aggregations import parse_aggregations
 from invenio_db import db
 import logging
 
+from hepdata.utils.cache import SharedCache
+
 from invenio_search import current_search_client as es
 
-__all__ = ['search', 'index_record_ids', 'index_record_dict', 'fetch_record',
-           'recreate_index', 'get_record', 'reindex_all',
+__all__ = ['search', 'search_facet', 'index_record_ids', 'index_record_dict', 'fetch_record',
+           'fetch_records', 'recreate_index', 'get_record', 'reindex_all',
            'get_n_latest_records']
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+_search_cache = None
+
 
 def default_index(f):
     """ Loads the default index if none is given """
@@ -65,7 +71,8 @@ def search(query,
            offset=0,
            sort_field=None,
            sort_order='',
-           post_filter=None):
+           post_filter=None,
+           tables_per_publication=50):
     """ Perform a search query.
 
     :param query: [string] query string e.g. 'higgs boson'
@@ -80,6 +87,8 @@ def search(query,
     :param sort_order: [string] order of the sorting either original
                     (for a particular field) or reversed. Supported:
                     '' or 'rev'
+    :param tables_per_publication: [int] max number of matching data tables
+                    returned for each publication
 
     :return: [dict] dictionary with processed results and facets
     """
@@ -87,25 +96,24 @@ def search(query,
     if query == '' and not sort_field:
         sort_field = 'date'
 
-    query = HEPDataQueryParser.parse_query(query)
+    query = normalise_query(HEPDataQueryParser.parse_query(query))
 
-    # Build core query
-    data_query = get_query_by_type(CFG_DATA_TYPE, query)
-    pub_query = get_query_by_type(CFG_PUB_TYPE, query)
-    authors_query = get_authors_query(query)
+    search_cache = get_search_cache()
+    cache_key = search_cache.make_key(index, query, sorted(filters), size, include, exclude,
+                                      offset, sort_field, sort_order, post_filter,
+                                      tables_per_publication)
+    cached_result = search_cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result
 
-    query_builder = QueryBuilder()
-    query_builder.add_child_parent_relation(CFG_DATA_TYPE,
-                                            relation="child",
-                                            related_query=data_query,
-                                            other_queries=[pub_query,
-                                                           authors_query])
+    # The matching tables of each publication are returned as inner hits,
+    # so the publications and their tables are fetched in a single request.
+    query_builder = get_publication_query_builder(query, filters, post_filter,
+                                                  inner_hits={"size": tables_per_publication})
 
     # Add additional options
     query_builder.add_pagination(size=size, offset=offset)
     query_builder.add_sorting(sort_field=sort_field, sort_order=sort_order)
-    query_builder.add_filters(filters)
-    query_builder.add_post_filter(post_filter)
     query_builder.add_aggregations()
     query_builder.add_source_filter(include, exclude)
 
@@ -113,31 +121,102 @@ def search(query,
                            body=query_builder.query,
                            doc_type=CFG_PUB_TYPE)
 
-    parent_filter = {
-        "filtered": {
-            "filter": {
-                "terms": {
-                    "_id": [hit["_id"] for hit in pub_result['hits']['hits']]
-                }
-            }
-        }
-    }
+    merged_results = merge_results(pub_result, get_inner_hits(pub_result, CFG_DATA_TYPE))
+
+    result = map_result(merged_results)
+    search_cache.set(cache_key, result)
+
+    return result
+
+
+@default_index
+def search_facet(query, facet, index=None, filters=list(), post_filter=None):
+    """ Fetch every value of a single facet for a search query.
+    The facets returned by search() only contain the most frequent values.
+
+    :param query: [string] query string e.g. 'higgs boson'
+    :param facet: [string] name of the facet e.g. 'collaboration'
+    :param index: [string] name of the index. If None a default is used
+    :param filters: [list of tuples] list of filters for the query, as for search()
+
+    :return: [dict] dictionary with the facet, None if no publication
+             matches the query, and the total number of hits
+    """
+    from config.es_config import facet_aggregation
+    aggregation = facet_aggregation(facet)
+
+    query = normalise_query(HEPDataQueryParser.parse_query(query))
+
+    search_cache = get_search_cache()
+    cache_key = search_cache.make_key('facet_total', index, facet, query, sorted(filters), post_filter)
+    cached_result = search_cache.get(cache_key)
+    if cached_result is not None:
+        return cached_result
+
+    query_builder = get_publication_query_builder(query, filters, post_filter)
+    query_builder.add_pagination(size=0)
+    query_builder.add_aggregations(aggregation)
+
+    pub_result = es.search(index=index,
+                           body=query_builder.query,
+                           doc_type=CFG_PUB_TYPE)
+
+    facets = parse_aggregations(pub_result.get('aggregations', {}))
+    result = {'facet': facets[0] if facets else None,
+              'total': pub_result['hits']['total']}
+    search_cache.set(cache_key, result)
+
+    return result
+
+
+def get_publication_query_builder(query, filters, post_filter, inner_hits=None):
+    """ Build the core query matching publications either directly or
+    through one of their datatables.
+
+    :param query: [string] parsed query string
+    :param filters: [list of tuples] list of filters for the query
+    :param post_filter: [dict] filter applied after the aggregations
+    :param inner_hits: [dict] options of the inner hits of the matching
+                       datatables, or None to not return them
+    :return: [QueryBuilder]
+    """
+    data_query = get_query_by_type(CFG_DATA_TYPE, query)
+    pub_query = get_query_by_type(CFG_PUB_TYPE, query)
+    authors_query = get_authors_query(query)
 
     query_builder = QueryBuilder()
-    query_builder.add_child_parent_relation(CFG_PUB_TYPE,
-                                            relation="parent",
-                                            related_query=parent_filter,
-                                            must=True,
-                                            other_queries=[data_query])
-    query_builder.add_pagination(size=size * 50)
+    query_builder.add_child_parent_relation(CFG_DATA_TYPE,
+                                            relation="child",
+                                            related_query=data_query,
+                                            other_queries=[pub_query,
+                                                           authors_query],
+                                            inner_hits=inner_hits)
+    query_builder.add_filters(filters)
+    query_builder.add_post_filter(post_filter)
+
+    return query_builder
+
+
+def normalise_query(query):
+    """ Collapses the whitespace of a parsed query string, so that queries
+    which only differ by their spacing share a cache entry. """
+    return ' '.join(query.split())
 
-    data_result = es.search(index=index,
-                            body=query_builder.query,
-                            doc_type=CFG_DATA_TYPE)
 
-    merged_results = merge_results(pub_result, data_result)
+def get_search_cache():
+    """ Returns the cache of search results for this process,
+    creating it on first use. """
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SharedCache('search',
+                                    redis_url=current_app.config.get('CACHE_REDIS_URL'),
+                                    timeout=current_app.config.get('SEARCH_CACHE_TIMEOUT', 300))
+    return _search_cache
 
-    return map_result(merged_results)
+
+def invalidate_search_cache():
+    """ Drops all the cached search results, e.g. after the index changed. """
+    get_search_cache().invalidate()
 
 
 def search_authors(name, size=20):
@@ -162,8 +241,27 @@ def search_authors(name, size=20):
 
 
 @default_index
-def reindex_all(index=None, recreate=False, batch=50, start=-1, end=-1):
-    """ Recreate the index and add all the records from the db to ES. """
+def reindex_all(index=None, recreate=False, batch=50, start=-1, end=-1,
+                workers=1, checkpoint_file=None, resume=False):
+    """ Recreate the index and add all the records from the db to ES.
+
+    :param index: [string] name of the index. If None a default is used
+    :param recreate: [bool] whether to delete and recreate the index first
+    :param batch: [int] number of records to index at a time
+    :param start: [int] first recid to index, or -1 to start at the lowest
+    :param end: [int] last recid to index, or -1 to end at the highest
+    :param workers: [int] number of batches to index concurrently
+    :param checkpoint_file: [string] file where progress is saved, or None
+    :param resume: [bool] continue an interrupted reindex from checkpoint_file
+    """
+    from .reindex import ReindexCheckpoint, run_reindex
+
+    checkpoint = ReindexCheckpoint(checkpoint_file, index)
+    if resume and checkpoint.load():
+        # the interrupted reindex has already recreated the index.
+        recreate = False
+    elif not resume:
+        checkpoint.clear()
 
     if recreate:
         recreate_index(index=index)
@@ -175,8 +273,6 @@ def reindex_all(index=None, recreate=False, batch=50, start=-1, end=-1):
     min_recid = res.min_recid
     max_recid = res.max_recid
 
-    indexed_publications = []
-
     if max_recid and min_recid:
 
         if start != -1:
@@ -184,18 +280,20 @@ def reindex_all(index=None, recreate=False, batch=50, start=-1, end=-1):
         if end != -1:
             max_recid = min(end, max_recid)
 
-        rec_ids = range(min_recid, max_recid)
+        indexed_publications = run_reindex(min_recid, max_recid, index,
+                                           batch=batch, workers=workers,
+                                           checkpoint_file=checkpoint_file,
+                                           resume=resume)
 
-        count = min_recid
-        while count <= max_recid:
-            print("Indexing {0} to {1}".format(count, count + batch))
-            indexed_result = index_record_ids(rec_ids[count - 1:count + batch - 1], index=index)
-            indexed_publications += indexed_result[CFG_PUB_TYPE]
-            count += batch
+        # batches are indexed without refreshing, so make them all
+        # searchable before looking up the tables of each publication.
+        es.indices.refresh(index=index)
 
         print('######\nFinished indexing, now pushing data keywords\n######')
         push_data_keywords(pub_ids=indexed_publications)
 
+    checkpoint.clear()
+
 
 @default_index
 def get_record(record_id, doc_type, index=None, parent=None):
@@ -251,72 +349,116 @@ def delete_item_from_index(id, index, doc_type, parent=None):
     else:
         es.delete(index=index, doc_type=doc_type, id=id)
 
+    invalidate_search_cache()
+
+
+@default_index
+def delete_records_from_index(pub_ids, index=None, chunk_size=500):
+    """
+    Deletes publications and all of their data tables from the index.
+    The tables are found with a single scroll and deleted, along with the
+    publications, through bulk requests.
+
+    :param pub_ids: [list of ints] publications to delete
+    :param index: [string] name of the index. If None a default is used
+    :param chunk_size: [int] number of documents per scroll page and bulk request
+    :return: [int] number of documents deleted
+    """
+    pub_ids = [int(pub_id) for pub_id in pub_ids]
+    if not pub_ids:
+        return 0
+
+    tables = scan(es, index=index, doc_type=CFG_DATA_TYPE,
+                  query={'query': {'terms': {'related_publication': pub_ids}}},
+                  _source_include=['related_publication'], size=chunk_size)
+
+    table_actions = ({
+        '_op_type': 'delete',
+        '_index': index,
+        '_type': CFG_DATA_TYPE,
+        '_id': hit['_id'],
+        '_parent': hit['_source']['related_publication']
+    } for hit in tables)
+
+    publication_actions = ({
+        '_op_type': 'delete',
+        '_index': index,
+        '_type': CFG_PUB_TYPE,
+        '_id': pub_id
+    } for pub_id in pub_ids)
+
+    deleted, errors = bulk(es, chain(table_actions, publication_actions), chunk_size=chunk_size,
+                           raise_on_error=False)
+    for error in errors:
+        # documents which were never indexed are not an error.
+        if error.get('delete', {}).get('status') != 404:
+            log.error(error)
+
+    invalidate_search_cache()
+    return deleted
+
 
 @default_index
-def push_data_keywords(pub_ids=None, index=None):
+def push_data_keywords(pub_ids=None, index=None, chunk_size=500):
     """ Go through all the publications and their datatables and move data
-     keywords from tables to their parent publications. """
+     keywords from tables to their parent publications.
+
+    The keywords of all the datatables are read in one scroll and the
+    publications are then updated with bulk partial updates.
+
+    :param pub_ids: [list of ints] publications to update. If None, all of them
+    :param index: [string] name of the index. If None a default is used
+    :param chunk_size: [int] number of documents per scroll page and bulk request
+    """
+    if pub_ids is None:
+        pub_ids = [int(hit['_id']) for hit in scan(
+            es, index=index, doc_type=CFG_PUB_TYPE,
+            query={'query': {'match_all': {}}}, _source=False, size=chunk_size)]
+    else:
+        pub_ids = [int(pub_id) for pub_id in pub_ids]
 
     if not pub_ids:
-        body = {'query': {'match_all': {}}}
-        results = es.search(index=index,
-                            doc_type=CFG_PUB_TYPE,
-                            body=body,
-                            _source=False)
-        pub_ids = [i['_id'] for i in results['hits']['hits']]
-
-    for pub_id in pub_ids:
-        query_builder = QueryBuilder()
-        query_builder.add_child_parent_relation(
-            'publication',
-            relation='parent',
-            must=True,
-            related_query={'match': {'recid': pub_id}}
-        )
-        tables = es.search(
-            index=index,
-            doc_type=CFG_DATA_TYPE,
-            body=query_builder.query,
-            _source_include='keywords'
-        )
-        keywords = [d['_source'].get('keywords', None)
-                    for d in tables['hits']['hits']]
-
-        # Flatten the list
-        keywords = [i for inner in keywords for i in inner]
-
-        # Aggregate
-        agg_keywords = defaultdict(list)
-        for kw in keywords:
-            agg_keywords[kw['name']].append(kw['value'])
-
-        # Remove duplicates
-        for k, v in agg_keywords.items():
-            agg_keywords[k] = list(set(v))
-
-        body = {
-            "doc": {
-                'data_keywords': dict(agg_keywords)
-            }
-        }
+        return
+
+    if len(pub_ids) > chunk_size:
+        # filtering a large terms list costs more than reading every table.
+        table_query = {'query': {'match_all': {}}}
+    else:
+        table_query = {'query': {'terms': {'related_publication': pub_ids}}}
+
+    tables = (hit['_source'] for hit in scan(
+        es, index=index, doc_type=CFG_DATA_TYPE, query=table_query,
+        _source_include=['keywords', 'related_publication'], size=chunk_size))
+    data_keywords = collect_data_keywords(tables)
+
+    actions = ({
+        '_op_type': 'update',
+        '_index': index,
+        '_type': CFG_PUB_TYPE,
+        '_id': pub_id,
+        'doc': {'data_keywords': data_keywords.get(pub_id, {})}
+    } for pub_id in pub_ids)
 
-        try:
-            es.update(index=index, doc_type=CFG_PUB_TYPE, id=pub_id, body=body)
-        except Exception as e:
-            log.error(e.message)
+    _, errors = bulk(es, actions, chunk_size=chunk_size, raise_on_error=False)
+    for error in errors:
+        log.error(error)
+
+    # the data keywords are used for the search facets.
+    invalidate_search_cache()
 
 
 @default_index
-def index_record_ids(record_ids, index=None):
+def index_record_ids(record_ids, index=None, refresh=True):
     """ Index records given in the argument.
 
     :param record_ids: [list of ints] list of record ids e.g. [1, 5, 2, 3]
     :param index: [string] name of the index. If None a default is used
+    :param refresh: [bool] whether to make the records searchable straight away
     :return: list of indexed publication and data recids
     """
-    from hepdata.modules.records.utils.common import get_record_by_id
+    from hepdata.modules.records.utils.common import get_records_by_ids
 
-    docs = filter(None, [get_record_by_id(recid) for recid in record_ids])
+    docs = get_records_by_ids(record_ids)
 
     to_index = []
     indexed_result = {CFG_DATA_TYPE: [], CFG_PUB_TYPE: []}
@@ -363,7 +505,9 @@ def index_record_ids(record_ids, index=None):
             doc["last_updated"] = parse(doc["last_updated"]).isoformat()
         to_index.append(doc)
 
-    es.bulk(index=index, body=to_index, refresh=True)
+    if to_index:
+        es.bulk(index=index, body=to_index, refresh=refresh)
+    invalidate_search_cache()
 
     return indexed_result
 
@@ -433,6 +577,26 @@ def fetch_record(record_id, doc_type, index=None):
     return res.get('_source', res)
 
 
+@default_index
+def fetch_records(record_ids, doc_type, index=None):
+    """ Fetch several records from ES with a single multi-get request.
+
+    :param record_ids: [list of ints]
+    :param doc_type: [string] document type
+    :param index: [string] name of the index. If None a default is used
+
+    :return: [dict] mapping each record id found to its record
+    """
+    if not record_ids:
+        return {}
+
+    res = es.mget(index=index, doc_type=doc_type,
+                  body={'ids': [str(record_id) for record_id in record_ids]})
+
+    return dict((int(doc['_id']), doc['_source'])
+                for doc in res['docs'] if doc.get('found'))
+
+
 @default_index
 def get_n_latest_records(n_latest, field="last_updated", index=None):
     """ Gets latest N records from the index """
@@ -20,9 +20,34 @@
 from hepdata.config import CFG_DATA_KEYWORDS
 
 
-def default_aggregations():
-    """ Default aggregations used for computing facets """
+# Fields of the facets computed with a terms aggregation
+TERMS_FACET_FIELDS = {
+    "collaboration": "collaborations.raw",
+    "subject_areas": "subject_area.raw",
+    "reactions": "data_keywords.reactions.raw",
+    "observables": "data_keywords.observables.raw",
+    "phrases": "data_keywords.phrases.raw",
+    "cmenergies": "data_keywords.cmenergies.raw",
+}
+
+# Number of buckets returned for each terms facet with the search results.
+# The complete list of a facet is fetched on demand with facet_aggregation.
+DEFAULT_FACET_SIZE = 50
+
+
+def terms_aggregation(field, size):
+    """ Terms aggregation on a field. A size of 0 returns all the buckets. """
     return {
+        "terms": {
+            "field": field,
+            "size": size,
+        }
+    }
+
+
+def default_aggregations(facet_size=DEFAULT_FACET_SIZE):
+    """ Default aggregations used for computing facets """
+    aggregations = {
         "nested_authors": {
             "nested": {
                 "path": "authors",
@@ -35,54 +60,27 @@ def default_aggregations():
                 }
             }
         },
-        "collaboration": {
-            "terms": {
-                "field": "collaborations.raw",
-                "size": 0,
-            }
-        },
-        "subject_areas": {
-            "terms": {
-                "field": "subject_area.raw",
-                "size": 0,
-            }
-        },
         "dates": {
             "date_histogram": {
                 "field": "publication_date",
                 "interval": "year",
             }
-        },
-        "reactions": {
-            "terms": {
-                "field": "data_keywords.reactions.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        },
-        "observables": {
-            "terms": {
-                "field": "data_keywords.observables.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        },
-        "phrases": {
-            "terms": {
-                "field": "data_keywords.phrases.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        },
-        "cmenergies": {
-            "terms": {
-                "field": "data_keywords.cmenergies.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
         }
     }
 
+    for name, field in TERMS_FACET_FIELDS.items():
+        aggregations[name] = terms_aggregation(field, facet_size)
+
+    return aggregations
+
+
+def facet_aggregation(name):
+    """ Aggregation returning every bucket of a single terms facet """
+    if name not in TERMS_FACET_FIELDS:
+        raise ValueError("Unknown facet: " + name)
+
+    return {name: terms_aggregation(TERMS_FACET_FIELDS[name], 0)}
+
 
 def get_filter_clause(name, value):
     """ Returns an appropriate ES clause for a given filter """
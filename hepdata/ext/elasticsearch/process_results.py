@@ -36,6 +36,24 @@ def merge_results(pub_result, data_result):
     return merge_dict
 
 
+def get_inner_hits(es_result, doc_type):
+    """ Collects the inner hits of the given type from all the hits of a
+    search result, in the same shape as the result of a search on that type.
+
+    :param es_result: [dict] search response whose query requested inner hits
+    :param doc_type: [string] type of the inner hits, e.g. "datatable"
+    :return: [dict] search-like result containing only the inner hits
+    """
+    inner_hits = []
+    for hit in es_result['hits']['hits']:
+        hits = hit.get('inner_hits', {}).get(doc_type, {}).get('hits', {}).get('hits', [])
+        for inner_hit in hits:
+            inner_hit.setdefault('_type', doc_type)
+            inner_hits.append(inner_hit)
+
+    return {'hits': {'hits': inner_hits, 'total': len(inner_hits)}}
+
+
 def map_result(es_result):
     hits = es_result['hits']
     total_hits = es_result['total']
@@ -107,15 +125,19 @@ def get_basic_record_information(record):
 
 
 def fetch_remaining_papers(tables, papers):
-    from hepdata.ext.elasticsearch.api import fetch_record
-    hit_papers = map(lambda x: int(x['_id']), papers)
+    from hepdata.ext.elasticsearch.api import fetch_records
+    hit_papers = set(int(x['_id']) for x in papers)
+    missing_papers = []
     for table in tables:
         paper_id = table['_source'].get('related_publication')
         if paper_id and paper_id not in hit_papers:
-            paper_source = fetch_record(paper_id, CFG_PUB_TYPE)
-            paper = {'_id': str(paper_id), '_source': paper_source}
-            papers.append(paper)
-            hit_papers.append(paper_id)
+            missing_papers.append(paper_id)
+            hit_papers.add(paper_id)
+
+    paper_sources = fetch_records(missing_papers, CFG_PUB_TYPE)
+    for paper_id in missing_papers:
+        if paper_id in paper_sources:
+            papers.append({'_id': str(paper_id), '_source': paper_sources[paper_id]})
 
 
 def is_datatable(es_hit):
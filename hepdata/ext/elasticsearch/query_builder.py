@@ -88,7 +88,8 @@ class QueryBuilder(object):
                                   relation="child",
                                   related_query=None,
                                   must=False,
-                                  other_queries=None):
+                                  other_queries=None,
+                                  inner_hits=None):
         other_queries = [] if not other_queries else other_queries
         related_query = {} if not related_query else related_query
 
@@ -100,6 +101,10 @@ class QueryBuilder(object):
             }
         }
 
+        if inner_hits is not None:
+            # returns the matching related documents along with each hit
+            relation_dict[relation]["inner_hits"] = inner_hits
+
         bool_operator = "must" if must else "should"
         query_dict = {
             "bool": {
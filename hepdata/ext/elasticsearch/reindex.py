@@ -0,0 +1,163 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Parallel, resumable reindexing of all the records into elastic search."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import logging
+import os
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app
+
+from hepdata.config import CFG_PUB_TYPE
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+def get_reindex_batches(min_recid, max_recid, batch):
+    """
+    Splits an inclusive range of recids into consecutive batches.
+
+    :param min_recid: [int] first recid to index
+    :param max_recid: [int] last recid to index
+    :param batch: [int] number of recids per batch
+    :return: [list of lists of ints]
+    """
+    return [list(range(first, min(first + batch, max_recid + 1)))
+            for first in range(min_recid, max_recid + 1, batch)]
+
+
+class ReindexCheckpoint(object):
+    """
+    Records the progress of a reindex in a JSON file: the last recid up to
+    which every record has been sent to the index, and the publications
+    indexed so far (their data keywords are only pushed at the end).
+    """
+
+    def __init__(self, file_location, index):
+        self.file_location = file_location
+        self.index = index
+
+    def load(self):
+        """
+        :return: [dict] the saved progress, or None if there is none for this index
+        """
+        if not self.file_location or not os.path.exists(self.file_location):
+            return None
+
+        try:
+            with open(self.file_location, 'r') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except ValueError:
+            log.error('Ignoring unreadable reindex checkpoint {0}'.format(self.file_location))
+            return None
+
+        if checkpoint.get('index') != self.index:
+            return None
+        return checkpoint
+
+    def save(self, last_recid, publications):
+        """
+        Writes the progress to a temporary file which then replaces the
+        checkpoint, so that an interruption never leaves a partial file.
+        """
+        if not self.file_location:
+            return
+
+        checkpoint = {
+            'index': self.index,
+            'last_recid': last_recid,
+            'publications': publications
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.file_location))
+        file_descriptor, tmp_location = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.rename(tmp_location, self.file_location)
+
+    def clear(self):
+        if self.file_location and os.path.exists(self.file_location):
+            os.remove(self.file_location)
+
+
+def index_batch(app, record_ids, index):
+    """
+    Indexes a batch of records from a worker thread, which needs
+    its own application context (and so database session).
+
+    :return: [dict] as returned by index_record_ids
+    """
+    from hepdata.ext.elasticsearch.api import index_record_ids
+
+    with app.app_context():
+        return index_record_ids(record_ids, index=index, refresh=False)
+
+
+def run_reindex(min_recid, max_recid, index, batch=50, workers=1,
+                checkpoint_file=None, resume=False):
+    """
+    Indexes all the recids between min_recid and max_recid (inclusive),
+    sending batches to the index from a pool of worker threads. Progress
+    is saved to the checkpoint file as batches complete, in recid order.
+    With resume, the reindex starts after the last recid of the checkpoint.
+
+    :param min_recid: [int] first recid to index
+    :param max_recid: [int] last recid to index
+    :param index: [string] name of the index
+    :param batch: [int] number of records to index at a time
+    :param workers: [int] number of batches indexed concurrently
+    :param checkpoint_file: [string] path of the checkpoint file, or None
+    :param resume: [bool] whether to continue from the checkpoint
+    :return: [list of ints] recids of all the indexed publications
+    """
+    checkpoint = ReindexCheckpoint(checkpoint_file, index)
+    indexed_publications = []
+
+    saved = checkpoint.load() if resume else None
+    if saved:
+        min_recid = max(min_recid, saved['last_recid'] + 1)
+        indexed_publications = saved['publications']
+        print('Resuming from recid {0}'.format(min_recid))
+
+    batches = get_reindex_batches(min_recid, max_recid, batch)
+    app = current_app._get_current_object()
+
+    def process(record_ids):
+        print("Indexing {0} to {1}".format(record_ids[0], record_ids[-1]))
+        return index_batch(app, record_ids, index)
+
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        # imap returns the results in the order of the batches, so
+        # everything up to the last recid of a result has been indexed.
+        results = pool.imap(process, batches) if pool else (process(b) for b in batches)
+        for batch_number, indexed_result in enumerate(results):
+            indexed_publications += indexed_result[CFG_PUB_TYPE]
+            checkpoint.save(batches[batch_number][-1], indexed_publications)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    return indexed_publications
@@ -110,3 +110,22 @@ def push_keywords(docs):
         pub['data_keywords'] = agg_keywords
 
     return publications + datatables
+
+
+def collect_data_keywords(tables):
+    """
+        Groups the keywords of datatables by their publication,
+        removing duplicate values.
+
+        :param tables: iterable of datatable documents
+        :return: dict mapping each publication recid to a dict of
+                 keyword name to list of values
+    """
+    data_keywords = defaultdict(lambda: defaultdict(set))
+    for table in tables:
+        publication_keywords = data_keywords[int(table['related_publication'])]
+        for kw in table.get('keywords') or []:
+            publication_keywords[kw['name']].add(kw['value'])
+
+    return dict((pub_id, dict((name, list(values)) for name, values in keywords.items()))
+                for pub_id, keywords in data_keywords.items())
@@ -0,0 +1,210 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cache of converted files, keyed on the content they were converted from."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import current_app
+
+from hepdata.utils.cache import LRUCache
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+TMP_PREFIX = 'tmp-'
+
+_conversion_cache = None
+_content_hashes = LRUCache(max_size=1024)
+
+
+def get_content_hash(*file_locations):
+    """
+    Hashes the contents of one or more files. Hashes are remembered for
+    as long as the modification time and size of the files are unchanged.
+    :param file_locations: paths of the files, missing files are skipped
+    :return: hexadecimal sha1 digest
+    """
+    content_hash = hashlib.sha1()
+    for file_location in file_locations:
+        if not os.path.exists(file_location):
+            continue
+
+        file_stat = os.stat(file_location)
+        key = (file_location, file_stat.st_mtime, file_stat.st_size)
+        file_hash = _content_hashes.get(key)
+        if file_hash is None:
+            file_hash = hashlib.sha1()
+            with open(file_location, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    file_hash.update(chunk)
+            file_hash = file_hash.hexdigest()
+            _content_hashes.set(key, file_hash)
+
+        content_hash.update(file_hash.encode('utf-8'))
+
+    return content_hash.hexdigest()
+
+
+class ConversionCache(object):
+    """
+    Directory of converted files named after the hash of the source
+    content, the target format and the converter options, so an updated
+    source can never be served a stale conversion. Once the directory
+    holds more than max_size bytes, the least recently used files are
+    removed. Files are written under a temporary name and renamed into
+    place, so a partially written file is never served.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if not os.path.exists(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # created by another process in the meantime.
+                pass
+
+    def make_key(self, content_hash, file_format, options):
+        """
+        :param content_hash: hash of the source content, see get_content_hash
+        :param file_format: target format
+        :param options: dict of converter options
+        :return: hexadecimal digest
+        """
+        serialised = json.dumps([content_hash, file_format, options], sort_keys=True)
+        return hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, '{0}.{1}'.format(key, extension))
+
+    def get(self, key, extension):
+        """
+        :return: path of the cached file, or None if it is not cached
+        """
+        path = self._path(key, extension)
+        if os.path.exists(path):
+            try:
+                # the modification time orders the files for eviction.
+                os.utime(path, None)
+            except OSError:
+                # evicted in the meantime.
+                path = None
+        else:
+            path = None
+
+        with self._lock:
+            if path:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        log.debug('Conversion cache {0} for {1}'.format('hit' if path else 'miss', key))
+        return path
+
+    def new_file(self, extension):
+        """
+        Returns a temporary path in the cache directory to write a conversion
+        to, which can then be moved into place atomically with store().
+        """
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=self.cache_dir, prefix=TMP_PREFIX, suffix='.' + extension)
+        os.close(file_descriptor)
+        return tmp_path
+
+    def store(self, key, extension, file_location):
+        """
+        Moves a converted file into the cache.
+        :param file_location: path of the converted file, which is moved
+        :return: path of the cached file
+        """
+        path = self._path(key, extension)
+
+        if os.path.dirname(os.path.abspath(file_location)) != os.path.abspath(self.cache_dir):
+            # move next to the cache first, so the rename cannot cross filesystems.
+            tmp_path = self.new_file(extension)
+            shutil.move(file_location, tmp_path)
+            file_location = tmp_path
+
+        os.rename(file_location, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """ Removes the least recently used files until the cache fits in max_size. """
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.startswith(TMP_PREFIX):
+                continue
+
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((file_stat.st_mtime, file_stat.st_size, path))
+            total_size += file_stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+    def get_stats(self):
+        """
+        :return: dict with the number of hits and misses of this process
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def get_conversion_cache():
+    """
+    Returns the conversion cache, creating it on first use.
+    :return: ConversionCache instance
+    """
+    global _conversion_cache
+    if _conversion_cache is None:
+        _conversion_cache = ConversionCache(
+            current_app.config.get('CFG_CONVERSION_CACHE_DIR',
+                                   os.path.join(current_app.config['CFG_DATADIR'], 'converted')),
+            current_app.config.get('CFG_CONVERSION_CACHE_SIZE', 5 * 1024 ** 3))
+    return _conversion_cache
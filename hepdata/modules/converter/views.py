@@ -19,6 +19,8 @@
 from __future__ import absolute_import, print_function
 import logging
 import os
+import tempfile
+from shutil import move, rmtree
 
 from celery import shared_task
 from flask import Blueprint, send_file, render_template, \
@@ -30,6 +32,7 @@ from hepdata.config import CFG_CONVERTER_URL, CFG_SUPPORTED_FORMATS
 from hepdata_converter_ws_client import convert
 from invenio_db import db
 from hepdata.modules.converter import convert_zip_archive
+from hepdata.modules.converter.cache import get_conversion_cache, get_content_hash
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.submission.models import HEPSubmission, DataResource, DataSubmission
 from hepdata.utils.file_extractor import extract, get_file_in_directory
@@ -186,35 +189,49 @@ def download_submission(submission, file_format, offline=False, force=False):
 
     output_file = 'HEPData-{0}-{1}-{2}.tar.gz'.format(file_identifier, submission.version, file_format)
 
-    converted_dir = os.path.join(current_app.config['CFG_DATADIR'], 'converted')
-    if not os.path.exists(converted_dir):
-        os.mkdir(converted_dir)
+    converter_options = {
+        'input_format': 'yaml',
+        'output_format': file_format,
+        'filename': 'HEPData-{0}-{1}-{2}'.format(file_identifier, submission.version, file_format),
+    }
+
+    data_filepath = os.path.join(path, data_filename)
 
-    output_path = os.path.join(converted_dir, output_file)
+    conversion_cache = get_conversion_cache()
+    cache_key = conversion_cache.make_key(get_content_hash(data_filepath), file_format, converter_options)
 
-    # If the file is already available in the dir, send it back
+    # If the file has already been converted from the same content, send it back
     # unless we are forcing recreation of the file.
-    if os.path.exists(output_path) and not force:
+    output_path = None if force else conversion_cache.get(cache_key, 'tar.gz')
+    if output_path:
         if not offline:
-            return send_file(
-                output_path,
-                as_attachment=True,
-            )
+            return send_file(output_path, as_attachment=True, attachment_filename=output_file)
         else:
             print('File already downloaded at {0}'.format(output_path))
             return
 
-    converter_options = {
-        'input_format': 'yaml',
-        'output_format': file_format,
-        'filename': 'HEPData-{0}-{1}-{2}'.format(file_identifier, submission.version, file_format),
-    }
+    tmp_output_path = conversion_cache.new_file('tar.gz')
+    converted_file = convert_zip_archive(data_filepath, tmp_output_path, converter_options)
 
-    data_filepath = os.path.join(path, data_filename)
+    if converted_file is None or not converted_file.endswith('.tar.gz'):
+        # Error occurred, errors are not cached.
+        if converted_file is None:
+            os.remove(tmp_output_path)
+        else:
+            error_file = os.path.join(current_app.config['CFG_TMPDIR'], output_file[:-7] + '.html')
+            move(converted_file, error_file)
+        if offline:
+            log.error('Unable to convert {0} to {1}'.format(file_identifier, file_format))
+            return
+        if converted_file is None:
+            return display_error(
+                title="No submission file found",
+                description="The submission file of {0} could not be converted".format(file_identifier))
+        return send_file(error_file, as_attachment=True)
 
-    converted_file = convert_zip_archive(data_filepath, output_path, converter_options)
+    output_path = conversion_cache.store(cache_key, 'tar.gz', converted_file)
     if not offline:
-        return send_file(converted_file, as_attachment=True)
+        return send_file(output_path, as_attachment=True, attachment_filename=output_file)
     else:
         print('File for {0} create successfully at {1}'.format(file_identifier, output_path))
 
@@ -297,8 +314,6 @@ def download_datatable(data_resource, file_format, *args, **kwargs):
     if 'table_name' in kwargs:
         filename += '-' + kwargs.pop('table_name').replace(' ', '')
 
-    output_path = os.path.join(current_app.config['CFG_TMPDIR'], filename)
-
     if file_format == 'yaml':
         return send_file(
             data_resource.file_location,
@@ -312,26 +327,37 @@ def download_datatable(data_resource, file_format, *args, **kwargs):
         'filename': table_name.split('.')[0],
     }
 
-    if not os.path.exists(output_path):
-
-        successful = convert(
-            CFG_CONVERTER_URL,
-            record_path,
-            output=output_path + '-dir',
-            options=options,
-            extract=False,
-        )
-    else:
-        successful = True
+    # the table is converted along with the submission metadata.
+    content_hash = get_content_hash(data_resource.file_location,
+                                    os.path.join(record_path, 'submission.yaml'))
+
+    conversion_cache = get_conversion_cache()
+    cache_key = conversion_cache.make_key(content_hash, file_format, options)
+
+    file_to_send = conversion_cache.get(cache_key, file_format)
+    if not file_to_send:
+        output_path = tempfile.mkdtemp(dir=current_app.config['CFG_TMPDIR'])
+        try:
+            successful = convert(
+                CFG_CONVERTER_URL,
+                record_path,
+                output=os.path.join(output_path, 'output'),
+                options=options,
+                extract=False,
+            )
 
-    # Error occurred, the output is a HTML file
-    if successful:
-        new_path = output_path + "." + file_format
-        new_path = extract(filename + ".tar.gz", output_path + '-dir', new_path)
-        file_to_send = get_file_in_directory(new_path, file_format)
-    else:
-        file_to_send = output_path + '-dir'
-        file_format = 'html'
+            # Error occurred, the output is a HTML file
+            if successful:
+                new_path = extract(filename + ".tar.gz", os.path.join(output_path, 'output'),
+                                   os.path.join(output_path, 'extracted'))
+                file_to_send = conversion_cache.store(
+                    cache_key, file_format, get_file_in_directory(new_path, file_format))
+            else:
+                file_to_send = os.path.join(current_app.config['CFG_TMPDIR'], filename + '.html')
+                move(os.path.join(output_path, 'output'), file_to_send)
+                file_format = 'html'
+        finally:
+            rmtree(output_path, ignore_errors=True)
 
     return send_file(file_to_send, as_attachment=True,
                      attachment_filename=filename + '.' + file_format)
@@ -26,13 +26,14 @@ from collections import OrderedDict
 
 from flask.ext.login import current_user
 from invenio_accounts.models import User
-from sqlalchemy import and_, or_
+from invenio_db import db
+from sqlalchemy import and_, func, or_
 
 from hepdata.modules.permissions.models import SubmissionParticipant
-from hepdata.modules.records.utils.common import get_record_by_id, encode_string
+from hepdata.modules.records.utils.common import get_record_by_id, get_records_by_ids, encode_string
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.records.utils.users import has_role
-from hepdata.modules.submission.models import HEPSubmission, DataReview
+from hepdata.modules.submission.models import HEPSubmission, DataReview, submission_participant_link
 from hepdata.utils.users import get_user_from_id
 
 
@@ -46,17 +47,83 @@ def add_user_to_metadata(type, user_info, record_id, submissions):
             'name': 'No primary ' + type}
 
 
+REVIEW_STATUSES = ["todo", "attention", "passed"]
+
+
+def load_dashboard_data(hepsubmissions, user_id=None):
+    """
+    Loads everything the dashboard shows about a list of submissions in a
+    fixed number of queries: their records, latest versions, coordinators,
+    the roles of the user in them and the number of tables in each review status.
+    :param hepsubmissions: list of HEPSubmission objects
+    :param user_id: id of the user looking at the dashboard
+    :return: dict with the records and latest versions by publication recid,
+             the coordinators by user id, the user roles by HEPSubmission id
+             (None for submissions without participants) and the review
+             status counts by (publication recid, version)
+    """
+    data = {'records': {}, 'latest_versions': {}, 'coordinators': {},
+            'user_roles': {}, 'review_counts': {}}
+
+    if not hepsubmissions:
+        return data
+
+    recids = sorted(set(hepsubmission.publication_recid for hepsubmission in hepsubmissions))
+
+    for record in get_records_by_ids(recids):
+        data['records'][int(record['recid'])] = record
+
+    data['latest_versions'] = dict(
+        db.session.query(HEPSubmission.publication_recid, func.max(HEPSubmission.version))
+        .filter(HEPSubmission.publication_recid.in_(recids))
+        .group_by(HEPSubmission.publication_recid).all())
+
+    coordinator_ids = set(hepsubmission.coordinator for hepsubmission in hepsubmissions
+                          if hepsubmission.coordinator is not None)
+    if coordinator_ids:
+        data['coordinators'] = dict(
+            (user.id, user) for user in User.query.filter(User.id.in_(list(coordinator_ids))))
+
+    participants = db.session.query(
+        submission_participant_link.c.rec_id, SubmissionParticipant.user_account, SubmissionParticipant.role) \
+        .join(SubmissionParticipant, SubmissionParticipant.id == submission_participant_link.c.participant_id) \
+        .filter(submission_participant_link.c.rec_id.in_([hepsubmission.id for hepsubmission in hepsubmissions])) \
+        .all()
+
+    for hepsubmission_id, user_account, role in participants:
+        user_roles = data['user_roles'].setdefault(hepsubmission_id, [])
+        if user_id is not None and user_account == user_id:
+            user_roles.append(role)
+
+    review_counts = db.session.query(
+        DataReview.publication_recid, DataReview.version, DataReview.status, func.count(DataReview.id)) \
+        .filter(DataReview.publication_recid.in_(recids)) \
+        .group_by(DataReview.publication_recid, DataReview.version, DataReview.status).all()
+
+    for publication_recid, version, status, count in review_counts:
+        data['review_counts'].setdefault((publication_recid, version), {})[status] = count
+
+    return data
+
+
 def create_record_for_dashboard(record_id, submissions, coordinator=None, user_role=None,
-                                status="todo"):
+                                status="todo", publication_record=None, latest_version=None):
+    """
+    Adds a submission to the dashboard submissions.
+    :param publication_record: the record of the submission, looked up if not given
+    :param latest_version: the latest version of the submission, looked up if not given
+    """
     if user_role is None:
         user_role = ["coordinator"]
 
-    publication_record = get_record_by_id(int(record_id))
+    if publication_record is None:
+        publication_record = get_record_by_id(int(record_id))
 
     if publication_record is not None:
         if record_id not in submissions:
 
-            hepdata_submission_record = get_latest_hepsubmission(publication_recid=record_id)
+            if latest_version is None:
+                latest_version = get_latest_hepsubmission(publication_recid=record_id).version
 
             submissions[record_id] = {}
             submissions[record_id]["metadata"] = {"recid": record_id,
@@ -64,7 +131,7 @@ def create_record_for_dashboard(record_id, submissions, coordinator=None, user_r
                                                   "start_date": publication_record.created}
 
             submissions[record_id]["metadata"][
-                "versions"] = hepdata_submission_record.version
+                "versions"] = latest_version
             submissions[record_id]["status"] = status
             submissions[record_id]["stats"] = {"passed": 0, "attention": 0,
                                                "todo": 0}
@@ -93,6 +160,16 @@ def create_record_for_dashboard(record_id, submissions, coordinator=None, user_r
                 submissions[record_id]["metadata"]["role"].append(user_role)
 
 
+def add_review_counts(record_id, submissions, review_counts):
+    """
+    Adds the number of data tables in each state of review to a submission.
+    :param review_counts: dict of review status to count
+    """
+    if record_id in submissions:
+        for status in REVIEW_STATUSES:
+            submissions[record_id]["stats"][status] += review_counts.get(status, 0)
+
+
 def process_user_record_results(type, query_results, submissions):
     """
     :param type: e.g. reviewer, uploader, or coordinator
@@ -100,37 +177,24 @@ def process_user_record_results(type, query_results, submissions):
     :param submissions: the submissions to be added to
     :return:
     """
-    for submission in query_results:
+    dashboard_data = load_dashboard_data(query_results)
 
-        record_query_results = DataReview.query.filter_by(
-            publication_recid=submission.publication_recid,
-            version=submission.version).order_by(
-            DataReview.id.asc()).all()
-
-        if record_query_results:
-            count = 0
-            allow_record_count_updates = True
-
-            for record in record_query_results:
-                # this is a way to stop the counts for records being
-                # updated two or three times for users with
-                # multiple roles...
-                if count == 0:
-                    allow_record_count_updates = str(
-                        record.publication_recid) not in submissions
+    for submission in query_results:
+        record_id = str(submission.publication_recid)
 
-                create_record_for_dashboard(str(record.publication_recid),
-                                            submissions,
-                                            user_role=[type])
+        # this is a way to stop the counts for records being
+        # updated two or three times for users with
+        # multiple roles...
+        allow_record_count_updates = record_id not in submissions
 
-                if allow_record_count_updates:
-                    submissions[str(record.publication_recid)]["stats"][
-                        record.status] += 1
+        create_record_for_dashboard(
+            record_id, submissions, user_role=[type],
+            publication_record=dashboard_data['records'].get(submission.publication_recid),
+            latest_version=dashboard_data['latest_versions'].get(submission.publication_recid))
 
-                count += 1
-        else:
-            create_record_for_dashboard(str(submission.publication_recid),
-                                        submissions, user_role=[type])
+        if allow_record_count_updates:
+            add_review_counts(record_id, submissions, dashboard_data['review_counts'].get(
+                (submission.publication_recid, submission.version), {}))
 
 
 def prepare_submissions(current_user):
@@ -141,73 +205,55 @@ def prepare_submissions(current_user):
     """
 
     submissions = OrderedDict()
-    hepdata_submission_records = []
+    user_id = int(current_user.get_id())
+    open_submissions = and_(HEPSubmission.overall_status != 'finished',
+                            HEPSubmission.overall_status != 'sandbox')
 
     if has_role(current_user, 'admin'):
         # if the user is a superadmin, show everything here.
         # The final rendering in the dashboard should be different
         # though considering the user him/herself is probably not a
         # reviewer/uploader
-        hepdata_submission_records = HEPSubmission.query.filter(
-            and_(HEPSubmission.overall_status != 'finished', HEPSubmission.overall_status != 'sandbox')).order_by(
+        hepdata_submission_records = HEPSubmission.query.filter(open_submissions).order_by(
             HEPSubmission.created.desc()).all()
     else:
         # we just want to pick out people with access to particular records,
         # i.e. submissions for which they are primary reviewers.
+        participant_recids = db.session.query(SubmissionParticipant.publication_recid).filter_by(
+            user_account=user_id, status='primary')
 
-        participant_records = SubmissionParticipant.query.filter_by(
-            user_account=int(current_user.get_id()),
-            status='primary').all()
-
-        for participant_record in participant_records:
-            hepdata_submission_records = HEPSubmission.query.filter(
-                HEPSubmission.publication_recid == participant_record.publication_recid,
-                and_(HEPSubmission.overall_status != 'finished',
-                     HEPSubmission.overall_status != 'sandbox')).all()
+        hepdata_submission_records = HEPSubmission.query.filter(
+            HEPSubmission.publication_recid.in_(participant_recids),
+            open_submissions).all()
 
         coordinator_submissions = HEPSubmission.query.filter(
-            HEPSubmission.coordinator == int(current_user.get_id()),
-            and_(HEPSubmission.overall_status != 'finished',
-                 HEPSubmission.overall_status != 'sandbox')).all()
+            HEPSubmission.coordinator == user_id,
+            open_submissions).all()
 
         hepdata_submission_records += coordinator_submissions
 
-    for hepdata_submission in hepdata_submission_records:
-
-        if str(hepdata_submission.publication_recid) not in submissions:
+    dashboard_data = load_dashboard_data(hepdata_submission_records, user_id)
 
-            coordinator = User.query.get(hepdata_submission.coordinator)
-
-            if hepdata_submission.participants:
-                current_user_roles = []
+    for hepdata_submission in hepdata_submission_records:
+        record_id = str(hepdata_submission.publication_recid)
 
-                for participant in hepdata_submission.participants:
+        if record_id not in submissions:
 
-                    if int(current_user.get_id()) == participant.user_account:
-                        current_user_roles.append(participant.role)
+            coordinator = dashboard_data['coordinators'].get(hepdata_submission.coordinator)
 
-                create_record_for_dashboard(
-                    str(hepdata_submission.publication_recid), submissions,
-                    coordinator=coordinator,
-                    user_role=current_user_roles,
-                    status=hepdata_submission.overall_status)
-            else:
-                create_record_for_dashboard(
-                    str(hepdata_submission.publication_recid), submissions,
-                    coordinator=coordinator,
-                    status=hepdata_submission.overall_status)
+            # without participants, the user is shown as the coordinator.
+            create_record_for_dashboard(
+                record_id, submissions,
+                coordinator=coordinator,
+                user_role=dashboard_data['user_roles'].get(hepdata_submission.id),
+                status=hepdata_submission.overall_status,
+                publication_record=dashboard_data['records'].get(hepdata_submission.publication_recid),
+                latest_version=dashboard_data['latest_versions'].get(hepdata_submission.publication_recid))
 
             # we update the counts for the number of data tables in various
             # states of review
-            statuses = ["todo", "attention", "passed"]
-            for status in statuses:
-                status_count = DataReview.query.filter_by(
-                    publication_recid=hepdata_submission.publication_recid,
-                    status=status,
-                    version=hepdata_submission.version).count()
-                if str(hepdata_submission.publication_recid) in submissions:
-                    submissions[str(hepdata_submission.publication_recid)][
-                        "stats"][status] += status_count
+            add_review_counts(record_id, submissions, dashboard_data['review_counts'].get(
+                (hepdata_submission.publication_recid, hepdata_submission.version), {}))
 
     return submissions
 
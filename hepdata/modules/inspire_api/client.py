@@ -0,0 +1,124 @@
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Client for the INSPIRE record export, with a shared response cache."""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import time
+
+import requests
+from flask import current_app
+
+from hepdata.utils.cache import SharedCache
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+_inspire_client = None
+
+
+class InspireClient(object):
+    """
+    Fetches MARCXML records from INSPIRE over a persistent session.
+    Responses are cached for ttl seconds, after which they are revalidated
+    with their ETag or Last-Modified date, so an unchanged record is not
+    downloaded again. A cached response is also used when INSPIRE cannot
+    be reached or responds with an error.
+    """
+
+    def __init__(self, url_pattern, cache, ttl=24 * 3600, timeout=30):
+        self.url_pattern = url_pattern
+        self.cache = cache
+        self.ttl = ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get_marcxml(self, inspire_id):
+        """
+        :param inspire_id: the INSPIRE record id
+        :return: tuple of the MARCXML content (bytes) and the HTTP status code
+        """
+        url = self.url_pattern.format(inspire_id)
+        key = self.cache.make_key(url)
+        cached = self.cache.get(key)
+
+        if cached is not None and time.time() - cached['fetched'] < self.ttl:
+            return cached['content'].encode('utf-8'), 200
+
+        headers = {}
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if cached is None:
+                raise
+            log.error('Unable to reach INSPIRE for {0}, using the cached record: {1}'.format(inspire_id, e))
+            return cached['content'].encode('utf-8'), 200
+
+        if response.status_code == 304 and cached is not None:
+            cached['fetched'] = time.time()
+            self.cache.set(key, cached)
+            return cached['content'].encode('utf-8'), 200
+
+        if response.status_code != 200 and cached is not None:
+            log.error('Error {0} from INSPIRE for {1}, using the cached record'.format(
+                response.status_code, inspire_id))
+            return cached['content'].encode('utf-8'), 200
+
+        if response.status_code == 200 and response.content:
+            try:
+                self.cache.set(key, {
+                    'content': response.content.decode('utf-8'),
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'fetched': time.time()
+                })
+            except UnicodeDecodeError:
+                log.error('Not caching the INSPIRE record {0}, which is not UTF-8'.format(inspire_id))
+
+        return response.content, response.status_code
+
+
+def get_inspire_client():
+    """
+    Returns the INSPIRE client, creating it on first use.
+    :return: InspireClient instance
+    """
+    global _inspire_client
+    if _inspire_client is None:
+        cache = SharedCache('inspire',
+                            redis_url=current_app.config.get('CACHE_REDIS_URL'),
+                            timeout=current_app.config.get('INSPIRE_CACHE_MAX_AGE', 30 * 24 * 3600),
+                            max_size=current_app.config.get('INSPIRE_CACHE_SIZE', 1024))
+        _inspire_client = InspireClient(
+            current_app.config.get('INSPIRE_RECORD_URL', 'http://inspirehep.net/record/{0}/export/xm'),
+            cache,
+            ttl=current_app.config.get('INSPIRE_CACHE_TTL', 24 * 3600),
+            timeout=current_app.config.get('INSPIRE_TIMEOUT', 30))
+    return _inspire_client
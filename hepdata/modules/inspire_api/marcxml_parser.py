@@ -16,7 +16,11 @@
 # You should have received a copy of the GNU General Public License
 # along with HEPData; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+from collections import defaultdict
+from io import BytesIO
+
 import timestring
+from lxml import etree
 
 marc_tags = {
     'title': ('245', 'a'),
@@ -39,16 +43,107 @@ marc_tags = {
 DEFAULT_JOURNAL = 'No Journal Information'
 
 
-def get_journal_info(soup):
+def _local_name(tag):
+    """ Strips the namespace from an element tag. """
+    try:
+        return tag.rsplit('}', 1)[-1]
+    except AttributeError:
+        # comments and processing instructions have no name.
+        return None
+
+
+def index_marcxml(content):
+    """
+    Reads a MARCXML document in a single pass, grouping its datafields by
+    tag so that each field can then be looked up without scanning the
+    whole document again.
+    :param content: the MARCXML document (bytes)
+    :return: dict of tag to list of datafields, each a dict with the
+             ind1 and ind2 indicators and the list of (code, value) subfields
+    """
+    datafields = defaultdict(list)
+
+    try:
+        for _, element in etree.iterparse(BytesIO(content), events=('end',)):
+            if _local_name(element.tag) == 'datafield':
+                datafields[element.get('tag')].append({
+                    'ind1': element.get('ind1'),
+                    'ind2': element.get('ind2'),
+                    'subfields': [(subfield.get('code'), subfield.text) for subfield in element
+                                  if _local_name(subfield.tag) == 'subfield']
+                })
+                element.clear()
+    except etree.XMLSyntaxError:
+        # e.g. an error page rather than a record, which has no fields.
+        pass
+
+    return datafields
+
+
+def get_subfields(datafield, code):
+    """
+    :param datafield: datafield as returned by index_marcxml
+    :param code: the subfield code
+    :return: list of the values of the subfields with that code
+    """
+    return [value for subfield_code, value in datafield['subfields'] if subfield_code == code]
+
+
+def parse_marcxml(content):
+    """
+    Extracts all the fields of an INSPIRE record used by HEPData.
+    :param content: the MARCXML document (bytes)
+    :return: dict of the record information
+    """
+    datafields = index_marcxml(content)
+
+    collection_type = get_collection(datafields)
+
+    journal_info, year = get_journal_info(datafields)
+    creation_date, creation_year = get_date(datafields)
+
+    if year is None:
+        year = get_year(datafields)
+
+    if year is None:
+        year = creation_year
+
+    record_information = {
+        'title': get_title(datafields),
+        'doi': get_doi(datafields),
+        'authors': get_authors(datafields),
+        'type': collection_type,
+        'abstract': get_abstract(datafields),
+        'creation_date': creation_date,
+        'arxiv_id': get_arxiv(datafields),
+        'collaborations': get_collaborations(datafields),
+        'keywords': get_keywords(datafields),
+        'journal_info': journal_info,
+        'year': year,
+        'subject_area': get_subject_areas(datafields)
+    }
+
+    if 'thesis' in collection_type:
+        dissertation = get_dissertation(datafields)
+        record_information['dissertation'] = dissertation
+        if year is None:
+            record_information['year'] = dissertation.get('defense_date', None)
+            if record_information['year'] is not None:
+                record_information['creation_date'] = expand_date(record_information['year'])
+
+    return record_information
+
+
+def get_journal_info(datafields):
     """ Parse the journal information from the xml """
     try:
         tag, codes = marc_tags['journal']
-        datafield = soup.find_all(tag=tag)[0]
+        datafield = datafields[tag][0]
         journal_info = ''
         year = None
 
         for code in codes:
-            value = datafield.find_all(code=code)[0].string
+            value = get_subfields(datafield, code)[0]
             if code == 'y':
                 year = value
                 value = '(' + value + ')'
@@ -59,48 +154,47 @@ def get_journal_info(soup):
         return DEFAULT_JOURNAL, None
 
 
-def get_year(soup):
+def get_year(datafields):
     try:
         tag, code = marc_tags['year']
-        datafield = soup.find_all(tag=tag)[0]
-        return timestring.Date(datafield.find_all(code=code)[0].string).year
+        datafield = datafields[tag][0]
+        return timestring.Date(get_subfields(datafield, code)[0]).year
     except:
         return None
 
 
-def get_doi(soup):
+def get_doi(datafields):
     """ Parse the DOI from the xml """
     try:
         (tag, ind1, code1, code2) = marc_tags['doi']
-        datafield = soup.find_all(tag=tag, ind1=ind1)[0]
-        assert datafield.find_all(code=code2)[0].string.lower() == 'doi'
-        return datafield.find_all(code=code1)[0].string
-    except (IndexError, AssertionError):
+        datafield = [df for df in datafields[tag] if df['ind1'] == ind1][0]
+        assert get_subfields(datafield, code2)[0].lower() == 'doi'
+        return get_subfields(datafield, code1)[0]
+    except (IndexError, AssertionError, AttributeError):
         return None
 
 
-def get_title(soup):
+def get_title(datafields):
     """ Parse the title from the xml.  Use translated title if present. """
     for title in ['title_translation', 'title']:
         try:
             (tag, code) = marc_tags[title]
-            datafield = soup.find_all(tag=tag)[0]
-            return datafield.find_all(code=code)[0].string
+            datafield = datafields[tag][0]
+            return get_subfields(datafield, code)[0]
         except IndexError:
             pass
     return None
 
 
-def get_authors(soup):
+def get_authors(datafields):
     """ Parse the authors from the xml """
     try:
         (tag, code_name, code_aff) = marc_tags['first_author']
-        datafield = soup.find_all(tag=tag)[0]
+        datafield = datafields[tag][0]
         authors = [get_author_from_subfield(datafield, code_name, code_aff)]
 
         (tag, code_name, code_aff) = marc_tags['coauthors']
-        datafields = soup.find_all(tag=tag)
-        for df in datafields:
+        for df in datafields[tag]:
             coauthor = get_author_from_subfield(df, code_name, code_aff)
             authors.append(coauthor)
 
@@ -109,36 +203,47 @@ def get_authors(soup):
         return None
 
 
-def get_abstract(soup):
+def get_abstract(datafields):
     """ Parse the abstract from the xml """
     try:
         (tag, code) = marc_tags['abstract']
-        datafield = soup.find_all(tag=tag)[0]
-        return datafield.find_all(code=code)[0].string
+        datafield = datafields[tag][0]
+        return get_subfields(datafield, code)[0]
     except IndexError:
         return None
 
 
-def get_arxiv(soup):
+def get_arxiv(datafields):
     """ Parse the arxiv ID from the xml """
     (tag, code1, code2) = marc_tags['arxiv']
-    for df in soup.find_all(tag=tag):
-        subfield = df.find_all(code=code1)
-        if subfield != [] and subfield[0].string == 'arXiv':
+    for df in datafields[tag]:
+        subfield = get_subfields(df, code1)
+        if subfield != [] and subfield[0] == 'arXiv':
             try:
-                return df.find_all(code=code2)[0].string
+                return get_subfields(df, code2)[0]
             except IndexError:
                 return None
 
     return None
 
 
-def get_collaborations(soup):
+def get_first_subfields(datafields, tag, code):
+    """
+    :return: the value of the first subfield with the given code of each
+             datafield with the given tag which has one
+    """
+    values = []
+    for df in datafields[tag]:
+        subfields = get_subfields(df, code)
+        if subfields:
+            values.append(subfields[0])
+    return values
+
+
+def get_collaborations(datafields):
     """ Parse the collaboration names from the xml """
     (tag, code) = marc_tags['collaboration']
-    datafields = soup.find_all(tag=tag)
-    return [df.find_all(code=code)[0].string for df in datafields
-            if df.find_all(code=code)]
+    return get_first_subfields(datafields, tag, code)
 
 
 def expand_date(value):
@@ -163,12 +268,12 @@ def expand_date(value):
     return "-".join(date_parts)
 
 
-def get_date(soup):
+def get_date(datafields):
     """ Parse the date from the xml """
     try:
         (tag, code) = marc_tags['date']
-        datafield = soup.find_all(tag=tag)[0]
-        value = datafield.find_all(code=code)[0].string
+        datafield = datafields[tag][0]
+        value = get_subfields(datafield, code)[0]
         date = expand_date(value)
         return date, timestring.Date(date).year
     except IndexError:
@@ -177,35 +282,29 @@ def get_date(soup):
 
 def get_author_from_subfield(datafield, code_name, code_aff):
     """ Dig out the author from xml subfield """
-    author = datafield.find_all(code=code_name)[0].string
-    university = datafield.find_all(code=code_aff)
-    university = university[0].string if university else ''
+    author = get_subfields(datafield, code_name)[0]
+    university = get_subfields(datafield, code_aff)
+    university = university[0] if university else ''
     return {'full_name': author, 'affiliation': university}
 
 
-def get_keywords(soup):
+def get_keywords(datafields):
     """ Parse the keywords from the xml"""
     (tag, code) = marc_tags['keywords']
-    datafields = soup.find_all(tag=tag)
-    keywords = [df.find_all(code=code)[0].string for df in datafields
-                if df.find_all(code=code)]
-    return make_keyword_dicts(keywords)
+    return make_keyword_dicts(get_first_subfields(datafields, tag, code))
 
 
-def get_collection(soup, marc_tag='collection'):
+def get_collection(datafields, marc_tag='collection'):
     """
     Finds the 980 code relating to thesis type.
     """
     (tag, code) = marc_tags[marc_tag]
-    datafields = soup.find_all(tag=tag)
-    collections = [df.find_all(code=code)[0].string for df in datafields if df.find_all(code=code)]
-    collections = filter(lambda x: x is not None, collections)
-    collections = map(lambda x: x.lower(), collections)
-    return collections
+    collections = get_first_subfields(datafields, tag, code)
+    return [collection.lower() for collection in collections if collection is not None]
 
 
-def get_subject_areas(soup):
-    subject_areas = get_collection(soup, marc_tag='subject_area')
+def get_subject_areas(datafields):
+    subject_areas = get_collection(datafields, marc_tag='subject_area')
 
     filtered = []
     for subject_area in subject_areas:
@@ -217,16 +316,18 @@ def get_subject_areas(soup):
     return list(set(filtered))
 
 
-def get_dissertation(soup):
+def get_dissertation(datafields):
     (tag, diploma_type, institution, date) = marc_tags['dissertation_note']
-    datafield = soup.find(tag=tag)
-    if datafield is None:
+    if not datafields[tag]:
         return {}
 
-    type = datafield.find(code=diploma_type).string
-    university = datafield.find(code=institution).string
-    defense_date = datafield.find(code=date).string
-    return {'type': type, 'institution': university, 'defense_date': defense_date}
+    datafield = datafields[tag][0]
+
+    def first(code):
+        values = get_subfields(datafield, code)
+        return values[0] if values else None
+
+    return {'type': first(diploma_type), 'institution': first(institution), 'defense_date': first(date)}
 
 
 def make_keyword_dicts(keywords):
@@ -21,14 +21,11 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 
-import requests
-from bs4 import BeautifulSoup
 from flask import request, Blueprint, jsonify
 
+from hepdata.modules.inspire_api.client import get_inspire_client
 from hepdata.modules.records.utils.common import record_exists
-from marcxml_parser import get_doi, get_title, get_authors, get_abstract, \
-    get_arxiv, get_collaborations, get_keywords, get_date, get_journal_info, get_year, get_collection, \
-    get_dissertation, expand_date, get_subject_areas
+from marcxml_parser import parse_marcxml
 
 blueprint = Blueprint('inspire_datasource',
                       __name__,
@@ -36,48 +33,10 @@ blueprint = Blueprint('inspire_datasource',
 
 
 def get_inspire_record_information(inspire_rec_id):
-    url = 'http://inspirehep.net/record/{0}/export/xm'.format(inspire_rec_id)
-    req = requests.get(url)
-    content = req.content
-    status = req.status_code
+    content, status = get_inspire_client().get_marcxml(inspire_rec_id)
 
     if content:
-        soup = BeautifulSoup(content, "lxml")
-
-        collection_type = get_collection(soup)
-
-        journal_info, year = get_journal_info(soup)
-        creation_date, creation_year = get_date(soup)
-
-        if year is None:
-            year = get_year(soup)
-
-        if year is None:
-            year = creation_year
-
-        content = {
-            'title': get_title(soup),
-            'doi': get_doi(soup),
-            'authors': get_authors(soup),
-            'type': get_collection(soup),
-            'abstract': get_abstract(soup),
-            'creation_date': creation_date,
-            'arxiv_id': get_arxiv(soup),
-            'collaborations': get_collaborations(soup),
-            'keywords': get_keywords(soup),
-            'journal_info': journal_info,
-            'year': year,
-            'subject_area': get_subject_areas(soup)
-        }
-
-        if 'thesis' in collection_type:
-            dissertation = get_dissertation(soup)
-            content['dissertation'] = dissertation
-            if year is None:
-                content['year'] = dissertation.get('defense_date', None)
-                if content['year'] is not None:
-                    content['creation_date'] = expand_date(content['year'])
-
+        content = parse_marcxml(content)
         status = 'success'
     return content, status
 
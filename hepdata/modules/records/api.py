@@ -30,8 +30,8 @@ from functools import wraps
 import time
 from flask import redirect, request, render_template, jsonify, current_app, Response
 from flask.ext.login import current_user
-from invenio_accounts.models import User
-from sqlalchemy.orm.exc import NoResultFound
+from invenio_db import db
+from sqlalchemy import and_, func, or_
 from werkzeug.utils import secure_filename
 
 from hepdata.modules.converter import convert_oldhepdata_to_yaml
@@ -41,14 +41,17 @@ from hepdata.modules.records.subscribers.api import is_current_user_subscribed_t
 from hepdata.modules.records.utils.common import decode_string, find_file_in_directory, allowed_file, \
     remove_file_extension, truncate_string, get_record_contents
 from hepdata.modules.records.utils.data_processing_utils import process_ctx
+from hepdata.modules.records.utils.record_cache import ACCESS_COUNT_PLACEHOLDER, fill_access_count, \
+    get_record_cache, is_record_render_cacheable
 from hepdata.modules.records.utils.submission import process_submission_directory, \
-    remove_submission, create_data_review
+    remove_submission
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.records.utils.users import get_coordinators_in_system, has_role
 from hepdata.modules.records.utils.workflow import update_action_for_submission_participant
 from hepdata.modules.records.utils.yaml_utils import split_files
 from hepdata.modules.stats.views import increment, get_count
-from hepdata.modules.submission.models import RecordVersionCommitMessage, DataSubmission, HEPSubmission, DataReview
+from hepdata.modules.submission.models import RecordVersionCommitMessage, DataSubmission, HEPSubmission, DataReview, \
+    datareview_messages
 from hepdata.utils.file_extractor import extract
 from hepdata.utils.users import get_user_from_id
 
@@ -91,6 +94,8 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
             # we get the latest version by default
             ctx["version"] = version_count
 
+        record_context = load_record_context(recid, ctx["version"])
+
         if record is not None:
             if "collaborations" in record and type(record['collaborations']) is not list:
                 collaborations = [x.strip() for x in record["collaborations"].split(",")]
@@ -99,21 +104,20 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
             authors = record.get('authors', None)
 
             create_breadcrumb_text(authors, ctx, record)
-            get_commit_message(ctx, recid)
+            get_commit_message(ctx, record_context)
 
             if authors:
                 truncate_author_list(record)
 
-            determine_user_privileges(recid, ctx)
+            determine_user_privileges(ctx, record_context)
 
         else:
             ctx['record'] = {}
-            determine_user_privileges(recid, ctx)
+            determine_user_privileges(ctx, record_context)
             ctx['show_upload_widget'] = True
             ctx['show_review_widget'] = False
 
-        ctx['reviewer_count'] = SubmissionParticipant.query.filter_by(
-            publication_recid=recid, status="primary", role="reviewer").count()
+        ctx['reviewer_count'] = record_context['reviewer_count']
         ctx['reviewers_notified'] = hepdata_submission.reviewers_notified
 
         ctx['record']['last_updated'] = hepdata_submission.last_updated
@@ -138,12 +142,7 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
 
         ctx['additional_resources'] = submission_has_resources(hepdata_submission)
 
-        # query for a related data submission
-        data_record_query = DataSubmission.query.filter_by(
-            publication_recid=recid,
-            version=ctx["version"]).order_by(DataSubmission.id.asc())
-
-        format_tables(ctx, data_record_query, data_table, recid)
+        format_tables(ctx, data_table, recid, record_context)
 
         ctx['access_count'] = get_count(recid)
         ctx['mode'] = 'record'
@@ -154,17 +153,112 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
     return ctx
 
 
-def format_tables(ctx, data_record_query, data_table, recid):
+def load_record_context(recid, version):
+    """
+    Loads what is needed to render a record about its participants,
+    the current user and the commit message of a version, in a fixed
+    number of queries whatever the number of tables or participants.
+    :param recid: publication record id
+    :param version: version of the submission to display
+    :return: dictionary with the reviewer count, the roles of the current user
+             in the submission, whether they are an admin or a coordinator of
+             the submission, whether they watch the record and the commit message
+    """
+    record_context = {
+        'reviewer_count': 0,
+        'user_roles': set(),
+        'is_admin': False,
+        'is_coordinator': False,
+        'watched': False,
+        'commit_message': None
+    }
+
+    user_id = int(current_user.get_id()) if current_user.is_authenticated else None
+
+    # the primary reviewers and the participations of the current user at once.
+    participant_filter = and_(SubmissionParticipant.status == 'primary',
+                              SubmissionParticipant.role == 'reviewer')
+    if user_id is not None:
+        participant_filter = or_(participant_filter, SubmissionParticipant.user_account == user_id)
+
+    participants = db.session.query(
+        SubmissionParticipant.role, SubmissionParticipant.status, SubmissionParticipant.user_account) \
+        .filter(SubmissionParticipant.publication_recid == recid, participant_filter).all()
+
+    for role, status, user_account in participants:
+        if status == 'primary' and role == 'reviewer':
+            record_context['reviewer_count'] += 1
+        if user_id is not None and user_account == user_id:
+            record_context['user_roles'].add(role)
+
+    if user_id is not None:
+        record_context['is_admin'] = has_role(current_user, 'admin')
+        if not record_context['is_admin']:
+            record_context['is_coordinator'] = db.session.query(
+                HEPSubmission.query.filter_by(publication_recid=recid,
+                                              coordinator=user_id).exists()).scalar()
+
+        record_context['watched'] = is_current_user_subscribed_to_record(recid)
+
+    record_context['commit_message'] = RecordVersionCommitMessage.query \
+        .filter_by(version=version, recid=recid).first()
+
+    return record_context
+
+
+def load_data_tables(recid, version):
+    """
+    Loads the tables of a version of a submission along with their reviews,
+    creating any missing review in a single insert.
+    :param recid: publication record id
+    :param version: version of the submission
+    :return: tuple of the list of DataSubmission objects, ordered by id,
+             and a dictionary of data table id to (review status, message count)
+    """
+    data_tables = DataSubmission.query.filter_by(
+        publication_recid=recid,
+        version=version).order_by(DataSubmission.id.asc()).all()
+
+    reviews = {}
+    if not data_tables:
+        return data_tables, reviews
+
+    review_rows = db.session.query(
+        DataReview.data_recid, DataReview.status, func.count(datareview_messages.c.message_id)) \
+        .outerjoin(datareview_messages, datareview_messages.c.datareview_id == DataReview.id) \
+        .filter(DataReview.publication_recid == recid, DataReview.version == version) \
+        .group_by(DataReview.id, DataReview.data_recid, DataReview.status).all()
+
+    for data_recid, status, message_count in review_rows:
+        reviews[data_recid] = (status, message_count)
+
+    missing_reviews = [data_table.id for data_table in data_tables if data_table.id not in reviews]
+    if missing_reviews:
+        db.session.bulk_insert_mappings(DataReview, [
+            {'publication_recid': recid, 'data_recid': data_recid,
+             'version': version, 'status': 'todo'}
+            for data_recid in missing_reviews])
+        db.session.commit()
+
+        for data_recid in missing_reviews:
+            reviews[data_recid] = ('todo', 0)
+
+    return data_tables, reviews
+
+
+def format_tables(ctx, data_table, recid, record_context):
     """
     Finds all the tables related to a submission and generates formats
     them for display in the UI or as JSON.
     :return:
     """
+    data_tables, reviews = load_data_tables(recid, ctx["version"])
+
     first_data_id = -1
     data_table_metadata, first_data_id = process_data_tables(
-        ctx, data_record_query, first_data_id, data_table)
-    assign_or_create_review_status(data_table_metadata, recid, ctx["version"])
-    ctx['watched'] = is_current_user_subscribed_to_record(recid)
+        ctx, data_tables, first_data_id, data_table)
+    assign_or_create_review_status(data_table_metadata, reviews)
+    ctx['watched'] = record_context['watched']
     ctx['table_to_show'] = first_data_id
     if 'table' in request.args:
         if request.args['table'] is not '':
@@ -172,24 +266,17 @@ def format_tables(ctx, data_record_query, data_table, recid):
     ctx['data_tables'] = data_table_metadata.values()
 
 
-def get_commit_message(ctx, recid):
+def get_commit_message(ctx, record_context):
     """
-    Returns a commit message for the current version if present
+    Adds the commit message for the current version if present
     :param ctx:
-    :param recid:
+    :param record_context: as returned by load_record_context
     """
-    try:
-        commit_message_query = RecordVersionCommitMessage.query \
-            .filter_by(version=ctx["version"], recid=recid)
-
-        if commit_message_query.count() > 0:
-            commit_message = commit_message_query.one()
-            ctx["revision_message"] = {
-                'version': commit_message.version,
-                'message': commit_message.message}
-
-    except NoResultFound:
-        pass
+    commit_message = record_context['commit_message']
+    if commit_message is not None:
+        ctx["revision_message"] = {
+            'version': commit_message.version,
+            'message': commit_message.message}
 
 
 def create_breadcrumb_text(authors, ctx, record):
@@ -224,6 +311,43 @@ def extract_journal_info(record):
             record['journal_info'] = "Conference Paper"
 
 
+def get_table_window_arguments(args):
+    """
+    Reads the optional row window and dependent variable projection of a
+    table request, e.g. ?offset=100&limit=50&columns=0,2
+    :param args: the request arguments
+    :return: dictionary with the offset, limit and columns to pass to select_table_data
+    :raises ValueError: if any of the arguments is not a valid non-negative integer
+    """
+    window = {'offset': 0, 'limit': None, 'columns': None}
+
+    try:
+        if args.get('offset'):
+            window['offset'] = int(args['offset'])
+        if args.get('limit'):
+            window['limit'] = int(args['limit'])
+        if args.get('columns'):
+            window['columns'] = [int(column) for column in args['columns'].split(',')]
+    except ValueError:
+        raise ValueError('offset, limit and columns must be integers.')
+
+    if window['offset'] < 0 or (window['limit'] is not None and window['limit'] < 0) \
+            or (window['columns'] is not None and min(window['columns']) < 0):
+        raise ValueError('offset, limit and columns must not be negative.')
+
+    return window
+
+
+def get_table_query(args):
+    """
+    Returns the row window and projection arguments of a record request,
+    which are passed on to the links to the individual tables.
+    :param args: the request arguments
+    :return: dictionary of the arguments which were given
+    """
+    return dict((key, args[key]) for key in ('offset', 'limit', 'columns') if args.get(key))
+
+
 def render_record(recid, record, version, output_format, light_mode=False):
 
     if user_allowed_to_perform_action(recid):
@@ -239,10 +363,14 @@ def render_record(recid, record, version, output_format, light_mode=False):
     hepdata_submission = get_latest_hepsubmission(publication_recid=recid, version=version)
 
     if hepdata_submission is not None:
+        if is_record_render_cacheable(hepdata_submission):
+            return render_cached_record(recid, record, version, version_count, hepdata_submission,
+                                        output_format, light_mode)
+
         ctx = format_submission(recid, record, version, version_count, hepdata_submission)
         increment(recid)
         if output_format == "json":
-            ctx = process_ctx(ctx, light_mode)
+            ctx = process_ctx(ctx, light_mode, table_query=get_table_query(request.args))
             return jsonify(ctx)
         else:
             return render_template('hepdata_records/publication_record.html',
@@ -264,7 +392,7 @@ def render_record(recid, record, version, output_format, light_mode=False):
             ctx['table_name'] = record['title']
 
             if output_format == "json":
-                ctx = process_ctx(ctx, light_mode)
+                ctx = process_ctx(ctx, light_mode, table_query=get_table_query(request.args))
 
                 return jsonify(ctx)
             else:
@@ -273,6 +401,41 @@ def render_record(recid, record, version, output_format, light_mode=False):
             return render_template('hepdata_theme/404.html')
 
 
+def render_cached_record(recid, record, version, version_count, hepdata_submission,
+                         output_format, light_mode=False):
+    """
+    Renders a finished version of a record for an anonymous user, reusing
+    a previous render of the same version where possible. Renders are
+    cached with a placeholder for the access count, which is filled in
+    on every view.
+    :return: the HTML page or JSON response
+    """
+    table_query = get_table_query(request.args)
+    cache = get_record_cache()
+    key = cache.make_key(recid, version, version_count, output_format, light_mode,
+                         request.args.get('table', ''), table_query)
+
+    rendered = cache.get(key)
+    if rendered is None:
+        ctx = format_submission(recid, record, version, version_count, hepdata_submission)
+        ctx['access_count'] = {'sum': ACCESS_COUNT_PLACEHOLDER}
+
+        if output_format == "json":
+            ctx = process_ctx(ctx, light_mode, table_query=table_query)
+            rendered = jsonify(ctx).get_data(as_text=True)
+        else:
+            rendered = render_template('hepdata_records/publication_record.html',
+                                       ctx=ctx)
+        cache.set(key, rendered)
+
+    rendered = fill_access_count(rendered, get_count(recid)['sum'], output_format)
+    increment(recid)
+
+    if output_format == "json":
+        return Response(rendered, mimetype='application/json')
+    return rendered
+
+
 def process_payload(recid, file, redirect_url):
     if file and (allowed_file(file.filename)):
         errors = process_zip_archive(file, recid)
@@ -338,7 +501,13 @@ def process_zip_archive(file, id):
         else:
             basepath, submission_file_path = result
 
-    return process_submission_directory(basepath, submission_file_path, id)
+    # an uploaded zip can be reused as the download of the submission.
+    original_archive = None
+    if submission_found and filename.endswith('.zip'):
+        original_archive = file_path
+
+    return process_submission_directory(basepath, submission_file_path, id,
+                                        original_archive=original_archive)
 
 
 def check_and_convert_from_oldhepdata(input_directory, id, timestamp):
@@ -388,89 +557,46 @@ def query_messages_for_data_review(data_review_record, messages):
     return messages
 
 
-def assign_or_create_review_status(data_table_metadata, publication_recid,
-                                   version):
+def assign_or_create_review_status(data_table_metadata, reviews):
     """
-    If a review already exists, it will be attached to the current data record.
-    If a review does not exist for a data table, it will be created.
+    Attaches the review of each table to its metadata.
     :param data_table_metadata: the metadata describing the main table.
-    :param publication_recid: publication record id
+    :param reviews: dictionary of data table id to (review status, message count),
+                    as returned by load_data_tables, which creates the missing reviews
     """
-    data_review_query = DataReview.query.filter_by(
-        publication_recid=publication_recid, version=version)
-    # this method should also create all the DataReviews for data_tables that
-    # are not currently present to avoid
-    # only creating data reviews when the review is clicked explicitly.
-    assigned_tables = []
-    if data_review_query.count() > 0:
-        data_review_records = data_review_query.all()
-
-        for data_review in data_review_records:
-            if data_review.data_recid in data_table_metadata:
-                data_table_metadata[data_review.data_recid][
-                    "review_flag"] = data_review.status
-                data_table_metadata[data_review.data_recid]["review_status"] = \
-                    RECORD_PLAIN_TEXT[data_review.status]
-                data_table_metadata[data_review.data_recid]["messages"] = len(
-                    data_review.messages) > 0
-                assigned_tables.append(data_review.data_recid)
-
-    # now create the missing data reviews
     for data_table_id in data_table_metadata:
-        if data_table_id not in assigned_tables:
-            data_record = create_data_review(
-                data_table_id, publication_recid, version=version)
-            data_table_metadata[data_table_id][
-                "review_flag"] = data_record.status
-            data_table_metadata[data_table_id]["review_status"] = \
-                RECORD_PLAIN_TEXT[data_record.status]
+        status, message_count = reviews.get(data_table_id, ('todo', 0))
+        data_table_metadata[data_table_id]["review_flag"] = status
+        data_table_metadata[data_table_id]["review_status"] = \
+            RECORD_PLAIN_TEXT[status]
+        data_table_metadata[data_table_id]["messages"] = message_count > 0
 
 
-def determine_user_privileges(recid, ctx):
+def determine_user_privileges(ctx, record_context):
+    """
+    :param ctx:
+    :param record_context: as returned by load_record_context
+    """
     # show_review_area = not show_upload_area
-    ctx['show_review_widget'] = False
-    ctx['show_upload_widget'] = False
-    ctx['is_submission_coordinator_or_admin'] = False
-
-    if current_user.is_authenticated:
-        user_id = current_user.get_id()
-        participant_records = SubmissionParticipant.query.filter_by(
-            user_account=user_id, publication_recid=recid).all()
-
-        for participant_record in participant_records:
-            if participant_record is not None:
-                if participant_record.role == 'reviewer':
-                    ctx['show_review_widget'] = True
-
-                if participant_record.role == 'uploader':
-                    ctx['show_upload_widget'] = True
-
-        user = User.query.get(current_user.get_id())
-        if has_role(user, 'admin'):
-            ctx['is_submission_coordinator_or_admin'] = True
-        else:
-            matching_records = HEPSubmission.query.filter_by(
-                publication_recid=recid,
-                coordinator=current_user.get_id()).count()
-
-            if matching_records > 0:
-                ctx['is_submission_coordinator_or_admin'] = True
+    ctx['show_review_widget'] = 'reviewer' in record_context['user_roles']
+    ctx['show_upload_widget'] = 'uploader' in record_context['user_roles']
+    ctx['is_submission_coordinator_or_admin'] = \
+        record_context['is_admin'] or record_context['is_coordinator']
 
-        ctx['show_upload_widget'] = (
-            ctx['show_upload_widget'] or ctx[
-                'is_submission_coordinator_or_admin'])
+    ctx['show_upload_widget'] = (
+        ctx['show_upload_widget'] or ctx[
+            'is_submission_coordinator_or_admin'])
 
 
-def process_data_tables(ctx, data_record_query, first_data_id,
+def process_data_tables(ctx, data_tables, first_data_id,
                         data_table=None):
     data_table_metadata = OrderedDict()
     ctx['show_upload_area'] = False
 
-    if ctx['show_upload_widget'] and data_record_query.count() == 0:
+    if ctx['show_upload_widget'] and len(data_tables) == 0:
         ctx['show_upload_area'] = True
-    elif data_record_query.count() > 0:
-        record_submissions = data_record_query.all()
-        for submission_record in record_submissions:
+    else:
+        for submission_record in data_tables:
             processed_name = "".join(submission_record.name.split())
             data_table_metadata[submission_record.id] = {
                 "id": submission_record.id, "processed_name": processed_name,
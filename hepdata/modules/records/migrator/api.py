@@ -25,7 +25,6 @@
 from __future__ import absolute_import, print_function
 import socket
 from datetime import datetime, timedelta
-from urllib2 import HTTPError
 
 import requests
 from celery import shared_task
@@ -37,6 +36,7 @@ from invenio_db import db
 from hepdata.ext.elasticsearch.api import get_records_matching_field, index_record_ids
 from hepdata.modules.inspire_api.views import get_inspire_record_information
 from hepdata.modules.dashboard.views import do_finalise
+from hepdata.modules.records.migrator.download import download, get_download_manifest
 from hepdata.modules.records.utils.common import record_exists
 
 from hepdata.modules.records.utils.submission import \
@@ -223,71 +223,109 @@ class Migrator(object):
 
     def __init__(self, base_url="http://hepdata.cedar.ac.uk/view/{0}/yaml"):
         self.base_url = base_url
+        self.session = requests.Session()
+
+    def get_output_location(self, inspire_id):
+        """
+        :param inspire_id:
+        :return: directory the split files of the record are stored in
+        """
+        return os.path.join(current_app.config["CFG_DATADIR"], inspire_id)
+
+    def is_downloaded(self, inspire_id):
+        """
+        :param inspire_id:
+        :return: whether the files of the record are already split and stored
+        """
+        output_location = self.get_output_location(inspire_id)
+        return os.path.exists(output_location) and (get_file_in_directory(output_location, 'yaml') is not None)
+
+    def split_downloaded_file(self, inspire_id, file_location):
+        """
+        Splits a downloaded file into a submission directory,
+        then removes the downloaded file.
+        :param inspire_id:
+        :param file_location: path of the downloaded file
+        :return: output location
+        """
+        output_location = self.get_output_location(inspire_id)
+        split_files(file_location, output_location, "{0}.zip".format(output_location))
+
+        # remove temporary download file after processing
+        try:
+            os.remove(file_location)
+        except:
+            log.info('Unable to remove {0}'.format(file_location))
+
+        return output_location
 
     def prepare_files_for_submission(self, inspire_id, force_retrieval=False):
         """
         Either returns a file if it already exists, or downloads it and
         splits it.
         :param inspire_id:
-        :return: output location if succesful, None if not
+        :return: tuple of the output location, None if not successful, and
+            the Download, None if no download was required
         """
-        output_location = os.path.join(current_app.config["CFG_DATADIR"], inspire_id)
-
-        download = not os.path.exists(output_location) or (get_file_in_directory(output_location, 'yaml') is None)
+        output_location = self.get_output_location(inspire_id)
+        _download = None
 
-        if download or force_retrieval:
+        if not self.is_downloaded(inspire_id) or force_retrieval:
             print("Downloading file for {0}".format(inspire_id))
-            file_location = self.download_file(inspire_id)
-
-            if file_location:
-                output_location = os.path.join(current_app.config["CFG_DATADIR"], inspire_id)
-                split_files(file_location, output_location, "{0}.zip".format(output_location))
+            _download = self.download_file(inspire_id)
 
-                # remove temporary download file after processing
-                try:
-                    os.remove(file_location)
-                except:
-                    log.info('Unable to remove {0}'.format(file_location))
+            if _download:
+                output_location = self.split_downloaded_file(inspire_id, _download.file_location)
             else:
-                return None
+                return None, None
         else:
             print("File for {0} already in system...no download required.".format(inspire_id))
 
-        return output_location
+        return output_location, _download
 
     @shared_task
     def update_file(inspire_id, recid, only_record_information=False, send_tweet=False, convert=False):
         self = Migrator()
 
-        output_location = self.prepare_files_for_submission(inspire_id, force_retrieval=True)
-        if output_location:
-            updated_record_information = self.retrieve_publication_information(inspire_id)
-            record_information = update_record(recid, updated_record_information)
-
-            if not only_record_information:
-                try:
-                    recid = self.load_submission(
-                        record_information, output_location, os.path.join(output_location, "submission.yaml"),
-                        update=True)
-
-                    if recid is not None:
-                        do_finalise(recid, publication_record=record_information,
-                                    force_finalise=True, send_tweet=send_tweet, update=True, convert=convert)
-
-                except FailedSubmission as fe:
-                    log.error(fe.message)
-                    fe.print_errors()
-                    remove_submission(fe.record_id)
-            else:
-                index_record_ids([record_information["recid"]])
+        if not only_record_information:
+            # files already split are only downloaded again if they have changed since.
+            _download = self.download_file(inspire_id, conditional=self.is_downloaded(inspire_id))
+            if _download is None:
+                return
 
-        else:
-            log.error("Failed to load {0}".format(inspire_id))
+            if not _download.changed:
+                log.info("{0} is unchanged since it was last loaded, "
+                         "only updating the record information.".format(inspire_id))
+                only_record_information = True
+
+        updated_record_information = self.retrieve_publication_information(inspire_id)
+        record_information = update_record(recid, updated_record_information)
+
+        if only_record_information:
+            index_record_ids([record_information["recid"]])
+            return
+
+        output_location = self.split_downloaded_file(inspire_id, _download.file_location)
+
+        try:
+            recid = self.load_submission(
+                record_information, output_location, os.path.join(output_location, "submission.yaml"),
+                update=True)
+
+            if recid is not None:
+                do_finalise(recid, publication_record=record_information,
+                            force_finalise=True, send_tweet=send_tweet, update=True, convert=convert)
+                get_download_manifest().update(_download)
+
+        except FailedSubmission as fe:
+            log.error(fe.message)
+            fe.print_errors()
+            remove_submission(fe.record_id)
 
     @shared_task
     def load_file(inspire_id, send_tweet=False, convert=False):
         self = Migrator()
-        output_location = self.prepare_files_for_submission(inspire_id)
+        output_location, _download = self.prepare_files_for_submission(inspire_id)
         if output_location:
 
             record_information = self.retrieve_publication_information(inspire_id)
@@ -299,6 +337,8 @@ class Migrator(object):
                 if recid is not None:
                     do_finalise(recid, publication_record=record_information,
                                 force_finalise=True, send_tweet=send_tweet, convert=convert)
+                    if _download is not None:
+                        get_download_manifest().update(_download)
                     return True
 
             except FailedSubmission as fe:
@@ -310,34 +350,21 @@ class Migrator(object):
             log.error("Failed to load " + inspire_id)
             return False
 
-    def download_file(self, inspire_id):
+    def download_file(self, inspire_id, conditional=False):
         """
+        Streams the YAML of a record to a temporary file, retrying on errors.
         :param inspire_id:
-        :return:
+        :param conditional: whether to skip the download when the content is
+            unchanged since the record was last loaded, see download.download
+        :return: Download, or None if the download failed
         """
-        import requests
-        import tempfile
-
-        try:
-            url = self.base_url.format(inspire_id)
-            response = requests.get(url)
-            if response.ok:
-                yaml = response.text
-                # save to tmp file
-
-                tmp_file = tempfile.NamedTemporaryFile(dir=current_app.config["CFG_TMPDIR"],
-                                                       delete=False)
-                tmp_file.write(yaml)
-                tmp_file.close()
-                return tmp_file.name
-            else:
-                log.error('Non OK response from endpoint at {0}'.format(url))
-                return None
-
-        except HTTPError as e:
+        _download = download(self.session, self.base_url.format(inspire_id), current_app.config["CFG_TMPDIR"],
+                             manifest=get_download_manifest() if conditional else None,
+                             timeout=current_app.config.get('CFG_MIGRATION_DOWNLOAD_TIMEOUT', 60),
+                             retries=current_app.config.get('CFG_MIGRATION_DOWNLOAD_RETRIES', 3))
+        if _download is None:
             log.error("Failed to download {0}".format(inspire_id))
-            log.error(e.message)
-            return None
+        return _download
 
     def retrieve_publication_information(self, inspire_id):
         """
@@ -351,13 +378,23 @@ class Migrator(object):
             arxiv_id
             collaboration
         """
+        return create_record(self.fetch_publication_information(inspire_id))
+
+    def fetch_publication_information(self, inspire_id):
+        """
+        Gets the information about a publication from INSPIRE,
+        without creating its record.
+        :param inspire_id: id for record to get. If this contains
+        "ins", the "ins" is removed.
+        :return: dict of the publication information
+        """
         if "ins" in inspire_id:
             inspire_id = int(inspire_id.replace("ins", ""))
 
         content, status = get_inspire_record_information(inspire_id)
 
         content["inspire_id"] = inspire_id
-        return create_record(content)
+        return content
 
     def load_submission(self, record_information, file_base_path,
                         submission_yaml_file_location, update=False):
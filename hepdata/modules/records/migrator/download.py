@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Conditional, streamed downloads of records from the legacy HEPData site."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from flask import current_app
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+_download_manifest = None
+
+# changed is False when the content is the same as when it was last loaded,
+# in which case there is no file_location.
+Download = namedtuple('Download', ['url', 'file_location', 'changed', 'etag', 'last_modified', 'content_hash'])
+
+
+class DownloadManifest(object):
+    """
+    Remembers the ETag, Last-Modified date and content hash of each URL
+    whose content has been loaded, to make conditional requests for it and
+    to recognise unchanged content. Kept as a JSON file which is replaced
+    atomically on every change.
+    """
+
+    def __init__(self, file_location):
+        self.file_location = file_location
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not self.file_location or not os.path.exists(self.file_location):
+            return {}
+        try:
+            with open(self.file_location, 'r') as manifest_file:
+                return json.load(manifest_file)
+        except ValueError:
+            log.error('Ignoring the unreadable download manifest {0}'.format(self.file_location))
+            return {}
+
+    def get(self, url):
+        """
+        :param url:
+        :return: dict with the etag, last_modified and content_hash of the url, or None
+        """
+        with self._lock:
+            return self._read().get(url)
+
+    def update(self, download):
+        """
+        Records a download once its content has been loaded successfully.
+        The manifest is read again first, as other processes may have changed it.
+        :param download: Download
+        """
+        if not self.file_location:
+            return
+
+        with self._lock:
+            entries = self._read()
+            entries[download.url] = {
+                'etag': download.etag,
+                'last_modified': download.last_modified,
+                'content_hash': download.content_hash,
+                'time': time.time()
+            }
+
+            directory = os.path.dirname(os.path.abspath(self.file_location))
+            file_descriptor, tmp_location = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'w') as manifest_file:
+                json.dump(entries, manifest_file)
+            os.rename(tmp_location, self.file_location)
+
+
+def get_download_manifest():
+    """
+    Returns the manifest at CFG_MIGRATION_MANIFEST_FILE, creating it on first use.
+    :return: DownloadManifest instance
+    """
+    global _download_manifest
+    if _download_manifest is None:
+        _download_manifest = DownloadManifest(current_app.config.get('CFG_MIGRATION_MANIFEST_FILE'))
+    return _download_manifest
+
+
+def get_with_retries(session, url, headers=None, timeout=60, retries=3, backoff=2):
+    """
+    Makes a streamed GET request, retrying connection errors, timeouts and
+    server errors after waiting backoff, 2 * backoff, 4 * backoff... seconds.
+    :return: requests.Response, whose body has not been read yet
+    """
+    attempt = 0
+    while True:
+        try:
+            response = session.get(url, headers=headers, timeout=timeout, stream=True)
+            if response.status_code < 500 or attempt >= retries:
+                return response
+            response.close()
+            log.error('Error {0} from {1}'.format(response.status_code, url))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries:
+                raise
+            log.error('Unable to reach {0}: {1}'.format(url, e))
+
+        time.sleep(backoff * 2 ** attempt)
+        attempt += 1
+
+
+def write_response(response, directory):
+    """
+    Streams the body of a response to a temporary file, hashing it as it goes.
+    :param response: streamed requests.Response
+    :param directory: where the file is created
+    :return: tuple of the file location and the sha1 of the content
+    """
+    content_hash = hashlib.sha1()
+    tmp_file = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+    try:
+        with tmp_file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                content_hash.update(chunk)
+                tmp_file.write(chunk)
+    except Exception:
+        os.remove(tmp_file.name)
+        raise
+    finally:
+        response.close()
+
+    return tmp_file.name, content_hash.hexdigest()
+
+
+def download(session, url, directory, manifest=None, timeout=60, retries=3, backoff=2):
+    """
+    Downloads a URL to a temporary file. When a manifest is given, the
+    request is conditional on the ETag and Last-Modified date the manifest
+    has for the URL, and content whose hash matches the manifest is
+    discarded; the manifest is not updated, see DownloadManifest.update.
+    :param session: requests.Session
+    :param url:
+    :param directory: where the file is created
+    :param manifest: DownloadManifest, or None for an unconditional download
+    :return: Download, or None if the download failed
+    """
+    entry = manifest.get(url) if manifest else None
+
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        response = get_with_retries(session, url, headers=headers, timeout=timeout,
+                                    retries=retries, backoff=backoff)
+
+        if response.status_code == 304 and entry:
+            response.close()
+            return Download(url, None, False, entry.get('etag'), entry.get('last_modified'),
+                            entry.get('content_hash'))
+
+        if not response.ok:
+            response.close()
+            log.error('Non OK response from endpoint at {0}'.format(url))
+            return None
+
+        file_location, content_hash = write_response(response, directory)
+    except requests.RequestException as e:
+        log.error('Failed to download {0}: {1}'.format(url, e))
+        return None
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+
+    if entry and entry.get('content_hash') == content_hash:
+        os.remove(file_location)
+        return Download(url, None, False, etag, last_modified, content_hash)
+
+    return Download(url, file_location, True, etag, last_modified, content_hash)
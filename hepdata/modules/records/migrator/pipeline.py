@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Staged, concurrent migration of records from the legacy HEPData site."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from flask import current_app
+from invenio_db import db
+
+from hepdata.modules.records.migrator.api import FailedSubmission, Migrator, update_submissions
+from hepdata.modules.records.migrator.download import get_download_manifest
+from hepdata.modules.records.utils.common import record_exists
+from hepdata.modules.records.utils.submission import remove_submission
+from hepdata.modules.records.utils.workflow import create_record
+from hepdata.modules.records.utils.yaml_utils import write_split_files
+from hepdata.utils.file_extractor import get_file_in_directory
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+# tells the workers of a stage that there is nothing left to process.
+_DONE = object()
+
+
+class MigrationError(Exception):
+    """ Raised by a stage which could not process a record. """
+    pass
+
+
+def split_downloaded_file(args):
+    """
+    Splits a downloaded file into its submission directory, then removes
+    the downloaded file. This runs in the split processes of
+    MigrationPipeline, so must not use the database or the application context.
+    :param args: tuple of the inspire id, the downloaded file (None if the
+                 record is already split), the output location, and the
+                 bounded_size and chunk_size of write_split_files
+    :return: tuple of the inspire id, the output location, the error
+             if the split failed (else None) and the time it took
+    """
+    inspire_id, file_location, output_location, bounded_size, chunk_size = args
+    start = time.time()
+    try:
+        if file_location:
+            try:
+                write_split_files(file_location, output_location, "{0}.zip".format(output_location),
+                                  bounded_size=bounded_size, chunk_size=chunk_size)
+            finally:
+                os.remove(file_location)
+
+        if get_file_in_directory(output_location, 'yaml') is None:
+            raise MigrationError('No files were split for {0}'.format(inspire_id))
+    except Exception as e:
+        return inspire_id, None, str(e), time.time() - start
+
+    return inspire_id, output_location, None, time.time() - start
+
+
+class StageCounters(object):
+    """
+    Thread safe counts of the records each stage has processed or failed,
+    and of the time spent on them, to report the throughput of each stage.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.started = time.time()
+        self._counts = dict((stage, {'processed': 0, 'failed': 0, 'busy': 0.0}) for stage in stages)
+        self._lock = threading.Lock()
+
+    def add(self, stage, duration, failed=False):
+        with self._lock:
+            self._counts[stage]['failed' if failed else 'processed'] += 1
+            self._counts[stage]['busy'] += duration
+
+    def get_summary(self):
+        """
+        :return: dict of stage to its processed and failed counts, the number
+                 of records it processed per second since the start, and the
+                 average number of seconds it spent on each record
+        """
+        elapsed = max(time.time() - self.started, 1e-6)
+        summary = {}
+        with self._lock:
+            for stage, counts in self._counts.items():
+                total = counts['processed'] + counts['failed']
+                summary[stage] = {
+                    'processed': counts['processed'],
+                    'failed': counts['failed'],
+                    'per_second': counts['processed'] / elapsed,
+                    'seconds_per_record': counts['busy'] / total if total else 0.0
+                }
+        return summary
+
+    def report(self):
+        summary = self.get_summary()
+        for stage in self.stages:
+            print('{0:>10}: {1[processed]} processed, {1[failed]} failed, '
+                  '{1[per_second]:.2f}/s, {1[seconds_per_record]:.2f}s each'.format(stage, summary[stage]))
+
+
+class MigrationLedger(object):
+    """
+    Persistent record of the outcome of each migrated record, kept as a file
+    of JSON lines which is only ever appended to. The last line for a record
+    wins, so failed records can be retried and their new outcome recorded.
+    """
+
+    def __init__(self, file_location):
+        self.file_location = file_location
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        :return: dict of inspire id to its latest entry
+        """
+        entries = {}
+        if not self.file_location or not os.path.exists(self.file_location):
+            return entries
+
+        with open(self.file_location, 'r') as ledger_file:
+            for line in ledger_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line cut short by an interruption.
+                    continue
+                entries[entry['inspire_id']] = entry
+        return entries
+
+    def mark(self, inspire_id, status, stage=None, error=None):
+        """
+        Records the outcome of a record.
+        :param status: done or failed
+        :param stage: the stage which failed
+        :param error: description of the failure
+        """
+        if not self.file_location:
+            return
+
+        entry = json.dumps({'inspire_id': inspire_id, 'status': status, 'stage': stage,
+                            'error': error, 'time': datetime.now().isoformat()})
+        with self._lock:
+            with open(self.file_location, 'ab+') as ledger_file:
+                # a line cut short by an interruption is ended first, so the entry is not merged into it.
+                ledger_file.seek(0, os.SEEK_END)
+                if ledger_file.tell() > 0:
+                    ledger_file.seek(-1, os.SEEK_END)
+                    if ledger_file.read(1) != b'\n':
+                        entry = '\n' + entry
+                ledger_file.write((entry + '\n').encode('utf-8'))
+                ledger_file.flush()
+                os.fsync(ledger_file.fileno())
+
+    def get_pending(self, inspire_ids, retry_failed=True):
+        """
+        :param inspire_ids: the ids to migrate
+        :param retry_failed: whether ids which failed before are migrated again
+        :return: the ids which still need migrating, in order
+        """
+        entries = self.load()
+        pending = []
+        for inspire_id in inspire_ids:
+            entry = entries.get(inspire_id)
+            if entry is None or (retry_failed and entry['status'] == 'failed'):
+                pending.append(inspire_id)
+        return pending
+
+
+class MigrationPipeline(object):
+    """
+    Migrates records in four stages, each with its own pool of workers:
+    downloading from the legacy site and fetching from INSPIRE are limited
+    to network_workers each, so the upstream servers see a bounded number of
+    requests; splitting the downloaded files is done by a pool of cpu_workers
+    processes, as the YAML loader and dumper hold the GIL; and loading into
+    the database and the index is done by a single worker thread, which
+    validates the data files itself rather than forking from a threaded
+    process. Stages are connected by bounded queues, so a stage which falls
+    behind holds back the ones before it.
+    """
+
+    STAGES = ('download', 'split', 'inspire', 'load')
+
+    def __init__(self, migrator=None, network_workers=4, cpu_workers=None, queue_size=None,
+                 ledger_file=None, send_tweet=False, convert=False, report_every=50):
+        self.migrator = migrator or Migrator()
+        self.workers = {
+            'download': network_workers,
+            'split': cpu_workers or multiprocessing.cpu_count(),
+            'inspire': network_workers,
+            'load': 1
+        }
+        self.queue_size = queue_size or 2 * max(self.workers.values())
+        self.ledger = MigrationLedger(ledger_file)
+        self.counters = StageCounters(self.STAGES)
+        self.send_tweet = send_tweet
+        self.convert = convert
+        self.report_every = report_every
+
+    def download(self, inspire_id):
+        if self.migrator.is_downloaded(inspire_id):
+            return inspire_id, None
+
+        _download = self.migrator.download_file(inspire_id)
+        if _download is None:
+            raise MigrationError('Unable to download {0}'.format(inspire_id))
+        return inspire_id, _download
+
+    def _run_split_stage(self, pool, input_queue, output_queue):
+        """
+        Feeds the split processes from the queue of downloaded files.
+        At most queue_size files are handed to the pool at a time,
+        so the pool does not drain the queue and lift its backpressure.
+        The downloads are kept here, as they are recorded once loaded.
+        """
+        in_flight = threading.BoundedSemaphore(self.queue_size)
+        downloads = {}
+
+        def get_tasks():
+            for inspire_id, _download in iter(input_queue.get, _DONE):
+                in_flight.acquire()
+                downloads[inspire_id] = _download
+                yield (inspire_id, _download.file_location if _download else None,
+                       self.output_locations[inspire_id],
+                       self.split_config['bounded_size'], self.split_config['chunk_size'])
+
+        for inspire_id, output_location, error, duration in pool.imap_unordered(split_downloaded_file, get_tasks()):
+            in_flight.release()
+            _download = downloads.pop(inspire_id)
+            if error:
+                self.counters.add('split', duration, failed=True)
+                log.error('Failed to split {0}: {1}'.format(inspire_id, error))
+                self.ledger.mark(inspire_id, 'failed', 'split', error)
+            else:
+                self.counters.add('split', duration)
+                output_queue.put((inspire_id, output_location, _download))
+
+    def fetch_publication_information(self, inspire_id, output_location, _download):
+        return inspire_id, output_location, _download, self.migrator.fetch_publication_information(inspire_id)
+
+    def load(self, inspire_id, output_location, _download, publication_information):
+        from hepdata.modules.dashboard.views import do_finalise
+
+        record_information = create_record(publication_information)
+        recid = self.migrator.load_submission(
+            record_information, output_location,
+            os.path.join(output_location, "submission.yaml"))
+        if recid is None:
+            raise MigrationError('No submission was loaded for {0}'.format(inspire_id))
+
+        do_finalise(recid, publication_record=record_information,
+                    force_finalise=True, send_tweet=self.send_tweet, convert=self.convert)
+        if _download is not None:
+            get_download_manifest().update(_download)
+
+        self.ledger.mark(inspire_id, 'done')
+
+        completed = sum(self.counters.get_summary()['load'][count] for count in ('processed', 'failed')) + 1
+        if self.report_every and completed % self.report_every == 0:
+            self.counters.report()
+
+    def _run_stage(self, app, stage, function, input_queue, output_queue):
+        with app.app_context():
+            while True:
+                item = input_queue.get()
+                if item is _DONE:
+                    break
+
+                start = time.time()
+                try:
+                    result = function(*item)
+                except Exception as e:
+                    # a failed flush leaves the session unusable for the next records.
+                    db.session.rollback()
+                    self.counters.add(stage, time.time() - start, failed=True)
+                    log.error('Failed to {0} {1}: {2}'.format(stage, item[0], e))
+                    self.ledger.mark(item[0], 'failed', stage, str(e))
+
+                    if isinstance(e, FailedSubmission):
+                        e.print_errors()
+                        remove_submission(e.record_id)
+                    continue
+
+                self.counters.add(stage, time.time() - start)
+                if output_queue is not None:
+                    output_queue.put(result)
+
+    def run(self, inspire_ids, retry_failed=True):
+        """
+        Migrates the given records, skipping those the ledger has as done
+        (and as failed, unless retry_failed).
+        :param inspire_ids: ids in the format insXXX
+        :param retry_failed: whether to retry the records which failed before
+        :return: dict of stage counters, see StageCounters.get_summary
+        """
+        pending = self.ledger.get_pending(inspire_ids, retry_failed)
+        print('Migrating {0} of {1} records.'.format(len(pending), len(inspire_ids)))
+
+        app = current_app._get_current_object()
+        # the split processes cannot look these up in the application context.
+        self.output_locations = dict((inspire_id, self.migrator.get_output_location(inspire_id))
+                                     for inspire_id in pending)
+        self.split_config = {
+            'bounded_size': app.config.get('CFG_YAML_SPLIT_BOUNDED_SIZE', 50 * 1024 ** 2),
+            'chunk_size': app.config.get('CFG_YAML_SPLIT_CHUNK_SIZE', 5000)
+        }
+
+        # forked before any thread is started, so no lock is held in the children.
+        pool = multiprocessing.Pool(self.workers['split'])
+
+        functions = {
+            'download': self.download,
+            'inspire': self.fetch_publication_information,
+            'load': self.load
+        }
+
+        queues = [Queue(maxsize=self.queue_size) for _ in self.STAGES]
+        threads = []
+        for index, stage in enumerate(self.STAGES):
+            output_queue = queues[index + 1] if index + 1 < len(self.STAGES) else None
+            if stage == 'split':
+                stage_threads = [threading.Thread(target=self._run_split_stage,
+                                                  args=(pool, queues[index], output_queue))]
+            else:
+                stage_threads = [threading.Thread(target=self._run_stage,
+                                                  args=(app, stage, functions[stage], queues[index], output_queue))
+                                 for _ in range(self.workers[stage])]
+            for thread in stage_threads:
+                thread.daemon = True
+                thread.start()
+            threads.append(stage_threads)
+
+        try:
+            # blocks whenever the download stage is full.
+            for inspire_id in pending:
+                queues[0].put((inspire_id,))
+
+            # each stage is stopped once the stage before it has finished.
+            for index, stage in enumerate(self.STAGES):
+                for _ in threads[index]:
+                    queues[index].put(_DONE)
+                for thread in threads[index]:
+                    thread.join()
+        finally:
+            pool.close()
+            pool.join()
+
+        self.counters.report()
+        return self.counters.get_summary()
+
+
+def migrate_files(inspire_ids, send_tweet=False, convert=False, network_workers=4,
+                  cpu_workers=None, retry_failed=True):
+    """
+    Counterpart of load_files which migrates new records through a
+    MigrationPipeline, keeping track of progress in CFG_MIGRATION_LEDGER_FILE
+    so that an interrupted migration can be resumed.
+    Records which already exist are updated as load_files does.
+    :param inspire_ids: array of inspire ids to load (in the format insXXX).
+    :param retry_failed: whether to retry records which failed previously
+    :return: dict of stage counters
+    """
+    to_load = []
+    for inspire_id in inspire_ids:
+        if record_exists(inspire_id=inspire_id.replace("ins", "")):
+            log.info("Updating {}".format(inspire_id))
+            update_submissions.delay([inspire_id], send_tweet)
+        else:
+            to_load.append(inspire_id)
+
+    pipeline = MigrationPipeline(network_workers=network_workers, cpu_workers=cpu_workers,
+                                 ledger_file=current_app.config.get('CFG_MIGRATION_LEDGER_FILE'),
+                                 send_tweet=send_tweet, convert=convert)
+    return pipeline.run(to_load, retry_failed=retry_failed)
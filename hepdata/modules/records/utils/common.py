@@ -24,8 +24,10 @@
 
 from flask import current_app
 from invenio_pidstore.errors import PIDDoesNotExistError
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.api import Record
+from invenio_records.models import RecordMetadata
 import os
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -234,6 +236,37 @@ def get_record_by_id(recid):
         return None
 
 
+def get_records_by_ids(recids):
+    """
+    Loads several records at once, with one query for their PIDs and one
+    for their metadata, rather than resolving each recid on its own.
+    Recids without a registered record are skipped.
+    :param recids: list of record ids
+    :return: list of Record objects, in the order of recids
+    """
+    if not recids:
+        return []
+
+    pids = PersistentIdentifier.query.filter(
+        PersistentIdentifier.pid_type == 'recid',
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+        PersistentIdentifier.pid_value.in_([str(recid) for recid in recids])
+    ).all()
+
+    recid_by_uuid = dict((pid.object_uuid, int(pid.pid_value)) for pid in pids)
+    if not recid_by_uuid:
+        return []
+
+    records = {}
+    for metadata in RecordMetadata.query.filter(
+            RecordMetadata.id.in_(list(recid_by_uuid.keys()))):
+        if metadata.json is not None:
+            records[recid_by_uuid[metadata.id]] = Record(metadata.json, model=metadata)
+
+    return [records[recid] for recid in recids if recid in records]
+
+
 def record_exists(*args, **kwargs):
     count = HEPSubmission.query.filter_by(**kwargs).count()
     return count > 0
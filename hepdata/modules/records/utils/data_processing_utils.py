@@ -25,6 +25,7 @@ from __future__ import absolute_import, print_function
 
 from flask import current_app
 from ordereddict import OrderedDict
+from werkzeug.urls import url_encode
 
 
 def pad_independent_variables(table_contents):
@@ -43,25 +44,103 @@ def pad_independent_variables(table_contents):
     table_contents["independent_variables"].append(_ind_vars)
 
 
-def fix_nan_inf(value):
+def get_special_values():
+    """
+    Returns the set of string representations of values (NaN, +inf, -inf)
+    which are converted to strings for display.
+    :return: frozenset of strings
+    """
+    return frozenset(current_app.config['SPECIAL_VALUES'])
+
+
+def fix_nan_inf(value, special_values=None):
     """
     Converts NaN, +inf, and -inf values to strings
     :param value:
+    :param special_values: set returned by get_special_values(). Pass it in when
+           processing many values so the configuration is only looked up once.
     :return:
     """
-    keys = ['value', 'high', 'low']
-    for key in keys:
-        if key in value and str(value[key]) in current_app.config['SPECIAL_VALUES']:
+    if special_values is None:
+        special_values = get_special_values()
+
+    for key in ('value', 'high', 'low'):
+        if key in value and str(value[key]) in special_values:
             value[key] = str(value['value'])
     return value
 
 
+def relabel_duplicate_errors(errors):
+    """
+    Makes the error labels of a single value unique by appending _1, _2, ...
+    to every label which appears more than once.
+    :param errors: list of error dictionaries, modified in place
+    :return:
+    """
+    error_labels = [error.get("label") for error in errors]
+    if len(set(error_labels)) == len(error_labels):
+        # all labels are already unique, which is by far the most common case.
+        return
+
+    label_counts = {}
+    for error_label in error_labels:
+        label_counts[error_label] = label_counts.get(error_label, 0) + 1
+
+    observed_error_labels = {}
+    for error in errors:
+        error_label = error.get("label")
+        if label_counts[error_label] > 1:
+            observed_error_labels[error_label] = observed_error_labels.get(error_label, 0) + 1
+            error["label"] = u"{0}_{1}".format(error_label, observed_error_labels[error_label])
+
+
+def merge_qualifier_columns(qualifiers):
+    """
+    Merges neighbouring qualifier values of the same type and value
+    into a single cell spanning several columns.
+    :param qualifiers: dictionary of qualifier name to list of values
+    :return: a new dictionary with the merged values. The input is left untouched.
+    """
+    merged_qualifiers = {}
+    for qualifier in qualifiers:
+        merged_values = []
+        for value in qualifiers[qualifier]:
+            last_value = merged_values[-1] if merged_values else None
+            if last_value and last_value["type"] == value["type"] and last_value["value"] == value["value"]:
+                last_value["colspan"] += value["colspan"]
+            else:
+                merged_values.append(dict(value))
+
+        merged_qualifiers[qualifier] = merged_values
+
+    return merged_qualifiers
+
+
+def merge_header_columns(headers):
+    """
+    Merges neighbouring headers with the same name into a single
+    header spanning several columns.
+    :param headers: list of headers
+    :return: a new list with the merged headers. The input is left untouched.
+    """
+    merged_headers = []
+    for header in headers:
+        last_header = merged_headers[-1] if merged_headers else None
+        if last_header and last_header["name"] == header["name"]:
+            last_header["colspan"] += header["colspan"]
+        else:
+            merged_headers.append(dict(header))
+
+    return merged_headers
+
+
 def process_independent_variables(table_contents, x_axes,
                                   independent_variable_headers):
     if len(table_contents["independent_variables"]) == 0 and table_contents["dependent_variables"]:
         pad_independent_variables(table_contents)
 
     if table_contents["independent_variables"]:
+        special_values = get_special_values()
         count = 0
         for x_axis in table_contents["independent_variables"]:
             units = x_axis['header']['units'] if 'units' in x_axis[
@@ -75,16 +154,11 @@ def process_independent_variables(table_contents, x_axes,
                 # We must account for this.
                 x_header += '__{0}'.format(count)
 
-            x_axes[x_header] = []
-
             independent_variable_headers.append(
                 {"name": x_header, "colspan": 1})
 
-            if x_axis["values"]:
-                # if x_header not in x_headers:
-
-                for value in x_axis["values"]:
-                    x_axes[x_header].append(fix_nan_inf(value))
+            x_axes[x_header] = [fix_nan_inf(value, special_values)
+                                for value in x_axis["values"] or []]
 
             count += 1
 
@@ -92,6 +166,20 @@ def process_independent_variables(table_contents, x_axes,
 def process_dependent_variables(group_count, record, table_contents,
                                 tmp_values, independent_variables,
                                 dependent_variable_headers):
+    """
+    Adds the dependent variables to the table, one column at a time.
+    :param group_count: group number of the first dependent variable
+    :param record: table structure, to which the qualifiers are added
+    :param table_contents: the loaded YAML data file
+    :param tmp_values: list of rows, each with its "x" and "y" values, which gets
+           extended with a row for every value of the longest dependent variable
+    :param independent_variables: dictionary of x header to list of x values
+    :param dependent_variable_headers: list the dependent variable headers are added to
+    :return:
+    """
+    special_values = get_special_values()
+    x_columns = list(independent_variables.values())
+
     for y_axis in table_contents["dependent_variables"]:
 
         qualifiers = {}
@@ -107,7 +195,7 @@ def process_dependent_variables(group_count, record, table_contents,
                     count = qualifiers[qualifier_name]
                     qualifier_name = "{0}-{1}".format(qualifier_name, count)
 
-                if qualifier_name not in record["qualifiers"].keys():
+                if qualifier_name not in record["qualifiers"]:
                     record["qualifier_order"].append(qualifier_name)
                     record["qualifiers"][qualifier_name] = []
 
@@ -117,26 +205,6 @@ def process_dependent_variables(group_count, record, table_contents,
                          ' ' + qualifier['units'] if 'units' in qualifier else ''),
                      "colspan": 1, "group": group_count})
 
-            # attempt column merge
-            for qualifier in record["qualifiers"]:
-                values = record["qualifiers"][qualifier]
-                merged_values = []
-                last_value = None
-                for counter, value in enumerate(values):
-                    if not last_value:
-                        last_value = value
-                    else:
-                        if last_value["type"] == value["type"] and last_value["value"] == value["value"]:
-                            last_value["colspan"] += 1
-                        else:
-                            merged_values.append(last_value)
-                            last_value = value
-
-                    if counter == len(values) - 1:
-                        merged_values.append(last_value)
-
-                record["qualifiers"][qualifier] = merged_values
-
         units = y_axis['header']['units'] if 'units' in y_axis[
             'header'] else ''
         y_header = y_axis['header']['name']
@@ -144,18 +212,12 @@ def process_dependent_variables(group_count, record, table_contents,
             y_header += ' [' + units + ']'
         dependent_variable_headers.append({"name": y_header, "colspan": 1})
 
-        count = 0
-        for value in y_axis["values"]:
-
-            if count not in tmp_values.keys():
-                x = []
-                for x_header in independent_variables:
-                    x.append(independent_variables[x_header][count])
-                tmp_values[count] = {"x": x, "y": []}
+        for count, y_record in enumerate(y_axis["values"]):
 
-            y_record = value
+            if count == len(tmp_values):
+                tmp_values.append({"x": [x_column[count] for x_column in x_columns], "y": []})
 
-            fix_nan_inf(y_record)
+            fix_nan_inf(y_record, special_values)
 
             y_record["group"] = group_count
 
@@ -163,28 +225,9 @@ def process_dependent_variables(group_count, record, table_contents,
                 y_record["errors"] = [{"symerror": 0, "hide": True}]
             else:
                 # process the labels to ensure uniqueness
-                observed_error_labels = {}
-                for error in y_record["errors"]:
-                    error_label = error.get("label")
-
-                    if error_label not in observed_error_labels:
-                        observed_error_labels[error_label] = 0
-                    observed_error_labels[error_label] += 1
-
-                    if observed_error_labels[error_label] > 1:
-                        error["label"] = error_label + "_" + str(
-                            observed_error_labels[error_label])
-
-                    # append "_1" to first error label that has a duplicate
-                    if observed_error_labels[error_label] == 2:
-                        for error1 in y_record["errors"]:
-                            error1_label = error1.get("label")
-                            if error1_label == error_label:
-                                error1["label"] = error1_label + "_1"
-                                break
+                relabel_duplicate_errors(y_record["errors"])
 
             tmp_values[count]["y"].append(y_record)
-            count += 1
 
         group_count += 1
 
@@ -197,23 +240,50 @@ def generate_table_structure(table_contents):
     """
 
     record = {"name": table_contents["name"], "doi": table_contents["doi"],
-              "description": table_contents["title"], "qualifiers": {},
-              "qualifier_order": [], "headers": [],
+              "description": table_contents["title"],
               "review": table_contents["review"],
               "associated_files": table_contents["associated_files"],
-              "keywords": {},
-              "values": []}
+              "keywords": process_keywords(table_contents["keywords"])}
+
+    record.update(select_table_data(generate_table_data(table_contents)))
+
+    return record
 
-    # add in keywords
-    if table_contents['keywords'] is not None:
-        for keyword in table_contents['keywords']:
-            if keyword.name not in record['keywords']:
-                record['keywords'][keyword.name] = []
 
-            if keyword.value not in record['keywords'][keyword.name]:
-                record['keywords'][keyword.name].append(keyword.value)
+def process_keywords(keywords):
+    """
+    Groups the keyword values of a table by keyword name.
+    :param keywords: list of Keyword objects, or None
+    :return: a dictionary mapping keyword names to their values
+    """
+    processed_keywords = {}
+    if keywords is not None:
+        for keyword in keywords:
+            if keyword.name not in processed_keywords:
+                processed_keywords[keyword.name] = []
+
+            if keyword.value not in processed_keywords[keyword.name]:
+                processed_keywords[keyword.name].append(keyword.value)
+
+    return processed_keywords
+
+
+def generate_table_data(table_contents):
+    """
+    Creates the part of the renderable structure which only depends on the
+    contents of the data file, i.e. the qualifiers, headers and values.
+    This is what gets cached for each table, since the rest of the structure
+    (review status, DOI, associated files) can change without the file changing.
+    Qualifiers and dependent variable headers are kept as one entry per
+    dependent variable, so they can be projected before
+    select_table_data merges them into columns.
+    :param table_contents: the loaded YAML data file
+    :return: a dictionary encompassing the qualifiers, headers and values
+    """
+
+    record = {"qualifiers": {}, "qualifier_order": [], "headers": [],
+              "values": []}
 
-    tmp_values = {}
     x_axes = OrderedDict()
     x_headers = []
     process_independent_variables(table_contents, x_axes, x_headers)
@@ -224,26 +294,52 @@ def generate_table_structure(table_contents):
     yheaders = []
 
     process_dependent_variables(group_count, record, table_contents,
-                                tmp_values, x_axes, yheaders)
+                                record["values"], x_axes, yheaders)
+    record["headers"] += yheaders
 
-    # attempt column merge
-    last_yheader = None
-    for counter, yheader in enumerate(yheaders):
-        if not last_yheader:
-            last_yheader = yheader
-        else:
-            if last_yheader["name"] == yheader["name"]:
-                last_yheader["colspan"] += 1
-            else:
-                record["headers"].append(last_yheader)
-                last_yheader = yheader
-        if counter == len(yheaders) - 1:
-            record["headers"].append(last_yheader)
+    return record
 
-    for tmp_value in tmp_values:
-        record["values"].append(tmp_values[tmp_value])
 
-    return record
+def select_table_data(table_data, offset=0, limit=None, columns=None):
+    """
+    Selects a window of rows and a subset of the dependent variables
+    from the output of generate_table_data, and merges the qualifiers
+    and headers into columns.
+    :param table_data: dictionary returned by generate_table_data, left untouched
+    :param offset: index of the first row to return
+    :param limit: maximum number of rows to return, or None for all of them
+    :param columns: indices of the dependent variables to return, or None for all of them
+    :return: a dictionary encompassing the qualifiers, headers and values,
+             plus the total number of rows in the table
+    """
+    x_count = table_data["x_count"]
+    y_headers = table_data["headers"][x_count:]
+
+    end = None if limit is None else offset + limit
+    values = table_data["values"][offset:end]
+    qualifiers = table_data["qualifiers"]
+
+    if columns is not None:
+        columns = set(columns)
+        y_headers = [header for index, header in enumerate(y_headers) if index in columns]
+
+        values = [{"x": value["x"], "y": [y for y in value["y"] if y["group"] in columns]}
+                  for value in values]
+
+        qualifiers = {}
+        for qualifier in table_data["qualifiers"]:
+            qualifier_values = [qualifier_value for qualifier_value in table_data["qualifiers"][qualifier]
+                                if qualifier_value["group"] in columns]
+            if qualifier_values:
+                qualifiers[qualifier] = qualifier_values
+
+    return {"x_count": x_count,
+            "headers": table_data["headers"][:x_count] + merge_header_columns(y_headers),
+            "qualifiers": merge_qualifier_columns(qualifiers),
+            "qualifier_order": [qualifier for qualifier in table_data["qualifier_order"]
+                                if qualifier in qualifiers],
+            "values": values,
+            "row_count": len(table_data["values"])}
 
 
 def str_presenter(dumper, data):
@@ -252,7 +348,7 @@ def str_presenter(dumper, data):
     return dumper.represent_scalar('tag:yaml.org,2002:str', data)
 
 
-def process_ctx(ctx, light_mode=False):
+def process_ctx(ctx, light_mode=False, table_query=None):
     for key_to_remove in ['show_review_widget', 'show_upload_area', 'show_upload_widget',
                           'coordinators', 'is_submission_coordinator_or_admin']:
         ctx.pop(key_to_remove, None)
@@ -261,13 +357,15 @@ def process_ctx(ctx, light_mode=False):
         ctx.pop('data_tables', None)
     else:
         site_url = current_app.config['SITE_URL']
+        # row windows and projections requested for the record apply to each of its tables.
+        table_query_string = '?' + url_encode(table_query) if table_query else ''
         for data_table in ctx['data_tables']:
             for key_to_remove in ['review_status', 'review_flag']:
                 data_table.pop(key_to_remove, None)
 
                 data_table['data'] = {
-                    'json': '{0}/record/data/{1}/{2}/{3}'.format(
-                        site_url, ctx['recid'], data_table['id'], ctx['version']),
+                    'json': '{0}/record/data/{1}/{2}/{3}{4}'.format(
+                        site_url, ctx['recid'], data_table['id'], ctx['version'], table_query_string),
                     'root': '{0}/download/table/ins{1}/{2}/root'.format(
                         site_url, ctx['record']['inspire_id'], data_table['name']),
                     'csv': '{0}/download/table/ins{1}/{2}/csv'.format(
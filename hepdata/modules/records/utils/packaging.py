@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Packaging of submission directories into zip archives."""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_directory_files(directory):
+    """
+    Lists the files of a directory along with the names they are given in
+    an archive, which are relative to the directory so that no change of
+    working directory is needed.
+    :param directory: path of the directory
+    :return: sorted list of (archive name, path) tuples
+    """
+    files = []
+    for root, dirs, file_names in os.walk(directory):
+        for file_name in file_names:
+            file_location = os.path.join(root, file_name)
+            arcname = os.path.relpath(file_location, directory).replace(os.sep, '/')
+            files.append((arcname, file_location))
+    return sorted(files)
+
+
+def get_file_crc(file_location):
+    """
+    Computes the CRC-32 of a file as stored in zip archives,
+    reading it in chunks.
+    :param file_location: path of the file
+    :return: unsigned CRC-32
+    """
+    crc = 0
+    with open(file_location, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc & 0xffffffff
+
+
+def archive_matches_directory(archive_location, directory):
+    """
+    Checks whether a zip archive holds exactly the files of a directory,
+    with the same names, sizes and checksums.
+    :param archive_location: path of the zip archive
+    :param directory: path of the directory
+    :return: bool
+    """
+    if not os.path.exists(archive_location) or not zipfile.is_zipfile(archive_location):
+        return False
+
+    try:
+        with zipfile.ZipFile(archive_location) as archive:
+            members = dict((info.filename, info) for info in archive.infolist()
+                           if not info.filename.endswith('/'))
+    except zipfile.BadZipfile:
+        return False
+
+    files = get_directory_files(directory)
+    if sorted(members.keys()) != [arcname for arcname, _ in files]:
+        return False
+
+    # sizes are compared first, as they are free to check.
+    for arcname, file_location in files:
+        if members[arcname].file_size != os.path.getsize(file_location):
+            return False
+
+    for arcname, file_location in files:
+        if members[arcname].CRC != get_file_crc(file_location):
+            return False
+
+    return True
+
+
+def write_zip(directory, archive_location):
+    """
+    Zips up the contents of a directory. Files are streamed into the archive
+    in chunks by ZipFile.write, under names relative to the directory.
+    The archive is written under a temporary name and renamed into place,
+    so a partially written archive is never served.
+    :param directory: path of the directory to package
+    :param archive_location: path of the zip archive to create
+    """
+    file_descriptor, tmp_location = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(archive_location)), suffix='.tmp')
+    os.close(file_descriptor)
+
+    try:
+        with zipfile.ZipFile(tmp_location, 'w', allowZip64=True) as zipf:
+            for arcname, file_location in get_directory_files(directory):
+                zipf.write(file_location, arcname)
+        os.rename(tmp_location, archive_location)
+    except Exception:
+        os.remove(tmp_location)
+        raise
+
+
+def package_directory(directory, archive_location, original_archive=None):
+    """
+    Creates the zip archive of a submission directory. When the directory
+    was extracted from a zip archive whose contents are unchanged, that
+    archive is copied rather than compressed again.
+    :param directory: path of the directory to package
+    :param archive_location: path of the zip archive to create
+    :param original_archive: path of the uploaded archive, if any
+    :return: True if the original archive was reused
+    """
+    if original_archive and archive_matches_directory(original_archive, directory):
+        file_descriptor, tmp_location = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(archive_location)), suffix='.tmp')
+        os.close(file_descriptor)
+        shutil.copyfile(original_archive, tmp_location)
+        os.rename(tmp_location, archive_location)
+        log.debug('Reused {0} for {1}'.format(original_archive, archive_location))
+        return True
+
+    write_zip(directory, archive_location)
+    return False
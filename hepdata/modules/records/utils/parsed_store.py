@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Store of parsed data files, so each YAML file is only parsed once."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import logging
+import os
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import yaml
+from flask import current_app
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+def get_file_signature(file_location):
+    """
+    Returns a cheap signature of a file which changes whenever
+    the file is replaced or rewritten.
+    :param file_location: path of the file
+    :return: tuple of (modification time, size)
+    """
+    file_stat = os.stat(file_location)
+    return file_stat.st_mtime, file_stat.st_size
+
+
+def get_parsed_data_dir():
+    """
+    Parsed files are kept out of the submission directories, which are
+    zipped for download and sent to the converter as they are.
+    :return: directory of the parsed files
+    """
+    return current_app.config.get(
+        'CFG_PARSED_DATA_DIR', os.path.join(current_app.config['CFG_DATADIR'], 'parsed'))
+
+
+def get_parsed_location(file_location, parsed_dir=None):
+    """
+    :param file_location: path of the YAML file
+    :param parsed_dir: directory of the parsed files, by default get_parsed_data_dir()
+    :return: path of its parsed version
+    """
+    parsed_dir = parsed_dir or get_parsed_data_dir()
+    file_key = hashlib.sha1(os.path.abspath(file_location).encode('utf-8')).hexdigest()
+    return os.path.join(parsed_dir, file_key[:2], file_key + '.pickle')
+
+
+def parse_yaml_file(file_location):
+    """
+    Parses a single document YAML file.
+    :param file_location: path of the YAML file
+    :return: the parsed document
+    """
+    with open(file_location, 'r') as yaml_file:
+        try:
+            return yaml.load(yaml_file, Loader=yaml.CSafeLoader)
+        except AttributeError:
+            # LibYAML is not available.
+            return yaml.safe_load(yaml_file)
+
+
+def write_parsed_file(file_location, contents, parsed_dir=None):
+    """
+    Stores the parsed contents of a YAML file along with its signature.
+    The file is written under a temporary name and renamed into place,
+    so readers never see a partial file.
+    :param file_location: path of the YAML file
+    :param contents: the parsed document
+    :param parsed_dir: directory of the parsed files, by default get_parsed_data_dir()
+    """
+    parsed_location = get_parsed_location(file_location, parsed_dir)
+    parsed_location_dir = os.path.dirname(parsed_location)
+    if not os.path.exists(parsed_location_dir):
+        try:
+            os.makedirs(parsed_location_dir)
+        except OSError:
+            # created by another process in the meantime.
+            pass
+
+    file_descriptor, tmp_location = tempfile.mkstemp(dir=parsed_location_dir, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'wb') as parsed_file:
+        pickle.dump((get_file_signature(file_location), contents), parsed_file,
+                    pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_location, parsed_location)
+
+
+def remove_parsed_files(file_locations, parsed_dir=None):
+    """
+    Removes the stored parsed versions of files which are no longer used.
+    :param file_locations: paths of the YAML files
+    :param parsed_dir: directory of the parsed files, by default get_parsed_data_dir()
+    """
+    for file_location in file_locations:
+        parsed_location = get_parsed_location(file_location, parsed_dir)
+        try:
+            os.remove(parsed_location)
+        except OSError:
+            # never parsed, or removed already.
+            pass
+
+
+def read_parsed_file(file_location, parsed_dir=None):
+    """
+    :param file_location: path of the YAML file
+    :param parsed_dir: directory of the parsed files, by default get_parsed_data_dir()
+    :return: the stored parsed contents, or None if they are
+             missing or were parsed from a different version of the file
+    """
+    parsed_location = get_parsed_location(file_location, parsed_dir)
+    if not os.path.exists(parsed_location):
+        return None
+
+    try:
+        with open(parsed_location, 'rb') as parsed_file:
+            signature, contents = pickle.load(parsed_file)
+    except Exception as e:
+        log.error('Unable to read the parsed version of {0}: {1}'.format(file_location, e))
+        return None
+
+    if signature != get_file_signature(file_location):
+        return None
+    return contents
+
+
+def load_yaml_file(file_location, parsed_dir=None):
+    """
+    Returns the parsed contents of a YAML file from the store,
+    parsing and storing them first if needed.
+    :param file_location: path of the YAML file
+    :param parsed_dir: directory of the parsed files, by default get_parsed_data_dir()
+    :return: the parsed document
+    """
+    contents = read_parsed_file(file_location, parsed_dir)
+    if contents is None:
+        contents = parse_yaml_file(file_location)
+        try:
+            write_parsed_file(file_location, contents, parsed_dir)
+        except (IOError, OSError) as e:
+            log.error('Unable to store the parsed version of {0}: {1}'.format(file_location, e))
+    return contents
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cache of the record pages rendered for anonymous users."""
+
+from __future__ import absolute_import, print_function
+
+from flask import current_app, session
+from flask.ext.login import current_user
+
+from hepdata.utils.cache import SharedCache
+
+# rendered in place of the access count, which changes on every view.
+ACCESS_COUNT_PLACEHOLDER = '__hepdata_access_count__'
+
+_record_cache = None
+
+
+def get_record_cache():
+    """
+    Returns the cache of rendered records, creating it on first use.
+    :return: SharedCache instance
+    """
+    global _record_cache
+    if _record_cache is None:
+        _record_cache = SharedCache('records',
+                                    redis_url=current_app.config.get('CACHE_REDIS_URL'),
+                                    timeout=current_app.config.get('RECORD_CACHE_TIMEOUT', 600))
+    return _record_cache
+
+
+def invalidate_record_cache():
+    """ Drops all the rendered records, e.g. when a new version is finalised. """
+    get_record_cache().invalidate()
+
+
+def is_record_render_cacheable(hepsubmission):
+    """
+    A render only depends on the version of the record when the version is
+    finished and the user is anonymous, so it sees no review or upload widgets.
+    :param hepsubmission: the HEPSubmission being rendered
+    :return: bool
+    """
+    return hepsubmission.overall_status == 'finished' \
+        and not current_user.is_authenticated \
+        and not session.get('_flashes')
+
+
+def fill_access_count(rendered, access_count, output_format):
+    """
+    Replaces the placeholder of a cached render by the access count.
+    :param rendered: the cached HTML or JSON
+    :param access_count: the number of accesses to show
+    :param output_format: html or json
+    :return: the completed render
+    """
+    if output_format == 'json':
+        # the placeholder is a JSON string, whereas the count is a number.
+        return rendered.replace('"{0}"'.format(ACCESS_COUNT_PLACEHOLDER), str(access_count))
+    return rendered.replace(ACCESS_COUNT_PLACEHOLDER, str(access_count))
@@ -23,42 +23,53 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 from __future__ import absolute_import, print_function
 
+import hashlib
 import json
 import logging
+import multiprocessing
+import threading
 import uuid
-import zipfile
+from multiprocessing import Pool
 from datetime import datetime
 from dateutil.parser import parse
 
-from elasticsearch import NotFoundError
 from flask import current_app
 from flask.ext.celeryext import create_celery_app
 from flask.ext.login import current_user
-from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
+from hepdata.config import CFG_DATA_TYPE
 from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
 from hepdata.ext.elasticsearch.api import get_records_matching_field, \
-    delete_item_from_index, index_record_ids, push_data_keywords
+    delete_item_from_index, delete_records_from_index, index_record_ids, push_data_keywords
+from hepdata.modules.converter.cache import get_content_hash
 from hepdata.modules.converter.tasks import convert_and_store
 from hepdata.modules.email.api import send_finalised_email
 from hepdata.modules.permissions.models import SubmissionParticipant
 from hepdata.modules.records.utils.workflow import create_record
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.submission.models import DataSubmission, DataReview, \
-    DataResource, License, Keyword, HEPSubmission, RecordVersionCommitMessage
+    DataResource, License, Keyword, HEPSubmission, RecordVersionCommitMessage, Message, \
+    datafile_identifier, datareview_messages, data_reference_link, keyword_identifier, submission_participant_link
 from hepdata.modules.records.utils.common import \
-    get_prefilled_dictionary, infer_file_type, encode_string, zipdir, get_record_by_id, contains_accepted_url
+    get_prefilled_dictionary, infer_file_type, encode_string, get_record_by_id, get_records_by_ids, \
+    contains_accepted_url
 from hepdata.modules.records.utils.common import get_or_create
 from hepdata.modules.records.utils.doi_minter import reserve_dois_for_data_submissions, reserve_doi_for_hepsubmission, \
     generate_doi_for_data_submission, generate_doi_for_submission
+from hepdata.modules.records.utils.packaging import package_directory
+from hepdata.modules.records.utils.record_cache import invalidate_record_cache
 from hepdata.modules.records.utils.resources import download_resource_file
+from hepdata.modules.records.utils.parsed_store import get_parsed_data_dir, \
+    parse_yaml_file, write_parsed_file, remove_parsed_files
+from hepdata.modules.records.utils.table_cache import invalidate_table_data
 from hepdata.utils.twitter import tweet
+from hepdata_validator import ValidationMessage
 from hepdata_validator.data_file_validator import DataFileValidator
 from hepdata_validator.submission_file_validator import SubmissionFileValidator
 from invenio_db import db
-from invenio_pidstore.errors import PIDDoesNotExistError
 from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_records import Record
 import os
+from sqlalchemy import inspect
 from sqlalchemy.orm.exc import NoResultFound
 import yaml
 from urllib2 import URLError
@@ -66,6 +77,9 @@ from urllib2 import URLError
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+# pool of validation processes, and the process it belongs to.
+_validation_pool = None
+
 
 def assign_record_id(record_information, id=None):
     """
@@ -91,75 +105,123 @@ def remove_submission(record_id):
     :param record_id:
     :return: True if Successful, False if the record does not exist.
     """
+    return remove_submissions([record_id])
 
-    hepdata_submissions = HEPSubmission.query.filter_by(
-        publication_recid=record_id).all()
-
-    try:
-        try:
-            for hepdata_submission in hepdata_submissions:
-                db.session.delete(hepdata_submission)
-        except NoResultFound as nrf:
-            print(nrf.args)
-
-        admin_idx = AdminIndexer()
-        admin_idx.find_and_delete(term=record_id, fields=['recid'])
-
-        submissions = DataSubmission.query.filter_by(
-            publication_recid=record_id).all()
-
-        reviews = DataReview.query.filter_by(
-            publication_recid=record_id).all()
-
-        for review in reviews:
-            db.session.delete(review)
-
-        for submission in submissions:
-
-            resource = DataResource.query.filter_by(
-                id=submission.data_file).first()
-
-            db.session.delete(submission)
-
-            if resource:
-                db.session.delete(resource)
 
-        try:
-            SubmissionParticipant.query.filter_by(
-                publication_recid=record_id).delete()
-        except Exception:
-            print("Unable to find a submission participant for {0}".format(record_id))
+def remove_submissions(record_ids):
+    """
+    Removes the database entries related to several records with one
+    DELETE statement per table, in a single transaction. The rows to
+    delete are found with a few queries on the whole set of records
+    rather than loaded one object at a time.
+    :param record_ids: publication recids
+    :return: True if Successful.
+    """
+    record_ids = [int(record_id) for record_id in record_ids]
+    if not record_ids:
+        return True
 
-        try:
-            record = get_record_by_id(record_id)
-            data_records = get_records_matching_field(
-                'related_publication', record_id, doc_type=CFG_DATA_TYPE)
+    def select_ids(column, where):
+        return [row[0] for row in db.session.query(column).filter(where).all()]
 
-            if 'hits' in data_records:
-                for data_record in data_records['hits']['hits']:
-                    data_record_obj = get_record_by_id(data_record['_source']['recid'])
-                    if data_record_obj:
-                        data_record_obj.delete()
-            if record:
-                record.delete()
+    def delete_rows(model, ids):
+        # loaded objects are detached first, as they would be by session.delete.
+        ids = set(ids)
+        for obj in list(db.session.identity_map.values()):
+            identity = inspect(obj).identity
+            if isinstance(obj, model) and identity and identity[0] in ids:
+                db.session.expunge(obj)
+        model.query.filter(model.id.in_(list(ids))).delete(synchronize_session=False)
 
-        except PIDDoesNotExistError as e:
-            print('No record entry exists for {0}. Proceeding to delete other files.'.format(record_id))
+    try:
+        hepsubmission_ids = select_ids(HEPSubmission.id, HEPSubmission.publication_recid.in_(record_ids))
+        data_submissions = db.session.query(
+            DataSubmission.id, DataSubmission.data_file, DataSubmission.associated_recid).filter(
+            DataSubmission.publication_recid.in_(record_ids)).all()
+        data_submission_ids = [data_submission.id for data_submission in data_submissions]
+        review_ids = select_ids(DataReview.id, DataReview.publication_recid.in_(record_ids))
+
+        message_ids = []
+        if review_ids:
+            message_ids = select_ids(datareview_messages.c.message_id,
+                                     datareview_messages.c.datareview_id.in_(review_ids))
+
+        keyword_ids = []
+        resource_ids = set(data_submission.data_file for data_submission in data_submissions
+                           if data_submission.data_file is not None)
+        if data_submission_ids:
+            keyword_ids = select_ids(keyword_identifier.c.keyword_id,
+                                     keyword_identifier.c.submission_id.in_(data_submission_ids))
+            resource_ids.update(select_ids(datafile_identifier.c.dataresource_id,
+                                           datafile_identifier.c.submission_id.in_(data_submission_ids)))
+
+        participant_ids = set(select_ids(SubmissionParticipant.id,
+                                         SubmissionParticipant.publication_recid.in_(record_ids)))
+        if hepsubmission_ids:
+            resource_ids.update(select_ids(data_reference_link.c.dataresource_id,
+                                           data_reference_link.c.submission_id.in_(hepsubmission_ids)))
+            participant_ids.update(select_ids(submission_participant_link.c.participant_id,
+                                              submission_participant_link.c.rec_id.in_(hepsubmission_ids)))
+
+        data_file_locations = []
+        if resource_ids:
+            data_file_locations = select_ids(DataResource.file_location, DataResource.id.in_(list(resource_ids)))
+
+        # association tables first, then the rows they refer to.
+        if review_ids:
+            db.session.execute(datareview_messages.delete().where(
+                datareview_messages.c.datareview_id.in_(review_ids)))
+            delete_rows(DataReview, review_ids)
+        if message_ids:
+            delete_rows(Message, message_ids)
+
+        if data_submission_ids:
+            db.session.execute(keyword_identifier.delete().where(
+                keyword_identifier.c.submission_id.in_(data_submission_ids)))
+            db.session.execute(datafile_identifier.delete().where(
+                datafile_identifier.c.submission_id.in_(data_submission_ids)))
+            delete_rows(DataSubmission, data_submission_ids)
+        if keyword_ids:
+            delete_rows(Keyword, keyword_ids)
+
+        if hepsubmission_ids:
+            db.session.execute(data_reference_link.delete().where(
+                data_reference_link.c.submission_id.in_(hepsubmission_ids)))
+            db.session.execute(submission_participant_link.delete().where(
+                submission_participant_link.c.rec_id.in_(hepsubmission_ids)))
+            delete_rows(HEPSubmission, hepsubmission_ids)
+        if resource_ids:
+            delete_rows(DataResource, resource_ids)
+
+        if participant_ids:
+            delete_rows(SubmissionParticipant, participant_ids)
+
+        # the records of the data tables of every version, and of the publications.
+        data_recids = [data_submission.associated_recid for data_submission in data_submissions
+                       if data_submission.associated_recid is not None]
+        for record in get_records_by_ids(data_recids + record_ids):
+            record.delete()
 
         db.session.commit()
-        db.session.flush()
-        return True
-
     except Exception as e:
         db.session.rollback()
         raise e
 
+    remove_parsed_files(data_file_locations)
+
+    admin_idx = AdminIndexer()
+    admin_idx.delete_submissions(record_ids)
+
+    invalidate_record_cache()
+    return True
+
 
 def cleanup_submission(recid, version, to_keep):
     """
     Removes old, unreferenced files from the submission.
     This ensures that when users replace a submission,
     old files are not left behind.
+    The deletions are committed with the rest of the submission.
     :param recid: publication recid of parent
     :param to_keep: an array of names to keep in the submission
     :return:
@@ -167,22 +229,25 @@ def cleanup_submission(recid, version, to_keep):
     data_submissions = DataSubmission.query.filter_by(
         publication_recid=recid, version=version).all()
 
-    try:
-        for data_submission in data_submissions:
+    to_remove = [data_submission for data_submission in data_submissions
+                 if data_submission.name not in to_keep]
 
-            if not (data_submission.name in to_keep):
-                data_reviews = DataReview.query.filter_by(
-                    data_recid=data_submission.id).all()
+    if to_remove:
+        # deleted one by one, so their review messages are deleted too.
+        data_reviews = DataReview.query.filter(
+            DataReview.data_recid.in_([data_submission.id for data_submission in to_remove])).all()
 
-                for review in data_reviews:
-                    db.session.delete(review)
+        for review in data_reviews:
+            db.session.delete(review)
 
-                db.session.delete(data_submission)
+        data_file_ids = [data_submission.data_file for data_submission in to_remove
+                         if data_submission.data_file is not None]
+        if data_file_ids:
+            remove_parsed_files([resource.file_location for resource in DataResource.query.filter(
+                DataResource.id.in_(data_file_ids))])
 
-        db.session.commit()
-    except Exception as e:
-        logging.error(e)
-        db.session.rollback()
+        for data_submission in to_remove:
+            db.session.delete(data_submission)
 
 
 def cleanup_data_resources(data_submission):
@@ -190,42 +255,68 @@ def cleanup_data_resources(data_submission):
     Removes additional resources from the submission to avoid duplications.
     This ensures that when users replace a submission,
     old files are not left behind.
+    The deletions are committed with the rest of the submission.
     :param data_submission: DataSubmission object to be cleaned
     :return:
     """
     for additional_file in data_submission.resources:
         db.session.delete(additional_file)
-    db.session.commit()
 
 
-def process_data_file(recid, version, basepath, data_obj, datasubmission, main_file_path):
+def get_license(license_data, license_cache=None):
+    """
+    Finds or creates the License described by a license section of a submission.
+    :param license_data: dict with the name, url and description of the license
+    :param license_cache: dict of the licenses already looked up for this submission
+    :return: License object, with its id set
+    """
+    license_fields = get_prefilled_dictionary(
+        ["name", "url", "description"], license_data)
+    key = (license_fields['name'], license_fields['url'], license_fields['description'])
+
+    if license_cache is not None and key in license_cache:
+        return license_cache[key]
+
+    license = License.query.filter_by(**license_fields).first()
+    if license is None:
+        license = License(**license_fields)
+        db.session.add(license)
+        # the id is needed to reference the license.
+        db.session.flush()
+
+    if license_cache is not None:
+        license_cache[key] = license
+    return license
+
+
+def process_data_file(recid, version, basepath, data_obj, datasubmission, main_file_path,
+                      license_cache=None):
     """
     Takes a data file and any supplementary files and persists their
     metadata to the database whilst recording their upload path.
+    Nothing is committed, the caller commits the whole submission at once.
     :param recid: the record id
     :param version: version of the resource to be stored
     :param basepath: the path the submission has been loaded to
     :param data_obj: Object representation of loaded YAML file
     :param datasubmission: the DataSubmission object representing this file in the DB
     :param main_file_path: the data file path
+    :param license_cache: dict of the licenses already looked up for this submission
     :return:
     """
     main_data_file = DataResource(
         file_location=main_file_path, file_type="data")
 
     if "data_license" in data_obj:
-        dict = get_prefilled_dictionary(
-            ["name", "url", "description"], data_obj["data_license"])
-
-        license = get_or_create(
-            db.session, License, name=dict['name'],
-            url=dict['url'], description=dict['description'])
-
-        main_data_file.file_license = license.id
+        main_data_file.file_license = get_license(data_obj["data_license"], license_cache).id
 
     db.session.add(main_data_file)
-    # I have to do the commit here, otherwise I have no ID to reference in the data submission table.
-    db.session.commit()
+    # flush, so the data file has an ID to reference in the data submission table.
+    db.session.flush()
+
+    if datasubmission.id is not None:
+        # the data file is being replaced, so any compiled version of the old one is useless.
+        invalidate_table_data(datasubmission.id)
 
     datasubmission.data_file = main_data_file.id
 
@@ -233,30 +324,27 @@ def process_data_file(recid, version, basepath, data_obj, datasubmission, main_f
         datasubmission.location_in_publication = data_obj["location"]
 
     if "keywords" in data_obj:
-        for keyword in data_obj["keywords"]:
-            keyword_name = keyword['name']
-            for value in keyword['values']:
-                keyword = Keyword(name=keyword_name, value=value)
-                datasubmission.keywords.append(keyword)
+        datasubmission.keywords.extend(
+            Keyword(name=keyword['name'], value=value)
+            for keyword in data_obj["keywords"] for value in keyword['values'])
 
     cleanup_data_resources(datasubmission)
 
     if "additional_resources" in data_obj:
-        resources = parse_additional_resources(basepath, recid, version, data_obj)
-        for resource in resources:
-            datasubmission.resources.append(resource)
-
-    db.session.commit()
+        datasubmission.resources.extend(
+            parse_additional_resources(basepath, recid, version, data_obj, license_cache))
 
 
-def process_general_submission_info(basepath, submission_info_document, recid):
+def process_general_submission_info(basepath, submission_info_document, recid, license_cache=None):
     """
     Processes the top level information about a submission,
     extracting the information about the data abstract,
     additional resources for the submission (files, links,
     and html inserts) and historical modification information.
+    Nothing is committed, the caller commits the whole submission at once.
     :param submission_info_document: the data document
     :param recid:
+    :param license_cache: dict of the licenses already looked up for this submission
     :return:
     """
 
@@ -282,21 +370,20 @@ def process_general_submission_info(basepath, submission_info_document, recid):
             for reference in hepsubmission.resources:
                 db.session.delete(reference)
 
-            resources = parse_additional_resources(basepath,
-                                                   recid, hepsubmission.version, submission_info_document)
-            for resource in resources:
-                hepsubmission.resources.append(resource)
+            hepsubmission.resources.extend(
+                parse_additional_resources(basepath, recid, hepsubmission.version,
+                                           submission_info_document, license_cache))
 
         db.session.add(hepsubmission)
-        db.session.commit()
 
 
-def parse_additional_resources(basepath, recid, version, yaml_document):
+def parse_additional_resources(basepath, recid, version, yaml_document, license_cache=None):
     """
     Parses out the additional resource section for a full submission
     :param hepsubmission:
     :param recid:
     :param submission_info_document:
+    :param license_cache: dict of the licenses already looked up for this submission
     :return:
     """
     resources = []
@@ -335,14 +422,7 @@ def parse_additional_resources(basepath, recid, version, yaml_document):
                 file_description=reference['description'])
 
             if "license" in reference:
-                dict = get_prefilled_dictionary(
-                    ["name", "url", "description"],
-                    reference["license"])
-
-                resource_license = get_or_create(
-                    db.session, License, name=dict['name'],
-                    url=dict['url'], description=dict['description'])
-                new_reference.file_license = resource_license.id
+                new_reference.file_license = get_license(reference["license"], license_cache).id
 
             resources.append(new_reference)
 
@@ -371,6 +451,147 @@ def parse_modifications(hepsubmission, recid, submission_info_document):
             db.session.add(participant)
 
 
+def is_submission_info_document(yaml_document):
+    """
+    Comments, record ids and modifications are only present
+    in the general submission information document.
+    :param yaml_document: a document of the submission.yaml file
+    :return: True if it is not the document of a data table
+    """
+    return 'record_ids' in yaml_document or 'comment' in yaml_document or 'modifications' in yaml_document
+
+
+def validate_data_file(args):
+    """
+    Validates a single data file, and stores the parsed version of a
+    valid file so it is never parsed again. A file which cannot be
+    parsed is reported without being validated. This runs in the worker
+    processes of validate_data_files, so must not use the database
+    or the application context.
+    :param args: tuple of the path of the data file and the
+                 directory of the parsed files
+    :return: errors for display, keyed by file name
+    """
+    file_path, parsed_dir = args
+
+    data_file_validator = DataFileValidator()
+    try:
+        contents = parse_yaml_file(file_path)
+    except Exception as e:
+        contents = None
+        data_file_validator.add_validation_message(ValidationMessage(
+            file=file_path, message='There was a problem parsing the file.\n' + str(e)))
+    else:
+        if contents is None:
+            data_file_validator.add_validation_message(ValidationMessage(
+                file=file_path, message='No data found in file.'))
+
+    if contents is not None and data_file_validator.validate(file_path=file_path):
+        write_parsed_file(file_path, contents, parsed_dir)
+        return {}
+
+    return process_validation_errors_for_display(data_file_validator.get_messages())
+
+
+def can_use_validation_pool():
+    """
+    Worker processes are only forked from the main thread of a
+    non-daemonic process: daemonic processes, such as celery prefork
+    workers, cannot have children, and forking from a thread other than
+    the main one can deadlock the child on locks held by other threads.
+    :return: bool
+    """
+    return not multiprocessing.current_process().daemon and \
+        isinstance(threading.current_thread(), threading._MainThread)
+
+
+def get_validation_pool():
+    """
+    Returns the pool of CFG_VALIDATION_PROCESSES validation processes,
+    creating it on first use, so that one pool is reused by every upload
+    handled by this process.
+    :return: multiprocessing.Pool
+    """
+    global _validation_pool
+    if _validation_pool is None or _validation_pool[0] != os.getpid():
+        _validation_pool = (os.getpid(), Pool(current_app.config.get('CFG_VALIDATION_PROCESSES', 4)))
+    return _validation_pool[1]
+
+
+def validate_data_files(file_paths):
+    """
+    Validates data files concurrently in the pool of validation processes,
+    or one after the other when a pool cannot be used, see can_use_validation_pool.
+    :param file_paths: paths of the data files
+    :return: errors for display for all the invalid files, keyed by file name
+    """
+    parsed_dir = get_parsed_data_dir()
+    args = [(file_path, parsed_dir) for file_path in file_paths]
+
+    if len(args) > 1 and current_app.config.get('CFG_VALIDATION_PROCESSES', 4) > 1 \
+            and can_use_validation_pool():
+        results = get_validation_pool().map(validate_data_file, args)
+    else:
+        results = [validate_data_file(file_args) for file_args in args]
+
+    errors = {}
+    for file_errors in results:
+        errors.update(file_errors)
+    return errors
+
+
+def get_data_table_hash(basepath, yaml_document):
+    """
+    Hashes everything a table is made of: its block of submission.yaml,
+    its data file and any additional resource files local to the submission.
+    :param basepath: the path the submission has been loaded to
+    :param yaml_document: the submission.yaml block of the table
+    :return: hexadecimal sha1 digest
+    """
+    file_locations = [os.path.join(basepath, yaml_document["data_file"])]
+    for reference in yaml_document.get("additional_resources", []):
+        # only files local to the submission exist, others are skipped.
+        file_locations.append(os.path.join(basepath, reference["location"]))
+
+    table_hash = hashlib.sha1()
+    table_hash.update(json.dumps(yaml_document, sort_keys=True, default=str).encode('utf-8'))
+    table_hash.update(get_content_hash(*file_locations).encode('utf-8'))
+    return table_hash.hexdigest()
+
+
+def copy_data_submission(data_submission, version):
+    """
+    Carries an unchanged table over to a new version of the submission.
+    The data file is shared, but keywords and resources are copied since
+    they are deleted along with the DataSubmission they belong to.
+    The DOI is left out, as each version has its own.
+    :param data_submission: the DataSubmission of the previous version
+    :param version: the new version
+    :return: the new DataSubmission, not yet added to the session
+    """
+    new_data_submission = DataSubmission(
+        publication_recid=data_submission.publication_recid,
+        name=data_submission.name,
+        description=data_submission.description,
+        location_in_publication=data_submission.location_in_publication,
+        data_file=data_submission.data_file,
+        content_hash=data_submission.content_hash,
+        version=version)
+
+    new_data_submission.keywords.extend(
+        Keyword(name=keyword.name, value=keyword.value)
+        for keyword in data_submission.keywords)
+
+    new_data_submission.resources.extend(
+        DataResource(file_location=resource.file_location,
+                     file_type=resource.file_type,
+                     file_description=resource.file_description,
+                     file_license=resource.file_license)
+        for resource in data_submission.resources)
+
+    return new_data_submission
+
+
 def process_submission_directory(basepath, submission_file_path, recid, update=False, *args, **kwargs):
     """
     Goes through an entire submission directory and processes the
@@ -385,23 +606,54 @@ def process_submission_directory(basepath, submission_file_path, recid, update=F
     errors = {}
 
     if submission_file_path is not None:
-        submission_file = open(submission_file_path, 'r')
-
         submission_file_validator = SubmissionFileValidator()
         is_valid_submission_file = submission_file_validator.validate(
             file_path=submission_file_path)
 
-        data_file_validator = DataFileValidator()
-
         if is_valid_submission_file:
-            try:
-                submission_processed = yaml.load_all(submission_file, Loader=yaml.CSafeLoader)
-            except:
-                submission_processed = yaml.safe_load_all(submission_file)
+            with open(submission_file_path, 'r') as submission_file:
+                try:
+                    submission_processed = list(yaml.load_all(submission_file, Loader=yaml.CSafeLoader))
+                except AttributeError:
+                    # LibYAML is not available.
+                    submission_processed = list(yaml.safe_load_all(submission_file))
+
+            submission_processed = [yaml_document for yaml_document in submission_processed if yaml_document]
 
             # process file, extracting contents, and linking
             # the data record with the parent publication
             hepsubmission = get_latest_hepsubmission(publication_recid=recid)
+
+            # tables whose data file and submission.yaml block are unchanged
+            # since the last upload are carried over rather than processed again.
+            previous_tables = {}
+            if hepsubmission is not None:
+                previous_tables = dict(
+                    (data_submission.name, data_submission) for data_submission in
+                    DataSubmission.query.filter_by(publication_recid=recid,
+                                                   version=hepsubmission.version))
+
+            table_hashes = {}
+            unchanged_tables = {}
+            for yaml_document in submission_processed:
+                if not is_submission_info_document(yaml_document):
+                    name = encode_string(yaml_document["name"])
+                    table_hashes[name] = get_data_table_hash(basepath, yaml_document)
+                    previous_table = previous_tables.get(name)
+                    if previous_table is not None \
+                            and previous_table.content_hash == table_hashes[name]:
+                        unchanged_tables[name] = previous_table
+
+            # all the changed data files are validated before anything is written to the database.
+            errors = validate_data_files(
+                [os.path.join(basepath, yaml_document["data_file"])
+                 for yaml_document in submission_processed
+                 if not is_submission_info_document(yaml_document)
+                 and encode_string(yaml_document["name"]) not in unchanged_tables])
+
+            if errors:
+                return errors
+
             if hepsubmission is None:
                 HEPSubmission(publication_recid=recid,
                               overall_status='todo',
@@ -426,53 +678,61 @@ def process_submission_directory(basepath, submission_file_path, recid, update=F
 
             reserve_doi_for_hepsubmission(hepsubmission)
 
-            for yaml_document in submission_processed:
-                if 'record_ids' in yaml_document or 'comment' in yaml_document or 'modifications' in yaml_document:
-                    # comments are only present in the general submission
-                    # information document.
-                    process_general_submission_info(basepath, yaml_document, recid)
-                else:
-                    existing_datasubmission_query = DataSubmission.query \
-                        .filter_by(name=encode_string(yaml_document["name"]),
-                                   publication_recid=recid,
-                                   version=hepsubmission.version)
+            # the whole submission is written in a single transaction.
+            license_cache = {}
+            try:
+                for yaml_document in submission_processed:
+                    if is_submission_info_document(yaml_document):
+                        process_general_submission_info(basepath, yaml_document, recid, license_cache)
+                        continue
 
+                    name = encode_string(yaml_document["name"])
                     added_file_names.append(yaml_document["name"])
 
-                    if existing_datasubmission_query.count() == 0:
+                    previous_table = unchanged_tables.get(name)
+                    if previous_table is not None:
+                        if previous_table.version != hepsubmission.version:
+                            db.session.add(copy_data_submission(previous_table, hepsubmission.version))
+                        # a table of the same version is kept as it is, with its DOI.
+                        continue
+
+                    datasubmission = DataSubmission.query \
+                        .filter_by(name=name,
+                                   publication_recid=recid,
+                                   version=hepsubmission.version).first()
+
+                    if datasubmission is None:
                         datasubmission = DataSubmission(
                             publication_recid=recid,
-                            name=encode_string(yaml_document["name"]),
+                            name=name,
                             description=encode_string(
                                 yaml_document["description"]),
                             version=hepsubmission.version)
 
                     else:
-                        datasubmission = existing_datasubmission_query.one()
                         datasubmission.description = encode_string(
                             yaml_document["description"])
 
+                    datasubmission.content_hash = table_hashes[name]
                     db.session.add(datasubmission)
 
                     main_file_path = os.path.join(basepath,
                                                   yaml_document["data_file"])
 
-                    if data_file_validator.validate(file_path=main_file_path):
-                        process_data_file(recid, hepsubmission.version, basepath, yaml_document,
-                                          datasubmission, main_file_path)
-                    else:
-                        errors = process_validation_errors_for_display(
-                            data_file_validator.get_messages())
+                    process_data_file(recid, hepsubmission.version, basepath, yaml_document,
+                                      datasubmission, main_file_path, license_cache)
 
-                        data_file_validator.clear_messages()
+                cleanup_submission(recid, hepsubmission.version,
+                                   added_file_names)
 
-            cleanup_submission(recid, hepsubmission.version,
-                               added_file_names)
-
-            db.session.commit()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
 
             if len(errors) is 0:
-                package_submission(basepath, recid, hepsubmission)
+                package_submission(basepath, recid, hepsubmission,
+                                   original_archive=kwargs.get('original_archive'))
                 reserve_dois_for_data_submissions(recid, hepsubmission.version)
 
                 admin_indexer = AdminIndexer()
@@ -482,7 +742,6 @@ def process_submission_directory(basepath, submission_file_path, recid, update=F
                 submission_file_validator.get_messages())
 
             submission_file_validator.clear_messages()
-            data_file_validator.clear_messages()
     else:
         # return an error
         errors = {"submission.yaml": [
@@ -497,7 +756,7 @@ def process_submission_directory(basepath, submission_file_path, recid, update=F
     return errors
 
 
-def package_submission(basepath, recid, hep_submission_obj):
+def package_submission(basepath, recid, hep_submission_obj, original_archive=None):
     """
     Zips up a submission directory. This is in advance of its download
     for example by users
@@ -505,6 +764,8 @@ def package_submission(basepath, recid, hep_submission_obj):
     :param recid: the publication record ID
     :param hep_submission_obj: the HEPSubmission object representing
            the overall position
+    :param original_archive: path of the uploaded zip archive, which is
+           reused if it holds exactly the files of the directory
     """
     if not os.path.exists(os.path.join(current_app.config['CFG_DATADIR'], str(recid))):
         os.makedirs(os.path.join(current_app.config['CFG_DATADIR'], str(recid)))
@@ -517,13 +778,7 @@ def package_submission(basepath, recid, hep_submission_obj):
         current_app.config['CFG_DATADIR'], str(recid),
         current_app.config['SUBMISSION_FILE_NAME_PATTERN']
             .format(recid, version))
-    if os.path.exists(zip_location):
-        os.remove(zip_location)
-
-    zipf = zipfile.ZipFile(zip_location, 'w')
-    os.chdir(basepath)
-    zipdir(".", zipf)
-    zipf.close()
+    package_directory(basepath, zip_location, original_archive)
 
 
 def process_validation_errors_for_display(errors):
@@ -580,24 +835,21 @@ def create_data_review(data_recid, publication_recid, version=1):
 
 
 def unload_submission(record_id):
-    print('unloading {}...'.format(record_id))
-    remove_submission(record_id)
+    unload_submissions([record_id])
 
-    data_records = get_records_matching_field("related_publication", record_id)
-    for record in data_records["hits"]["hits"]:
-        print("\t Removed data table {0} from index".format(record["_id"]))
-        try:
-            delete_item_from_index(doc_type=CFG_DATA_TYPE, id=record["_id"], parent=record_id)
-        except Exception as e:
-            logging.error("Unable to remove {0} from index. {1}".format(record["_id"], e))
 
-    try:
-        delete_item_from_index(doc_type=CFG_PUB_TYPE, id=record_id)
-        print("Removed publication {0} from index".format(record_id))
-    except NotFoundError as nfe:
-        print(nfe.message)
+def unload_submissions(record_ids):
+    """
+    Removes several records from the database and the index.
+    :param record_ids: publication recids
+    """
+    print('unloading {0} records...'.format(len(record_ids)))
+    remove_submissions(record_ids)
+
+    deleted = delete_records_from_index(record_ids)
+    print('Removed {0} publications and data tables from the index.'.format(deleted))
 
-    print('Finished unloading {0}.'.format(record_id))
+    print('Finished unloading {0}.'.format(', '.join(str(record_id) for record_id in record_ids)))
 
 
 def do_finalise(recid, publication_record=None, force_finalise=False,
@@ -627,7 +879,19 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
         version = hep_submission.version
 
         existing_submissions = {}
+        unchanged_record_ids = set()
         if hep_submission.version > 1 or update:
+            # tables with the same content as in the previous version
+            # keep their index documents, which are not sent again.
+            previous_hashes = {}
+            if not update:
+                previous_hashes = dict(
+                    (data_submission.name, data_submission.content_hash) for data_submission in
+                    DataSubmission.query.filter_by(publication_recid=recid, version=version - 1))
+
+            current_hashes = dict(
+                (submission.name, submission.content_hash) for submission in submissions)
+
             # we need to determine which are the existing record ids.
             existing_data_records = get_records_matching_field(
                 'related_publication', recid, doc_type=CFG_DATA_TYPE)
@@ -635,10 +899,17 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
             for record in existing_data_records["hits"]["hits"]:
 
                 if "recid" in record["_source"]:
-                    existing_submissions[record["_source"]["title"]] = \
-                        record["_source"]["recid"]
-                    delete_item_from_index(record["_id"],
-                                           doc_type=CFG_DATA_TYPE, parent=record["_source"]["related_publication"])
+                    title = record["_source"]["title"]
+                    existing_submissions[title] = record["_source"]["recid"]
+
+                    if title not in current_hashes:
+                        # changed tables are overwritten when they are indexed,
+                        # only the ones which were removed need deleting.
+                        delete_item_from_index(record["_id"],
+                                               doc_type=CFG_DATA_TYPE, parent=record["_source"]["related_publication"])
+                    elif current_hashes[title] is not None \
+                            and previous_hashes.get(title) == current_hashes[title]:
+                        unchanged_record_ids.add(record["_source"]["recid"])
 
         current_time = "{:%Y-%m-%d %H:%M:%S}".format(datetime.now())
 
@@ -688,8 +959,12 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
 
                 generate_doi_for_submission.delay(recid, version)
 
-            # Reindex everything.
-            index_record_ids([recid] + generated_record_ids)
+            # renders of the previous versions list the versions there were.
+            invalidate_record_cache()
+
+            # Reindex the publication and the tables which changed.
+            index_record_ids([recid] + [record_id for record_id in generated_record_ids
+                                        if record_id not in unchanged_record_ids])
             push_data_keywords(pub_ids=[recid])
 
             admin_indexer = AdminIndexer()
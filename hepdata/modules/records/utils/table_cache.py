@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cache of compiled table structures, keyed on the data file they come from."""
+
+from __future__ import absolute_import, print_function
+
+from flask import current_app
+
+from hepdata.modules.records.utils.data_processing_utils import \
+    generate_table_data
+from hepdata.modules.records.utils.parsed_store import get_file_signature, \
+    load_yaml_file
+from hepdata.utils.cache import LRUCache
+
+_table_cache = None
+
+
+def get_table_cache():
+    """
+    Returns the compiled table cache for this process, creating it on first use.
+    :return: LRUCache instance
+    """
+    global _table_cache
+    if _table_cache is None:
+        _table_cache = LRUCache(
+            max_size=current_app.config.get('CFG_TABLE_CACHE_SIZE', 64))
+    return _table_cache
+
+
+def get_table_data(data_submission, file_location):
+    """
+    Returns the qualifiers, headers and values of a table, only loading
+    the data file when no compiled version of it is cached already.
+    The cache key includes the file signature, so a replaced file
+    is never served from a stale entry.
+    :param data_submission: the DataSubmission object for the table
+    :param file_location: path of the data file of the table
+    :return: dictionary as returned by generate_table_data. This is shared
+             between requests so must not be modified by the caller.
+    """
+    cache = get_table_cache()
+    key = (data_submission.id, data_submission.version, file_location) \
+        + get_file_signature(file_location)
+
+    table_data = cache.get(key)
+    if table_data is None:
+        table_data = generate_table_data(load_yaml_file(file_location))
+        cache.set(key, table_data)
+
+    return table_data
+
+
+def invalidate_table_data(data_submission_id):
+    """
+    Removes every compiled version of a table from the cache,
+    e.g. when its data file gets replaced.
+    :param data_submission_id: id of the DataSubmission
+    """
+    get_table_cache().delete_matching(lambda key: key[0] == data_submission_id)
@@ -27,86 +27,165 @@
 import os
 
 from flask import current_app
-from hepdata.modules.records.utils.common import zipdir
 from hepdata.modules.records.utils.data_processing_utils import str_presenter
+from hepdata.modules.records.utils.packaging import write_zip
 import shutil
 import yaml
-import zipfile
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CDumper as Dumper
+except ImportError:
+    from yaml import SafeLoader, Dumper
+
+NUMERIC_FIELDS = ["value", "high", "low"]
+
+
+class SplitDumper(Dumper):
+    """
+    Dumper for split files, presenting multi-line strings as literal blocks.
+    Its representers are registered once, here, rather than on every dump.
+    """
+
+SplitDumper.add_representer(str, str_presenter)
+
+
+def dump_yaml(data, stream):
+    yaml.dump(data, stream, Dumper=SplitDumper, allow_unicode=True)
 
 
 def write_submission_yaml_block(document, submission_yaml,
                                 type="info"):
     submission_yaml.write("---\n")
     cleanup_yaml(document, type)
-    yaml.add_representer(str, str_presenter)
-    try:
-        yaml.dump(document, submission_yaml, allow_unicode=True, dumper=yaml.CDumper)
-    except:
-        yaml.dump(document, submission_yaml, allow_unicode=True)
+    dump_yaml(document, submission_yaml)
     submission_yaml.write("\n")
 
 
+def iter_yaml_documents(file_location):
+    """
+    Parses the documents of a YAML file one at a time, so that only
+    the document being processed is held in memory.
+    :param file_location: input yaml file location
+    """
+    with open(file_location, 'r') as yaml_file:
+        for document in yaml.load_all(yaml_file, Loader=SafeLoader):
+            yield document
+
+
+def write_variables(key, variables, data_file, chunk_size):
+    """
+    Writes a list of variables under key, dumping at most chunk_size of
+    the values of a variable at a time. The dumper keeps track of every
+    object it has written, so dumping a whole table at once takes many
+    times the memory of the table itself.
+    """
+    if not variables:
+        data_file.write("{0}: []\n".format(key))
+        return
+
+    data_file.write("{0}:\n".format(key))
+
+    for variable in variables:
+        values = variable.get("values") or []
+        header = dict((k, v) for k, v in variable.items() if k != "values")
+
+        if header:
+            # a list holding the variable without its values, e.g. "- header: {...}"
+            data_file.write(yaml.dump([header], Dumper=SplitDumper, allow_unicode=True))
+            prefix = "  "
+        else:
+            data_file.write("- ")
+            prefix = ""
+
+        if not values:
+            data_file.write("{0}values: []\n".format(prefix))
+            continue
+
+        data_file.write("{0}values:\n".format(prefix))
+        for start in range(0, len(values), chunk_size):
+            chunk = yaml.dump(values[start:start + chunk_size], Dumper=SplitDumper, allow_unicode=True)
+            data_file.write("".join("  " + line for line in chunk.splitlines(True)))
+
+
+def write_data_file(document, data_file_location, chunk_size=None):
+    """
+    Writes the values of a table to its data file.
+    :param document: the table, as read from the legacy YAML
+    :param data_file_location: path of the data file
+    :param chunk_size: number of values dumped at a time, or None to dump the table at once
+    """
+    data = {"independent_variables": cleanup_data_yaml(document["independent_variables"]),
+            "dependent_variables": cleanup_data_yaml(document["dependent_variables"])}
+
+    with open(data_file_location, 'w') as data_file:
+        if chunk_size:
+            # in the order yaml.dump would write them
+            for key in sorted(data):
+                write_variables(key, data[key], data_file, chunk_size)
+        else:
+            dump_yaml(data, data_file)
+
+
 def split_files(file_location, output_location,
-                archive_location=None):
+                archive_location=None, bounded_memory=None):
     """
     :param file_location: input yaml file location
     :param output_location: output directory path
     :param archive_location: if present will create a zipped
     representation of the split files
+    :param bounded_memory: whether to write tables in chunks of
+    CFG_YAML_SPLIT_CHUNK_SIZE values. By default, files larger than
+    CFG_YAML_SPLIT_BOUNDED_SIZE bytes are.
     """
     try:
-        try:
-            file_documents = yaml.load_all(open(file_location, 'r'), Loader=yaml.CSafeLoader)
-        except:
-            file_documents = yaml.safe_load_all(open(file_location, 'r'))
-
-        # make a submission directory where all the files will be stored.
-        # delete a directory in the event that it exists.
-        if os.path.exists(output_location):
-            shutil.rmtree(output_location)
-
-        os.makedirs(output_location)
-
-        with open(os.path.join(output_location, "submission.yaml"),
-                  'w') as submission_yaml:
-            for document in file_documents:
-                if "record_ids" in document:
-                    write_submission_yaml_block(
-                        document, submission_yaml)
-                else:
-                    file_name = document["name"].replace(' ', '') + ".yaml"
-                    document["data_file"] = file_name
-
-                    with open(os.path.join(output_location, file_name),
-                              'w') as data_file:
-                        yaml.add_representer(str, str_presenter)
-                        yaml.dump(
-                            {"independent_variables":
-                                cleanup_data_yaml(
-                                    document["independent_variables"]),
-                                "dependent_variables":
-                                    cleanup_data_yaml(
-                                        document["dependent_variables"])},
-                            data_file, allow_unicode=True)
-
-                    write_submission_yaml_block(document,
-                                                submission_yaml,
-                                                type="record")
-
-        if archive_location:
-            if os.path.exists(archive_location):
-                os.remove(archive_location)
-
-            zipf = zipfile.ZipFile(archive_location, 'w')
-            os.chdir(output_location)
-            zipdir(".", zipf)
-            zipf.close()
+        write_split_files(file_location, output_location, archive_location, bounded_memory,
+                          bounded_size=current_app.config.get('CFG_YAML_SPLIT_BOUNDED_SIZE', 50 * 1024 ** 2),
+                          chunk_size=current_app.config.get('CFG_YAML_SPLIT_CHUNK_SIZE', 5000))
     except Exception as e:
         current_app.logger.exception(e)
         current_app.logger.error(
             'Error parsing {0}, {1}'.format(file_location, e.message))
 
 
+def write_split_files(file_location, output_location, archive_location=None, bounded_memory=None,
+                      bounded_size=50 * 1024 ** 2, chunk_size=5000):
+    """
+    Does the work of split_files without the application context,
+    so that it can run in other processes. Errors are raised.
+    :param bounded_size: size in bytes above which files are split in bounded memory
+    :param chunk_size: number of values written at a time in bounded memory
+    """
+    if bounded_memory is None:
+        bounded_memory = os.path.getsize(file_location) > bounded_size
+    chunk_size = chunk_size if bounded_memory else None
+
+    # make a submission directory where all the files will be stored.
+    # delete a directory in the event that it exists.
+    if os.path.exists(output_location):
+        shutil.rmtree(output_location)
+
+    os.makedirs(output_location)
+
+    with open(os.path.join(output_location, "submission.yaml"),
+              'w') as submission_yaml:
+        for document in iter_yaml_documents(file_location):
+            if "record_ids" in document:
+                write_submission_yaml_block(
+                    document, submission_yaml)
+            else:
+                file_name = document["name"].replace(' ', '') + ".yaml"
+                document["data_file"] = file_name
+
+                write_data_file(document, os.path.join(output_location, file_name), chunk_size)
+
+                write_submission_yaml_block(document,
+                                            submission_yaml,
+                                            type="record")
+
+    if archive_location:
+        write_zip(output_location, archive_location)
+
+
 def cleanup_data_yaml(yaml):
     """
     Casts strings to numbers where possible, e.g
@@ -121,25 +200,34 @@ def cleanup_data_yaml(yaml):
     return yaml
 
 
-def convert_string_to_numbers(variable_set):
-    fields = ["value", "high", "low"]
+def to_number(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return value
 
+
+def convert_string_to_numbers(variable_set):
+    """
+    Casts the value, high and low of each value to numbers where possible.
+    Each field is converted for all the values of a variable at once, and
+    only converted value by value if some of them are not numbers.
+    """
     if variable_set is not None:
         for variable in variable_set:
             if type(variable) is dict:
                 if variable["values"] is not None:
-                    for value_item in variable["values"]:
+                    for field in NUMERIC_FIELDS:
+                        value_items = [value_item for value_item in variable["values"] if field in value_item]
                         try:
-                            for field in fields:
-                                if field in value_item:
-                                    value_item[field] = float(
-                                        value_item[field])
-                        except ValueError:
-                            pass
+                            numbers = [float(value_item[field]) for value_item in value_items]
+                        except (ValueError, TypeError):
+                            numbers = [to_number(value_item[field]) for value_item in value_items]
+
+                        for value_item, number in zip(value_items, numbers):
+                            value_item[field] = number
                 else:
                     variable["values"] = []
-    else:
-        variable_set = []
 
 
 def cleanup_yaml(yaml, type):
@@ -32,7 +32,6 @@ from dateutil import parser
 from flask.ext.login import login_required
 from flask import Blueprint, send_file, abort
 import jsonpatch
-import yaml
 from invenio_db import db
 
 from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
@@ -47,7 +46,8 @@ from hepdata.modules.submission.models import HEPSubmission, DataSubmission, \
 from hepdata.modules.records.utils.common import get_record_by_id, \
     default_time, IMAGE_TYPES
 from hepdata.modules.records.utils.data_processing_utils import \
-    generate_table_structure
+    process_keywords, select_table_data
+from hepdata.modules.records.utils.table_cache import get_table_data
 from hepdata.modules.records.utils.submission import create_data_review, \
     get_or_create_hepsubmission
 from hepdata.modules.submission.api import get_latest_hepsubmission
@@ -218,12 +218,20 @@ def get_latest():
 @blueprint.route('/data/<int:recid>/<int:data_recid>/<int:version>', methods=['GET', ])
 def get_table_details(recid, data_recid, version):
     """
-
+    Returns a data table in a format ready to be rendered.
+    Large tables can be fetched incrementally with the offset and limit
+    arguments (a window of rows) and the columns argument (a comma separated
+    list of dependent variable indices).
     :param recid:
     :param data_recid:
     :param version:
     :return:
     """
+    try:
+        table_window = get_table_window_arguments(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     datasub_query = DataSubmission.query.filter_by(id=data_recid,
                                                    version=version)
 
@@ -235,19 +243,17 @@ def get_table_details(recid, data_recid, version):
         data_query = db.session.query(DataResource).filter(
             DataResource.id == datasub_record.data_file)
 
+        table_contents["name"] = datasub_record.name
+        table_contents["description"] = datasub_record.description
+        table_contents["keywords"] = process_keywords(datasub_record.keywords)
+        table_contents["doi"] = datasub_record.doi
+
         if data_query.count() > 0:
             data_record = data_query.one()
-            file_location = data_record.file_location
-
-            try:
-                table_contents = yaml.load(file(file_location), Loader=yaml.CSafeLoader)
-            except:
-                table_contents = yaml.load(file(file_location))
-
-            table_contents["name"] = datasub_record.name
-            table_contents["title"] = datasub_record.description
-            table_contents["keywords"] = datasub_record.keywords
-            table_contents["doi"] = datasub_record.doi
+            # the parsed contents of a data file never change for a given
+            # file, so we reuse the compiled version where possible.
+            table_data = get_table_data(datasub_record, data_record.file_location)
+            table_contents.update(select_table_data(table_data, **table_window))
 
         # we create a map of files mainly to accommodate the use of thumbnails for images where possible.
         tmp_assoc_files = {}
@@ -277,11 +283,9 @@ def get_table_details(recid, data_recid, version):
     table_contents["review"]["review_flag"] = data_review_record.status
     table_contents["review"]["messages"] = len(data_review_record.messages) > 0
 
-    # translate the table_contents to an easy to render format of the qualifiers (with colspan),
-    # x and y headers (should not require a colspan)
-    # values, that also encompass the errors
-
-    return jsonify(generate_table_structure(table_contents))
+    # the table data is already translated to an easy to render format of the qualifiers (with colspan),
+    # x and y headers (should not require a colspan) and values, that also encompass the errors.
+    return jsonify(table_contents)
 
 
 @blueprint.route('/coordinator/view/<int:recid>', methods=['GET', ])
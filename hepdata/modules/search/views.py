@@ -24,7 +24,7 @@ import sys
 from flask import Blueprint, request, render_template, jsonify
 from hepdata.config import CFG_DATA_KEYWORDS
 from hepdata.ext.elasticsearch.api import search as es_search, \
-    search_authors as es_search_authors
+    search_authors as es_search_authors, search_facet as es_search_facet
 from hepdata.modules.records.utils.common import decode_string
 from hepdata.utils.session import get_session_item, set_session_item
 from hepdata.utils.url import modify_query
@@ -173,6 +173,27 @@ def search_authors():
     return jsonify({'results': results})
 
 
+@blueprint.route('/facet/<string:facet_name>', methods=['GET'])
+def expand_facet(facet_name):
+    """ Returns every value of a facet for the query and filters of a search,
+    for the facets which were truncated in the search results. The values
+    are filtered as in the search results, see filter_facets. """
+    query_params = parse_query_parameters(request.args)
+
+    try:
+        result = es_search_facet(query_params['q'], facet_name,
+                                 filters=query_params['filters'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    facet = result['facet']
+    if facet is not None:
+        facets = filter_facets([facet], result['total'])
+        facet = facets[0] if facets else None
+
+    return jsonify({'facet': facet})
+
+
 def get_facet(facets, facet_name):
     for facet in facets:
         if facet['printable_name'] is facet_name:
@@ -0,0 +1,145 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Buffer of record access counts waiting to be written to the database."""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+class AccessCountBuffer(object):
+    """
+    Accumulates access counts per record and day, in Redis so that the
+    counts of all the workers are flushed together, or in process memory
+    when Redis is not configured or not reachable.
+    """
+
+    def __init__(self, redis_url=None, namespace='stats', flush_interval=60):
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self._daily = defaultdict(int)
+        self._totals = defaultdict(int)
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._redis = None
+
+        if redis_url:
+            try:
+                from redis import StrictRedis
+                self._redis = StrictRedis.from_url(redis_url)
+            except ImportError:
+                log.warning('redis is not installed, access counts are buffered in each process.')
+
+    def _daily_key(self):
+        return '{0}::pending'.format(self.namespace)
+
+    def _totals_key(self):
+        return '{0}::pending_totals'.format(self.namespace)
+
+    def add(self, recid, day, count=1):
+        """
+        :param recid: id of the record accessed
+        :param day: day of the access, formatted as YYYY-MM-DD
+        :param count: number of accesses
+        """
+        if self._redis is not None:
+            try:
+                pipeline = self._redis.pipeline(transaction=True)
+                pipeline.hincrby(self._daily_key(), '{0}|{1}'.format(recid, day), count)
+                pipeline.hincrby(self._totals_key(), recid, count)
+                pipeline.execute()
+                return
+            except Exception as e:
+                log.error('Unable to buffer access counts in redis: {0}'.format(e))
+
+        with self._lock:
+            self._daily[(int(recid), day)] += count
+            self._totals[int(recid)] += count
+
+    def pending_count(self, recid):
+        """
+        :return: number of accesses to the record which have not been flushed yet
+        """
+        count = self._totals.get(int(recid), 0)
+
+        if self._redis is not None:
+            try:
+                count += int(self._redis.hget(self._totals_key(), recid) or 0)
+            except Exception as e:
+                log.error('Unable to read access counts from redis: {0}'.format(e))
+
+        return count
+
+    def take(self):
+        """
+        Removes and returns all the buffered counts.
+        :return: tuple of a dict of (recid, day) to count,
+                 and a dict of recid to count
+        """
+        daily = defaultdict(int)
+        totals = defaultdict(int)
+
+        if self._redis is not None:
+            try:
+                # MULTI/EXEC, so no increment can happen between the read and delete.
+                pipeline = self._redis.pipeline(transaction=True)
+                pipeline.hgetall(self._daily_key())
+                pipeline.hgetall(self._totals_key())
+                pipeline.delete(self._daily_key(), self._totals_key())
+                redis_daily, redis_totals, _ = pipeline.execute()
+
+                for field, count in redis_daily.items():
+                    recid, day = field.decode('utf-8').split('|')
+                    daily[(int(recid), day)] += int(count)
+                for recid, count in redis_totals.items():
+                    totals[int(recid)] += int(count)
+            except Exception as e:
+                log.error('Unable to read access counts from redis: {0}'.format(e))
+
+        with self._lock:
+            for key, count in self._daily.items():
+                daily[key] += count
+            for recid, count in self._totals.items():
+                totals[recid] += count
+            self._daily.clear()
+            self._totals.clear()
+            self._last_flush = time.time()
+
+        return dict(daily), dict(totals)
+
+    def restore(self, daily, totals):
+        """ Puts back counts returned by take() which could not be written. """
+        with self._lock:
+            for key, count in daily.items():
+                self._daily[key] += count
+            for recid, count in totals.items():
+                self._totals[recid] += count
+
+    def flush_due(self):
+        """
+        :return: True if the buffer has not been flushed for flush_interval seconds
+        """
+        return time.time() - self._last_flush >= self.flush_interval
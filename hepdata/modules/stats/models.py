@@ -29,3 +29,16 @@ class DailyAccessStatistic(db.Model):
     day = db.Column(db.Date, nullable=False)
 
     count = db.Column(db.Integer)
+
+
+class AccessStatisticTotal(db.Model):
+    """
+    Running total of the accesses to a record, kept up to date when the
+    buffered access counts are flushed so that it needs no SUM over days.
+    """
+    __tablename__ = "access_statistic_total"
+
+    publication_recid = db.Column(db.Integer, primary_key=True,
+                                  autoincrement=False)
+
+    count = db.Column(db.Integer, nullable=False, default=0)
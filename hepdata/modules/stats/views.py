@@ -19,14 +19,18 @@
 
 import logging
 from datetime import datetime
+from flask import current_app
 from invenio_db import db
 from sqlalchemy import func
 
-from hepdata.modules.stats.models import DailyAccessStatistic
+from hepdata.modules.stats.buffer import AccessCountBuffer
+from hepdata.modules.stats.models import DailyAccessStatistic, AccessStatisticTotal
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+_access_buffer = None
+
 
 def get_date():
     """
@@ -36,28 +40,96 @@ def get_date():
     return datetime.today()
 
 
+def get_access_buffer():
+    """
+    Returns the buffer of access counts, creating it on first use.
+    :return: AccessCountBuffer instance
+    """
+    global _access_buffer
+    if _access_buffer is None:
+        _access_buffer = AccessCountBuffer(
+            redis_url=current_app.config.get('CACHE_REDIS_URL'),
+            flush_interval=current_app.config.get('STATS_FLUSH_INTERVAL', 60))
+    return _access_buffer
+
+
 def increment(recid):
     """
     Increases the number of accesses to the record
-    by 1
+    by 1. The access is buffered and written to the
+    database with the others by flush_access_counts.
     :param recid: id of the record accessed
     :return:
     """
     if recid:
         dt = get_date()
-        try:
-            available_access_stats = DailyAccessStatistic.query.filter_by(
-                publication_recid=recid, day=dt.strftime('%Y-%m-%d')).first()
+        access_buffer = get_access_buffer()
+        access_buffer.add(recid, dt.strftime('%Y-%m-%d'))
+
+        if access_buffer.flush_due():
+            flush_access_counts()
+
+
+def flush_access_counts():
+    """
+    Writes the buffered access counts to the daily statistics and the
+    record totals, with a few queries for all the records at once.
+    The counts are put back in the buffer if they cannot be written.
+    :return: number of accesses written
+    """
+    access_buffer = get_access_buffer()
+    daily, totals = access_buffer.take()
+    if not totals:
+        return 0
 
-            if available_access_stats:
-                available_access_stats.count += 1
+    try:
+        recids = list(totals.keys())
+
+        access_totals = dict(
+            (total.publication_recid, total) for total in
+            AccessStatisticTotal.query.filter(AccessStatisticTotal.publication_recid.in_(recids)))
+
+        # records counted before the totals existed start from their daily counts.
+        missing_recids = [recid for recid in recids if recid not in access_totals]
+        previous_counts = {}
+        if missing_recids:
+            previous_counts = dict(
+                db.session.query(DailyAccessStatistic.publication_recid,
+                                 func.sum(DailyAccessStatistic.count))
+                .filter(DailyAccessStatistic.publication_recid.in_(missing_recids))
+                .group_by(DailyAccessStatistic.publication_recid).all())
+
+        for recid in missing_recids:
+            access_totals[recid] = AccessStatisticTotal(
+                publication_recid=recid, count=int(previous_counts.get(recid) or 0))
+            db.session.add(access_totals[recid])
+
+        for recid, count in totals.items():
+            access_totals[recid].count += count
+
+        days = set(datetime.strptime(day, '%Y-%m-%d').date() for (_, day) in daily.keys())
+        daily_stats = dict(
+            ((stats.publication_recid, stats.day.strftime('%Y-%m-%d')), stats) for stats in
+            DailyAccessStatistic.query.filter(
+                DailyAccessStatistic.publication_recid.in_(recids),
+                DailyAccessStatistic.day.in_(days)))
+
+        for (recid, day), count in daily.items():
+            if (recid, day) in daily_stats:
+                daily_stats[(recid, day)].count += count
             else:
-                stats = DailyAccessStatistic(
-                    publication_recid=recid, day=dt, count=1)
-                db.session.add(stats)
-            db.session.commit()
-        except:
-            db.session.rollback()
+                db.session.add(DailyAccessStatistic(
+                    publication_recid=recid, day=datetime.strptime(day, '%Y-%m-%d').date(),
+                    count=count))
+
+        db.session.commit()
+    except Exception as e:
+        log.error('Unable to write access counts: {0}'.format(e))
+        db.session.rollback()
+        access_buffer.restore(daily, totals)
+        return 0
+
+    return sum(totals.values())
 
 
 def get_count(recid):
@@ -68,10 +140,20 @@ def get_count(recid):
     """
     if recid:
         try:
-            result = DailyAccessStatistic.query.with_entities(
-                func.sum(DailyAccessStatistic.count).label('sum')).filter(
-                DailyAccessStatistic.publication_recid == recid).one()
-            return {"sum": int(result.sum)}
+            access_total = AccessStatisticTotal.query.get(recid)
+            if access_total is not None:
+                count = access_total.count
+            else:
+                # no access has been flushed since the totals were introduced.
+                result = DailyAccessStatistic.query.with_entities(
+                    func.sum(DailyAccessStatistic.count).label('sum')).filter(
+                    DailyAccessStatistic.publication_recid == recid).one()
+                count = int(result.sum or 0)
+
+            count += get_access_buffer().pending_count(recid)
+
+            # the record is being viewed, so it has been accessed at least once.
+            return {"sum": max(count, 1)}
 
         except Exception as e:
             log.error(e)
@@ -17,6 +17,11 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 #
 
+from flask import g, has_app_context
+from invenio_db import db
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
 from hepdata.modules.submission.models import DataResource
 from hepdata.modules.permissions.models import SubmissionParticipant
 from hepdata.modules.submission.models import HEPSubmission
@@ -40,24 +45,58 @@ def is_resource_added_to_submission(recid, version, resource_url):
 
 def get_latest_hepsubmission(*args, **kwargs):
     """
-    Gets of creates a new HEPSubmission record
-    :param recid: the publication record id
-    :param coordinator: the user id of the user who owns this record
-    :param status: e.g. todo, finished.
-    :return: the newly created HEPSubmission object
+    Gets the latest version of the HEPSubmission matching the given fields.
+    Results are remembered for the rest of the request (or app context),
+    until a HEPSubmission is inserted, updated or deleted.
+    :param publication_recid: the publication record id
+    :param inspire_id: the INSPIRE id of the publication
+    :param overall_status: e.g. todo, finished.
+    :return: the HEPSubmission object with the highest version, or None
     """
+    memo = _get_latest_hepsubmission_memo()
+    key = tuple(sorted(kwargs.items()))
+
+    if memo is not None and key in memo:
+        return memo[key]
+
+    hepsubmission = HEPSubmission.query.filter_by(**kwargs) \
+        .order_by(HEPSubmission.version.desc()).first()
+
+    if memo is not None:
+        memo[key] = hepsubmission
+    return hepsubmission
+
+
+def _get_latest_hepsubmission_memo():
+    """
+    :return: the dict of latest HEPSubmissions looked up in this app context,
+             or None if the memo cannot be used
+    """
+    if not has_app_context():
+        return None
+
+    # changes not yet flushed would be missed, as no query is made on a hit.
+    if any(isinstance(obj, HEPSubmission) for obj in db.session.new) \
+            or any(isinstance(obj, HEPSubmission) for obj in db.session.dirty):
+        clear_latest_hepsubmission_memo()
+        return None
+
+    if not hasattr(g, 'latest_hepsubmissions'):
+        g.latest_hepsubmissions = {}
+    return g.latest_hepsubmissions
+
 
-    hepsubmissions = HEPSubmission.query.filter_by(**kwargs).all()
+def clear_latest_hepsubmission_memo(*args):
+    """ Forgets the HEPSubmissions looked up by get_latest_hepsubmission. """
+    if has_app_context() and hasattr(g, 'latest_hepsubmissions'):
+        del g.latest_hepsubmissions
 
-    last = None
-    for hepsubmission in hepsubmissions:
-        if last is None:
-            last = hepsubmission
-        else:
-            if hepsubmission.version > last.version:
-                last = hepsubmission
 
-    return last
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(HEPSubmission, _event_name, clear_latest_hepsubmission_memo)
+# bulk query.delete() and query.update() do not emit the mapper events.
+for _event_name in ('after_rollback', 'after_bulk_delete', 'after_bulk_update'):
+    event.listen(Session, _event_name, clear_latest_hepsubmission_memo)
 
 
 def get_submission_participants_for_record(publication_recid):
@@ -55,6 +55,11 @@ class HEPSubmission(db.Model):
     reviewers/uploaders are (via participants)
     """
     __tablename__ = "hepsubmission"
+    __table_args__ = (
+        # the latest version of a submission is looked up by either id.
+        db.Index('ix_hepsubmission_publication_recid_version', 'publication_recid', 'version'),
+        db.Index('ix_hepsubmission_inspire_id_version', 'inspire_id', 'version'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
@@ -140,6 +145,10 @@ class DataSubmission(db.Model):
     # through a submissions review stages.
     version = db.Column(db.Integer, default=0)
 
+    # hash of the data file and the submission.yaml block of the table,
+    # so an unchanged table does not need to be processed again.
+    content_hash = db.Column(db.String(64), nullable=True)
+
 
 class Keyword(db.Model):
     __tablename__ = "keyword"
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Caches shared by the HEPData modules."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded dictionary which evicts the least
+    recently used entry once it holds more than max_size entries.
+    """
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+
+            # move the entry to the most recently used end.
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """
+        Removes all entries whose key satisfies the predicate.
+        :param predicate: function taking a key and returning a bool
+        :return: the number of entries removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SharedCache(object):
+    """
+    A cache of JSON serialisable values stored in Redis, so that it is shared
+    by all the workers, with an in-process LRUCache as a fallback when Redis is
+    not configured or not reachable. Entries expire after timeout seconds, and
+    all the entries of the cache can be dropped at once with invalidate().
+    Values are stored serialised, so get() always returns a fresh copy.
+    """
+
+    def __init__(self, namespace, redis_url=None, timeout=300, max_size=256):
+        self.namespace = namespace
+        self.timeout = timeout
+        self._local = LRUCache(max_size=max_size)
+        self._local_generation = 0
+        self._redis = None
+
+        if redis_url:
+            try:
+                from redis import StrictRedis
+                self._redis = StrictRedis.from_url(redis_url)
+            except ImportError:
+                log.warning('redis is not installed, the {0} cache is local to each process.'.format(namespace))
+
+    def make_key(self, *key_parts):
+        """
+        Hashes a JSON serialisable key into a fixed length string.
+        :return: hexadecimal digest
+        """
+        serialised = json.dumps(key_parts, sort_keys=True, default=str)
+        return hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+
+    def _generation_key(self):
+        return '{0}::generation'.format(self.namespace)
+
+    def _entry_key(self, key, generation):
+        return '{0}::{1}::{2}'.format(self.namespace, generation, key)
+
+    def _redis_call(self, function, *args, **kwargs):
+        """ Calls Redis, falling back to the local cache if it fails. """
+        try:
+            return function(*args, **kwargs), True
+        except Exception as e:
+            log.error('Unable to use redis for the {0} cache: {1}'.format(self.namespace, e))
+            return None, False
+
+    def get(self, key):
+        """
+        :param key: key as returned by make_key
+        :return: a copy of the cached value, or None if there is no valid entry
+        """
+        if self._redis is not None:
+            generation, ok = self._redis_call(self._redis.get, self._generation_key())
+            if ok:
+                value, ok = self._redis_call(self._redis.get, self._entry_key(key, generation or 0))
+                if ok:
+                    return json.loads(value) if value is not None else None
+
+        entry = self._local.get(self._entry_key(key, self._local_generation))
+        if entry is None:
+            return None
+
+        expiry, value = entry
+        if expiry < time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        serialised = json.dumps(value)
+
+        if self._redis is not None:
+            generation, ok = self._redis_call(self._redis.get, self._generation_key())
+            if ok:
+                _, ok = self._redis_call(self._redis.setex, self._entry_key(key, generation or 0),
+                                         self.timeout, serialised)
+                if ok:
+                    return
+
+        self._local.set(self._entry_key(key, self._local_generation),
+                        (time.time() + self.timeout, serialised))
+
+    def invalidate(self):
+        """
+        Drops all the entries of the cache. Old Redis entries are no longer
+        reachable once the generation changes and expire on their own.
+        """
+        if self._redis is not None:
+            self._redis_call(self._redis.incr, self._generation_key())
+
+        self._local_generation += 1
+        self._local.clear()
@@ -99,7 +99,7 @@ install_requires = [
     'flask-cors',
     'timestring',
     'cryptography',
-    'beautifulsoup4',
+    'lxml',
     'hepdata_validator==0.1.13',
     'hepdata-converter-ws-client',
     'datacite'
@@ -188,6 +188,7 @@ setup(
             'hepdata_doi = hepdata.modules.records.utils.doi_minter',
             'hepdata_mail = hepdata.utils.mail',
             'hepdata_conversion = hepdata.modules.converter.tasks',
+            'hepdata_stats = hepdata.modules.stats.tasks',
         ],
         'invenio_i18n.translations': [
             'messages = hepdata',
@@ -74,3 +74,14 @@ def test_find_and_delete(admin_idx):
     delete_count, success = admin_idx.find_and_delete(term='ATLAS', fields=['collaboration'])
     assert (success)
     assert (delete_count == 2)
+
+
+def test_shared_client(admin_idx):
+    assert (AdminIndexer().client is admin_idx.client)
+
+
+def test_reindex(admin_idx):
+    indexed = admin_idx.reindex(recreate=True, batch=2)
+    Index(admin_idx.index).refresh()
+
+    assert (indexed == len(admin_idx.search()))
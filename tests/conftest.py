@@ -43,6 +43,35 @@ TEST_EMAIL = 'test@hepdata.net'
 TEST_PWD = 'hello1'
 
 
+class FakeResponse(object):
+    """ Stands in for a requests.Response in tests of HTTP clients. """
+
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """ Stands in for a requests.Session, answering with the given responses in turn. """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
 @pytest.fixture()
 def app(request):
     """Flask app fixture."""
@@ -20,3 +20,30 @@
 # In applying this license, CERN does not
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""HEPData dashboard test cases."""
+
+from invenio_db import db
+
+from hepdata.modules.dashboard.api import load_dashboard_data
+from hepdata.modules.submission.models import DataReview, HEPSubmission
+
+
+def test_load_dashboard_data(app):
+    hepsubmissions = [HEPSubmission(publication_recid=997, coordinator=1, version=version)
+                      for version in (1, 2)]
+    db.session.add_all(hepsubmissions)
+    for status in ('todo', 'todo', 'passed'):
+        db.session.add(DataReview(publication_recid=997, version=2, status=status))
+    db.session.commit()
+
+    data = load_dashboard_data(hepsubmissions, user_id=1)
+
+    assert (data['latest_versions'] == {997: 2})
+    assert (data['coordinators'][1].id == 1)
+    assert (data['review_counts'] == {(997, 2): {'todo': 2, 'passed': 1}})
+
+    # submissions without participants have no roles
+    assert (data['user_roles'] == {})
+    assert (load_dashboard_data([]) == {'records': {}, 'latest_versions': {}, 'coordinators': {},
+                                        'user_roles': {}, 'review_counts': {}})
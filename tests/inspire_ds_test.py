@@ -3,9 +3,12 @@ import json
 
 from flask import url_for
 
-from hepdata.modules.inspire_api.marcxml_parser import expand_date
+from hepdata.modules.inspire_api.client import InspireClient
+from hepdata.modules.inspire_api.marcxml_parser import expand_date, parse_marcxml
 from hepdata.modules.inspire_api.views import get_inspire_record_information
 from hepdata.modules.records.utils.common import decode_string
+from hepdata.utils.cache import SharedCache
+from tests.conftest import FakeResponse, FakeSession
 
 
 def test_endpoint(client, identifiers):
@@ -80,3 +83,76 @@ def test_parser():
         assert (int(content["year"]) == test["year"])
         if 'subject_area' in test:
             assert (content["subject_area"] == test["subject_area"])
+
+
+def test_parse_marcxml():
+    marcxml = b'''<?xml version="1.0" encoding="UTF-8"?>
+<collection xmlns="http://www.loc.gov/MARC21/slim">
+<record>
+  <controlfield tag="001">1245023</controlfield>
+  <datafield tag="024" ind1="7" ind2=" ">
+    <subfield code="2">DOI</subfield>
+    <subfield code="a">10.1103/PhysRevD.88.032013</subfield>
+  </datafield>
+  <datafield tag="037" ind1=" " ind2=" ">
+    <subfield code="9">arXiv</subfield>
+    <subfield code="a">arXiv:1307.7457</subfield>
+  </datafield>
+  <datafield tag="100" ind1=" " ind2=" ">
+    <subfield code="a">Uehara, S.</subfield>
+    <subfield code="u">KEK, Tsukuba</subfield>
+  </datafield>
+  <datafield tag="700" ind1=" " ind2=" ">
+    <subfield code="a">Watanabe, Y.</subfield>
+  </datafield>
+  <datafield tag="245" ind1=" " ind2=" ">
+    <subfield code="a">High-statistics study of $K^0_S$ pair production in two-photon collisions</subfield>
+  </datafield>
+  <datafield tag="269" ind1=" " ind2=" ">
+    <subfield code="c">2013-07</subfield>
+  </datafield>
+  <datafield tag="650" ind1="1" ind2="7">
+    <subfield code="a">Experiment-HEP</subfield>
+  </datafield>
+  <datafield tag="695" ind1=" " ind2=" ">
+    <subfield code="a">observables: cross section</subfield>
+  </datafield>
+  <datafield tag="710" ind1=" " ind2=" ">
+    <subfield code="g">Belle</subfield>
+  </datafield>
+  <datafield tag="980" ind1=" " ind2=" ">
+    <subfield code="a">Published</subfield>
+  </datafield>
+</record>
+</collection>'''
+
+    content = parse_marcxml(marcxml)
+
+    assert (content['doi'] == '10.1103/PhysRevD.88.032013')
+    assert (content['arxiv_id'] == 'arXiv:1307.7457')
+    assert (content['authors'] == [{'full_name': 'Uehara, S.', 'affiliation': 'KEK, Tsukuba'},
+                                   {'full_name': 'Watanabe, Y.', 'affiliation': ''}])
+    assert (content['creation_date'] == '2013-07-01')
+    assert (int(content['year']) == 2013)
+    assert (content['collaborations'] == ['Belle'])
+    assert (content['keywords'] == [{'name': 'observables', 'value': 'cross section', 'synonyms': ''}])
+    assert (content['subject_area'] == ['HEP Experiment'])
+    assert (content['type'] == ['published'])
+    assert (content['journal_info'] == 'No Journal Information')
+
+    # a document which is not MARCXML has no fields
+    assert (parse_marcxml(b'<html><body>Not found')['title'] is None)
+
+
+def test_inspire_client_uses_cache_on_error():
+    marcxml = b'<record><controlfield tag="001">1245023</controlfield></record>'
+    client = InspireClient('http://inspirehep.net/record/{0}/export/xm', SharedCache('inspire_test'), ttl=0)
+    client.session = FakeSession([FakeResponse(200, marcxml, {'ETag': '"a"'}),
+                                  FakeResponse(503, b'<html>Service Unavailable</html>')])
+
+    assert (client.get_marcxml(1245023) == (marcxml, 200))
+    # an error from INSPIRE is not passed on when the record is cached
+    assert (client.get_marcxml(1245023) == (marcxml, 200))
+
+    client.session = FakeSession([FakeResponse(503, b'<html>Service Unavailable</html>')])
+    assert (client.get_marcxml(1) == (b'<html>Service Unavailable</html>', 503))
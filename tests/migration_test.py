@@ -27,12 +27,17 @@ from invenio_records.models import RecordMetadata
 
 import os
 
+import yaml
+
 from hepdata.ext.elasticsearch.api import get_records_matching_field
 from hepdata.modules.records.migrator.api import get_all_ids_in_current_system
+from hepdata.modules.records.migrator.download import DownloadManifest, download
+from hepdata.modules.records.migrator.pipeline import MigrationLedger, split_downloaded_file
 from hepdata.modules.records.utils.common import get_record_contents
 from hepdata.modules.records.utils.yaml_utils import split_files
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.submission.models import DataSubmission
+from tests.conftest import FakeResponse, FakeSession
 
 __author__ = 'eamonnmaguire'
 
@@ -41,11 +46,12 @@ def test_file_download_and_split(app, migrator, identifiers):
     """___test_file_download_and_split___"""
     with app.app_context():
         for test_id in identifiers:
-            temp_file = migrator.download_file(test_id["hepdata_id"])
-            assert temp_file is not None
+            _download = migrator.download_file(test_id["hepdata_id"])
+            assert _download is not None
+            assert _download.changed
 
             split_files(
-                temp_file, os.path.join(app.config['CFG_TMPDIR'], test_id["hepdata_id"]),
+                _download.file_location, os.path.join(app.config['CFG_TMPDIR'], test_id["hepdata_id"]),
                 os.path.join(app.config['CFG_TMPDIR'], test_id[
                     "hepdata_id"] + ".zip"))
 
@@ -114,3 +120,119 @@ def test_get_ids_in_current_system():
     ids = get_all_ids_in_current_system()
 
     assert (ids is not None)
+
+
+def test_migration_ledger(tmpdir):
+    ledger = MigrationLedger(str(tmpdir.join('ledger.json')))
+
+    assert (ledger.get_pending(['ins1', 'ins2']) == ['ins1', 'ins2'])
+
+    ledger.mark('ins1', 'done')
+    ledger.mark('ins2', 'failed', 'download', 'Unable to download ins2')
+    ledger.mark('ins3', 'failed', 'split', 'No files were split for ins3')
+    ledger.mark('ins3', 'done')
+
+    # an entry cut short by an interruption is ignored.
+    with open(ledger.file_location, 'a') as ledger_file:
+        ledger_file.write('{"inspire_id": "ins4", "sta')
+
+    entries = ledger.load()
+    assert (entries['ins2']['stage'] == 'download')
+    assert (entries['ins3']['status'] == 'done')
+    assert ('ins4' not in entries)
+
+    assert (ledger.get_pending(['ins1', 'ins2', 'ins3', 'ins4']) == ['ins2', 'ins4'])
+    assert (ledger.get_pending(['ins1', 'ins2', 'ins3', 'ins4'], retry_failed=False) == ['ins4'])
+
+    # entries marked after an interruption are not merged into the line it cut short.
+    ledger.mark('ins4', 'done')
+    entries = ledger.load()
+    assert (entries['ins4']['status'] == 'done')
+    assert (ledger.get_pending(['ins1', 'ins2', 'ins3', 'ins4']) == ['ins2'])
+
+
+def test_conditional_download(tmpdir):
+    directory = str(tmpdir)
+    manifest = DownloadManifest(os.path.join(directory, 'manifest.json'))
+    url = 'http://hepdata.cedar.ac.uk/view/ins1/yaml'
+    session = FakeSession([
+        FakeResponse(200, b'---\nname: Table 1\n', {'ETag': '"a"'}),
+        FakeResponse(304),
+        FakeResponse(200, b'---\nname: Table 1\n', {'ETag': '"b"'}),
+        FakeResponse(503),
+        FakeResponse(200, b'---\nname: Table 2\n', {'ETag': '"c"'})
+    ])
+
+    first = download(session, url, directory, manifest=manifest)
+    assert (first.changed)
+    with open(first.file_location, 'rb') as downloaded_file:
+        assert (downloaded_file.read() == b'---\nname: Table 1\n')
+    manifest.update(first)
+
+    not_modified = download(session, url, directory, manifest=manifest)
+    assert (session.requests[1]['If-None-Match'] == '"a"')
+    assert (not not_modified.changed and not_modified.file_location is None)
+
+    same_content = download(session, url, directory, manifest=manifest)
+    assert (not same_content.changed)
+
+    changed = download(session, url, directory, manifest=manifest, backoff=0)
+    assert (changed.changed and changed.etag == '"c"')
+
+
+def test_split_files_bounded_memory(app, tmpdir):
+    documents = [{'record_ids': [{'type': 'inspire', 'id': 1}], 'comment': 'A legacy record'}]
+    for table in range(2):
+        documents.append({
+            'name': 'Table {0}'.format(table),
+            'label': 'Data from T{0}'.format(table),
+            'independent_variables': [{'header': {'name': 'x'},
+                                       'values': [{'low': str(i), 'high': str(i + 1)} for i in range(10)]}],
+            'dependent_variables': [{'header': {'name': 'y'},
+                                     'values': [{'value': str(i) if i != 3 else '-'} for i in range(10)]},
+                                    {'header': {'name': 'z'}, 'values': None}]})
+
+    directory = str(tmpdir)
+    file_location = os.path.join(directory, 'legacy.yaml')
+    with open(file_location, 'w') as legacy_file:
+        yaml.safe_dump_all(documents, legacy_file)
+
+    with app.app_context():
+        app.config['CFG_YAML_SPLIT_CHUNK_SIZE'] = 3
+        split_files(file_location, os.path.join(directory, 'whole'), bounded_memory=False)
+        split_files(file_location, os.path.join(directory, 'chunked'), bounded_memory=True)
+
+    for file_name in ['submission.yaml', 'Table0.yaml', 'Table1.yaml']:
+        with open(os.path.join(directory, 'whole', file_name)) as whole_file, \
+                open(os.path.join(directory, 'chunked', file_name)) as chunked_file:
+            assert (list(yaml.safe_load_all(whole_file)) == list(yaml.safe_load_all(chunked_file)))
+
+    with open(os.path.join(directory, 'chunked', 'Table1.yaml')) as data_file:
+        data = yaml.safe_load(data_file)
+    assert (data['dependent_variables'][0]['values'][2]['value'] == 2.0)
+    assert (data['dependent_variables'][0]['values'][3]['value'] == '-')
+    assert (data['dependent_variables'][1]['values'] == [])
+    assert (data['independent_variables'][0]['values'][9] == {'low': 9.0, 'high': 10.0})
+
+
+def test_split_downloaded_file(tmpdir):
+    directory = str(tmpdir)
+    file_location = os.path.join(directory, 'download')
+    with open(file_location, 'w') as downloaded_file:
+        yaml.safe_dump_all([{'record_ids': [{'type': 'inspire', 'id': 1}], 'comment': 'A legacy record'},
+                            {'name': 'Table 1', 'independent_variables': [], 'dependent_variables': []}],
+                           downloaded_file)
+
+    output_location = os.path.join(directory, 'ins1')
+    inspire_id, location, error, _ = split_downloaded_file(
+        ('ins1', file_location, output_location, 50 * 1024 ** 2, 5000))
+    assert ((inspire_id, location, error) == ('ins1', output_location, None))
+    assert (os.path.exists(os.path.join(output_location, 'Table1.yaml')))
+    assert (not os.path.exists(file_location))
+
+    # failures are returned rather than raised, as this runs in another process
+    with open(file_location, 'w') as downloaded_file:
+        downloaded_file.write('name: [\n')
+    inspire_id, location, error, _ = split_downloaded_file(
+        ('ins2', file_location, os.path.join(directory, 'ins2'), 50 * 1024 ** 2, 5000))
+    assert (location is None and error)
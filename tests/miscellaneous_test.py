@@ -24,6 +24,8 @@
 """HEPData utils test cases."""
 import os
 
+from hepdata.modules.converter.cache import ConversionCache, get_content_hash
+from hepdata.utils.cache import LRUCache, SharedCache
 from hepdata.utils.file_extractor import extract, get_file_in_directory
 from hepdata.utils.miscellanous import splitter
 
@@ -62,3 +64,64 @@ def test_file_extractor(app):
             file = get_file_in_directory(extract_dir, 'yaml')
             assert (file is not None)
 
+
+def test_lru_cache():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    # reading 'a' makes 'b' the least recently used entry
+    assert (cache.get('a') == 1)
+    cache.set('c', 3)
+
+    assert ('b' not in cache)
+    assert (cache.get('a') == 1)
+    assert (cache.get('c') == 3)
+    assert (len(cache) == 2)
+
+    assert (cache.delete_matching(lambda key: key in ('a', 'c')) == 2)
+    assert (len(cache) == 0)
+
+
+def test_shared_cache_without_redis():
+    cache = SharedCache('test', timeout=60)
+    key = cache.make_key('higgs', [('collaboration', 'ATLAS')], 10)
+    assert (key == cache.make_key('higgs', [('collaboration', 'ATLAS')], 10))
+    assert (cache.get(key) is None)
+
+    cache.set(key, {'total': 1, 'results': []})
+    result = cache.get(key)
+    assert (result == {'total': 1, 'results': []})
+
+    # each get returns a copy, so callers can modify the results
+    result['total'] = 2
+    assert (cache.get(key)['total'] == 1)
+
+    cache.invalidate()
+    assert (cache.get(key) is None)
+
+
+def test_conversion_cache(tmpdir):
+    source = tmpdir.join('submission.yaml')
+    source.write('name: Table 1')
+    cache = ConversionCache(str(tmpdir.join('converted')), max_size=10)
+
+    key = cache.make_key(get_content_hash(str(source)), 'csv', {'table': 'Table 1'})
+    assert (cache.get(key, 'csv') is None)
+
+    converted = tmpdir.join('Table1.csv')
+    converted.write('x,y')
+    path = cache.store(key, 'csv', str(converted))
+    assert (cache.get(key, 'csv') == path)
+    assert (cache.get_stats() == {'hits': 1, 'misses': 1})
+
+    # changing the source content changes the key
+    source.write('name: Table 2')
+    assert (cache.make_key(get_content_hash(str(source)), 'csv', {'table': 'Table 1'}) != key)
+
+    # storing beyond max_size evicts the least recently used file
+    other = tmpdir.join('Table2.csv')
+    other.write('x,y,z,w,v')
+    other_path = cache.store('other', 'csv', str(other))
+    assert (not os.path.exists(path))
+    assert (os.path.exists(other_path))
@@ -23,14 +23,23 @@
 
 """HEPData records test cases."""
 import os
+import zipfile
 
 import yaml
 from invenio_accounts.models import User
 
 from hepdata.modules.records.utils.common import get_record_by_id, record_exists
-from hepdata.modules.records.utils.data_processing_utils import generate_table_structure
+from hepdata.modules.records.utils.data_processing_utils import generate_table_structure, \
+    relabel_duplicate_errors, generate_table_data, select_table_data
+from hepdata.modules.records.utils.packaging import archive_matches_directory, package_directory, \
+    write_zip
+from hepdata.modules.records.utils.parsed_store import load_yaml_file, read_parsed_file, remove_parsed_files, \
+    get_parsed_location
+from hepdata.modules.records.utils.record_cache import ACCESS_COUNT_PLACEHOLDER, fill_access_count
+from hepdata.modules.records.utils.table_cache import get_table_data, invalidate_table_data
 from hepdata.modules.records.utils.users import get_coordinators_in_system, has_role
 from hepdata.modules.records.utils.workflow import update_record, create_record
+from hepdata.modules.submission.models import DataSubmission
 from tests.conftest import TEST_EMAIL
 
 
@@ -106,3 +115,103 @@ def test_data_processing(app):
     assert(table_structure["x_count"] == 1)
     assert(len(table_structure["headers"]) == 2)
     assert(len(table_structure["qualifiers"]) == 2)
+
+
+def test_select_table_data(app):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    data = yaml.safe_load(file(os.path.join(base_dir, 'test_data/data_table.yaml')))
+
+    with app.app_context():
+        table_data = generate_table_data(data)
+
+    window = select_table_data(table_data, offset=1, limit=1)
+    assert (window["row_count"] == 3)
+    assert (len(window["values"]) == 1)
+    assert (window["values"][0]["y"][0]["value"] == 569000)
+    assert (len(window["qualifiers"]) == 2)
+
+    projection = select_table_data(table_data, columns=[])
+    assert (len(projection["values"]) == 3)
+    assert (projection["values"][0]["y"] == [])
+    assert (len(projection["headers"]) == 1)
+    assert (len(projection["qualifiers"]) == 0)
+
+
+def test_relabel_duplicate_errors():
+    errors = [{'symerror': 1, 'label': 'stat'}, {'symerror': 2, 'label': 'sys'},
+              {'symerror': 3, 'label': 'sys'}, {'symerror': 4, 'label': 'lumi'}]
+    relabel_duplicate_errors(errors)
+
+    assert ([error['label'] for error in errors] == ['stat', 'sys_1', 'sys_2', 'lumi'])
+
+
+def test_table_cache(app):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    data_file = os.path.join(base_dir, 'test_data/data_table.yaml')
+
+    with app.app_context():
+        data_submission = DataSubmission(id=1, version=1)
+
+        table_data = get_table_data(data_submission, data_file)
+        assert (table_data["x_count"] == 1)
+        assert (len(table_data["values"]) == 3)
+
+        # the second request is served from the cache
+        assert (get_table_data(data_submission, data_file) is table_data)
+
+        invalidate_table_data(data_submission.id)
+        assert (get_table_data(data_submission, data_file) is not table_data)
+
+
+def test_parsed_store(app, tmpdir):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    data_file = tmpdir.join('data_table.yaml')
+    with open(os.path.join(base_dir, 'test_data/data_table.yaml'), 'r') as f:
+        data_file.write(f.read())
+
+    parsed_dir = str(tmpdir.join('parsed'))
+    assert (read_parsed_file(str(data_file), parsed_dir) is None)
+
+    table_contents = load_yaml_file(str(data_file), parsed_dir)
+    assert (read_parsed_file(str(data_file), parsed_dir) == table_contents)
+
+    # a rewritten file is parsed again
+    data_file.write('independent_variables: []\ndependent_variables: []\n')
+    assert (read_parsed_file(str(data_file), parsed_dir) is None)
+    assert (load_yaml_file(str(data_file), parsed_dir) ==
+            {'independent_variables': [], 'dependent_variables': []})
+
+    remove_parsed_files([str(data_file)], parsed_dir)
+    assert (not os.path.exists(get_parsed_location(str(data_file), parsed_dir)))
+
+
+def test_package_directory(tmpdir):
+    submission_dir = tmpdir.mkdir('submission')
+    submission_dir.join('submission.yaml').write('comment: A submission\n')
+    submission_dir.mkdir('resources').join('script.py').write('print(1)\n')
+    submission_dir = str(submission_dir)
+
+    archive_location = str(tmpdir.join('original.zip'))
+    write_zip(submission_dir, archive_location)
+
+    with zipfile.ZipFile(archive_location) as archive:
+        assert (sorted(archive.namelist()) == ['resources/script.py', 'submission.yaml'])
+
+    # an archive with the same contents is reused
+    package_location = str(tmpdir.join('package.zip'))
+    assert (package_directory(submission_dir, package_location, archive_location))
+    assert (archive_matches_directory(package_location, submission_dir))
+
+    # otherwise the directory is zipped up again
+    tmpdir.join('submission', 'submission.yaml').write('comment: A revised submission\n')
+    assert (not archive_matches_directory(archive_location, submission_dir))
+    assert (not package_directory(submission_dir, package_location, archive_location))
+    assert (archive_matches_directory(package_location, submission_dir))
+
+
+def test_fill_access_count():
+    html = '<span>Accessed {0} times</span>'.format(ACCESS_COUNT_PLACEHOLDER)
+    assert (fill_access_count(html, 12, 'html') == '<span>Accessed 12 times</span>')
+
+    json_text = '{{"access_count": {{"sum": "{0}"}}}}'.format(ACCESS_COUNT_PLACEHOLDER)
+    assert (fill_access_count(json_text, 12, 'json') == '{"access_count": {"sum": 12}}')
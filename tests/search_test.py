@@ -15,12 +15,18 @@
 # You should have received a copy of the GNU General Public License
 # along with HEPData; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
-from hepdata.ext.elasticsearch.config.es_config import default_sort_order_for_field
-from hepdata.ext.elasticsearch.process_results import merge_results, match_tables_to_papers, \
+import json
+
+from hepdata.ext.elasticsearch.aggregations import parse_aggregations
+from hepdata.ext.elasticsearch.config.es_config import default_sort_order_for_field, default_aggregations, \
+    facet_aggregation
+from hepdata.ext.elasticsearch.process_results import merge_results, get_inner_hits, match_tables_to_papers, \
     get_basic_record_information, is_datatable
 from hepdata.ext.elasticsearch.query_builder import HEPDataQueryParser
+from hepdata.ext.elasticsearch.reindex import get_reindex_batches, ReindexCheckpoint
 from hepdata.ext.elasticsearch.utils import flip_sort_order, parse_and_format_date, prepare_author_for_indexing, \
-    calculate_sort_order, push_keywords
+    calculate_sort_order, push_keywords, collect_data_keywords
+from hepdata.modules.search import views as search_views
 
 
 def test_query_parser():
@@ -56,6 +62,22 @@ def test_merge_results():
     assert (merged["total"] == 1)
 
 
+def test_get_inner_hits():
+    table = {"_id": "2", "_source": {"related_publication": 1, "title": "Table1"}}
+    pub_result = {"hits": {"hits": [
+        {"_id": "1", "_source": {}, "inner_hits": {"datatable": {"hits": {"hits": [table], "total": 1}}}},
+        {"_id": "3", "_source": {}}
+    ], "total": 2}}
+
+    data_result = get_inner_hits(pub_result, "datatable")
+    assert (data_result["hits"]["hits"] == [table])
+    assert (is_datatable(data_result["hits"]["hits"][0]))
+
+    merged = merge_results(pub_result, data_result)
+    assert (len(merged["hits"]) == 3)
+    assert (merged["total"] == 2)
+
+
 def test_flip_sort_order():
     order = "desc"
     order = flip_sort_order(order=order)
@@ -115,6 +137,22 @@ def test_push_keywords():
         assert (ve)
 
 
+def test_collect_data_keywords():
+    tables = [
+        {'related_publication': 1, 'keywords': [{'name': 'observables', 'value': 'SIG'},
+                                                {'name': 'reactions', 'value': 'P P --> X'}]},
+        {'related_publication': '1', 'keywords': [{'name': 'observables', 'value': 'SIG'},
+                                                  {'name': 'observables', 'value': 'ASYM'}]},
+        {'related_publication': 2, 'keywords': []},
+    ]
+
+    data_keywords = collect_data_keywords(tables)
+    assert (sorted(data_keywords.keys()) == [1, 2])
+    assert (sorted(data_keywords[1]['observables']) == ['ASYM', 'SIG'])
+    assert (data_keywords[1]['reactions'] == ['P P --> X'])
+    assert (data_keywords[2] == {})
+
+
 def test_prepare_authors_for_indexing(app):
     with app.app_context():
         test_document = {
@@ -175,3 +213,67 @@ def test_get_basic_record_information():
 def test_is_datatable():
     assert (is_datatable({"_type": "datatable"}))
     assert (not is_datatable({"_type": "publication"}))
+
+
+def test_bounded_aggregations():
+    aggregations = default_aggregations(facet_size=20)
+    assert (aggregations["collaboration"]["terms"]["size"] == 20)
+    assert (aggregations["observables"]["terms"]["size"] == 20)
+
+    full_aggregation = facet_aggregation("observables")
+    assert (full_aggregation.keys() == ["observables"])
+    assert (full_aggregation["observables"]["terms"]["size"] == 0)
+
+    try:
+        facet_aggregation("date")
+        assert False
+    except ValueError as ve:
+        assert (ve)
+
+    facets = parse_aggregations({
+        "observables": {"buckets": [{"key": "SIG", "doc_count": 3}], "sum_other_doc_count": 5},
+        "reactions": {"buckets": [{"key": "P P --> X", "doc_count": 3}], "sum_other_doc_count": 0}
+    })
+    has_more = dict((facet["type"], facet["has_more"]) for facet in facets)
+    assert (has_more == {"observables": True, "reactions": False})
+
+
+def test_expand_facet_filters_keywords(app, monkeypatch):
+    facet = {'type': 'observables', 'printable_name': 'Observables', 'has_more': False,
+             'vals': [{'key': 'SIG', 'doc_count': 12}, {'key': 'ASYM', 'doc_count': 3}]}
+    monkeypatch.setattr(search_views, 'es_search_facet',
+                        lambda *args, **kwargs: {'facet': dict(facet), 'total': 60})
+
+    # values hidden from the search results are not shown once the facet is expanded
+    with app.test_request_context('/search/facet/observables'):
+        expanded = json.loads(search_views.expand_facet('observables').data)
+    assert ([val['key'] for val in expanded['facet']['vals']] == ['SIG'])
+
+    monkeypatch.setattr(search_views, 'es_search_facet',
+                        lambda *args, **kwargs: {'facet': dict(facet), 'total': 20})
+    with app.test_request_context('/search/facet/observables'):
+        expanded = json.loads(search_views.expand_facet('observables').data)
+    assert ([val['key'] for val in expanded['facet']['vals']] == ['SIG', 'ASYM'])
+
+
+def test_get_reindex_batches():
+    assert (get_reindex_batches(1, 5, 2) == [[1, 2], [3, 4], [5]])
+    assert (get_reindex_batches(3, 4, 10) == [[3, 4]])
+    assert (get_reindex_batches(5, 4, 10) == [])
+
+
+def test_reindex_checkpoint(tmpdir):
+    checkpoint_file = str(tmpdir.join('checkpoint.json'))
+    checkpoint = ReindexCheckpoint(checkpoint_file, 'hepdata-test')
+    assert (checkpoint.load() is None)
+
+    checkpoint.save(100, [1, 51])
+    saved = checkpoint.load()
+    assert (saved['last_recid'] == 100)
+    assert (saved['publications'] == [1, 51])
+
+    # progress of a different index is not resumed
+    assert (ReindexCheckpoint(checkpoint_file, 'other').load() is None)
+
+    checkpoint.clear()
+    assert (checkpoint.load() is None)
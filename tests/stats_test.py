@@ -1,4 +1,6 @@
-from hepdata.modules.stats.views import increment, get_count
+from hepdata.modules.stats.models import AccessStatisticTotal, DailyAccessStatistic
+from hepdata.modules.stats.views import increment, get_count, flush_access_counts, \
+    get_access_buffer
 
 
 def test_stats(app):
@@ -10,3 +12,24 @@ def test_stats(app):
 
     # in case of failure, this always returns 1
     assert (get_count(1999)['sum'] == 1)
+
+
+def test_flush_access_counts(app):
+    flush_access_counts()
+
+    increment(2)
+    increment(2)
+    increment(3)
+    assert (get_access_buffer().pending_count(2) == 2)
+
+    assert (flush_access_counts() == 3)
+    assert (get_access_buffer().pending_count(2) == 0)
+    assert (AccessStatisticTotal.query.get(2).count == 2)
+    assert (DailyAccessStatistic.query.filter_by(publication_recid=3).one().count == 1)
+
+    increment(2)
+    assert (get_count(2)['sum'] == 3)
+    flush_access_counts()
+    assert (AccessStatisticTotal.query.get(2).count == 3)
+    assert (DailyAccessStatistic.query.filter_by(publication_recid=2).one().count == 3)
+    assert (get_count(2)['sum'] == 3)
@@ -23,15 +23,21 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 import os
+import threading
 from time import sleep
 
+from invenio_db import db
+
 from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
 from hepdata.ext.elasticsearch.api import get_records_matching_field
-from hepdata.modules.records.api import format_submission
+from hepdata.modules.records.api import format_submission, load_data_tables
 from hepdata.modules.records.utils.common import infer_file_type, contains_accepted_url, allowed_file, record_exists, \
     get_record_contents
-from hepdata.modules.records.utils.submission import process_submission_directory, do_finalise, unload_submission
-from hepdata.modules.submission.models import DataSubmission
+from hepdata.modules.records.utils.parsed_store import parse_yaml_file, read_parsed_file
+from hepdata.modules.records.utils.submission import process_submission_directory, do_finalise, unload_submission, \
+    validate_data_files, get_license, get_data_table_hash, can_use_validation_pool
+from hepdata.modules.submission.api import get_latest_hepsubmission
+from hepdata.modules.submission.models import DataReview, DataSubmission, HEPSubmission, License
 from hepdata.modules.submission.views import process_submission_payload
 
 
@@ -155,8 +161,125 @@ def test_create_submission(app, admin_idx):
             publication_recid=hepdata_submission.publication_recid).count()
 
         assert (data_submissions == 0)
+        assert (DataReview.query.filter_by(publication_recid=hepdata_submission.publication_recid).count() == 0)
+        assert (HEPSubmission.query.filter_by(publication_recid=hepdata_submission.publication_recid).count() == 0)
 
         sleep(2)
 
+        index_records = get_records_matching_field('related_publication', hepdata_submission.publication_recid)
+        assert (len(index_records['hits']['hits']) == 0)
+
         admin_idx_results = admin_idx.search(term=hepdata_submission.publication_recid, fields=['recid'])
         assert (len(admin_idx_results) == 0)
+
+
+def test_validate_data_files(app, tmpdir):
+    base_dir = os.path.dirname(os.path.realpath(__file__))
+    directory = os.path.join(base_dir, 'test_data/test_submission')
+
+    valid_files = [os.path.join(directory, 'Table{0}.yaml'.format(i)) for i in range(1, 4)]
+    assert (validate_data_files(valid_files) == {})
+
+    # the parsed contents of valid files are stored
+    for valid_file in valid_files:
+        assert (read_parsed_file(valid_file) == parse_yaml_file(valid_file))
+
+    invalid_file_1 = tmpdir.join('Invalid1.yaml')
+    invalid_file_1.write('independent_variables: []\n')
+    invalid_file_2 = tmpdir.join('Invalid2.yaml')
+    invalid_file_2.write('dependent_variables: []\n')
+
+    # errors are collected for every invalid file
+    errors = validate_data_files(valid_files + [str(invalid_file_1), str(invalid_file_2)])
+    assert (sorted(errors.keys()) == ['Invalid1.yaml', 'Invalid2.yaml'])
+
+    # a file which cannot be parsed is reported rather than raising
+    unparseable_file = tmpdir.join('Unparseable.yaml')
+    unparseable_file.write('independent_variables: [\n')
+    errors = validate_data_files([str(unparseable_file)])
+    assert (errors['Unparseable.yaml'][0]['message'].startswith(b'There was a problem parsing the file.'))
+
+
+def test_can_use_validation_pool():
+    assert (can_use_validation_pool())
+
+    # workers are not forked from other threads
+    results = []
+    thread = threading.Thread(target=lambda: results.append(can_use_validation_pool()))
+    thread.start()
+    thread.join()
+    assert (results == [False])
+
+
+def test_get_license(app):
+    license_cache = {}
+    license_data = {'name': 'GPL2', 'url': 'https://www.gnu.org/licenses/gpl-2.0.html'}
+
+    license = get_license(license_data, license_cache)
+    assert (license.id is not None)
+
+    # the second lookup is served from the cache
+    assert (get_license(license_data, license_cache) is license)
+    assert (get_license(license_data) is license)
+    assert (License.query.filter_by(name='GPL2').count() == 1)
+
+
+def test_get_data_table_hash(tmpdir):
+    tmpdir.join('Table1.yaml').write('independent_variables: []\n')
+    yaml_document = {'name': 'Table 1', 'description': 'A table', 'data_file': 'Table1.yaml',
+                     'additional_resources': [{'location': 'script.py', 'description': 'A script'}]}
+    basepath = str(tmpdir)
+
+    table_hash = get_data_table_hash(basepath, yaml_document)
+    assert (get_data_table_hash(basepath, dict(yaml_document)) == table_hash)
+
+    # the submission.yaml block is part of the hash
+    changed_document = dict(yaml_document, description='Another table')
+    assert (get_data_table_hash(basepath, changed_document) != table_hash)
+
+    # and so are the data file and local resource files
+    tmpdir.join('script.py').write('print(1)\n')
+    resource_hash = get_data_table_hash(basepath, yaml_document)
+    assert (resource_hash != table_hash)
+
+    tmpdir.join('Table1.yaml').write('independent_variables: []\ndependent_variables: []\n')
+    assert (get_data_table_hash(basepath, yaml_document) != resource_hash)
+
+
+def test_get_latest_hepsubmission(app):
+    for version in (1, 2):
+        db.session.add(HEPSubmission(publication_recid=999, inspire_id='999', version=version))
+    db.session.commit()
+
+    latest = get_latest_hepsubmission(publication_recid=999)
+    assert (latest.version == 2)
+    assert (get_latest_hepsubmission(inspire_id='999').version == 2)
+
+    # repeated lookups are remembered
+    assert (get_latest_hepsubmission(publication_recid=999) is latest)
+
+    # and forgotten when a new version is added
+    db.session.add(HEPSubmission(publication_recid=999, inspire_id='999', version=3))
+    assert (get_latest_hepsubmission(publication_recid=999).version == 3)
+    db.session.rollback()
+
+    assert (get_latest_hepsubmission(publication_recid=999).version == 2)
+    assert (get_latest_hepsubmission(publication_recid=12345) is None)
+
+
+def test_load_data_tables(app):
+    for name in ('Table 1', 'Table 2'):
+        db.session.add(DataSubmission(publication_recid=998, name=name, version=1))
+    db.session.commit()
+
+    data_tables, reviews = load_data_tables(998, 1)
+    assert ([data_table.name for data_table in data_tables] == ['Table 1', 'Table 2'])
+
+    # the missing reviews are created
+    assert (sorted(reviews.keys()) == sorted(data_table.id for data_table in data_tables))
+    assert (all(review == ('todo', 0) for review in reviews.values()))
+    assert (DataReview.query.filter_by(publication_recid=998, version=1).count() == 2)
+
+    # but only once
+    assert (load_data_tables(998, 1)[1] == reviews)
+    assert (DataReview.query.filter_by(publication_recid=998, version=1).count() == 2)